@@ -0,0 +1,224 @@
+import bisect
+import json
+import sqlite3
+
+from analyze_data import ASPECT_LABELS, LOCATION_LABELS, VIRAL_TOP_K, aspect_code, location_code, parse_hour
+from author_index import STATUS_URL_RE
+
+STATE_FILE = 'analysis_state.sqlite'
+VIRAL_BUFFER = 4 * VIRAL_TOP_K # 上位から外れる更新があっても作り直さずに済むよう多めに持つ
+
+def _empty_groups(n):
+    return [[0, 0, 0] for _ in range(n)] # [sum, count, sumsq]
+
+def viral_score(likes, followers):
+    return round((likes / followers) * 100, 2) if followers > 0 else 0
+
+class AnalysisState:
+    """
+    analysis.json を差分で更新するための、足し引きできる部分集計。
+
+    時間帯・構図・ロケーション・キャラごとに sum / count / sumsq を持ち、
+    レコードごとの寄与（前回どこに何を足したか）を contrib テーブルに残す。
+    レコードが変わったら古い寄与を引いて新しい寄与を足すだけなので、更新は変更件数に比例する。
+    viral_ranking は (-score, seq) 順の上位 VIRAL_BUFFER 件だけを持つ。
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS contrib (
+                url TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                likes INTEGER NOT NULL,
+                followers INTEGER NOT NULL,
+                own_followers INTEGER NOT NULL,
+                member TEXT,
+                hour INTEGER NOT NULL,
+                aspect INTEGER NOT NULL,
+                loc INTEGER NOT NULL,
+                char_name TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_contrib_member ON contrib (member);
+            CREATE INDEX IF NOT EXISTS idx_contrib_char ON contrib (char_name);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'state'").fetchone()
+        self._reset_aggregates()
+        if row:
+            self.__dict__.update(json.loads(row[0]))
+
+    def _reset_aggregates(self):
+        self.generation = -1
+        self.synced_at = 0.0
+        self.authors = {}
+        self.totals = [0, 0, 0]
+        self.hours = _empty_groups(24)
+        self.aspects = _empty_groups(len(ASPECT_LABELS))
+        self.locations = _empty_groups(len(LOCATION_LABELS))
+        self.chars = {} # name -> [sum, count, sumsq, first_seq]
+        self.viral = [] # [[-score, seq, url, score], ...] 昇順
+        self.viral_complete = True # viral に全レコードが入っているか
+
+    def save(self):
+        state = {k: getattr(self, k) for k in (
+            'generation', 'synced_at', 'authors', 'totals', 'hours', 'aspects',
+            'locations', 'chars', 'viral', 'viral_complete'
+        )}
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('state', ?)", (json.dumps(state, ensure_ascii=False),))
+
+    def close(self):
+        self.conn.close()
+
+    # --- 1レコード分の寄与 ---
+
+    @staticmethod
+    def contribution(url, seq, item, authors):
+        """集計に入るレコードなら寄与のタプルを返す（いいね0と転載は対象外）"""
+        likes = item.get('like_count', 0)
+        if not likes > 0 or item.get('duplicate_of'): return None
+        member = item.get('member')
+        own_followers = item.get('follower_count', 0)
+        followers = authors.get(member, 0) or own_followers
+        char_name = member or item.get('query') or 'Unknown'
+        return (url, seq, likes, followers, own_followers, member,
+                parse_hour(item.get('created_at', "")), aspect_code(item),
+                location_code(item.get('text', "")), char_name)
+
+    @staticmethod
+    def _bump(group, likes, sign):
+        group[0] += sign * likes
+        group[1] += sign
+        group[2] += sign * likes * likes
+
+    def _add(self, c):
+        url, seq, likes, followers, _, _, hour, aspect, loc, char_name = c
+        self._bump(self.totals, likes, 1)
+        if hour >= 0: self._bump(self.hours[hour], likes, 1)
+        self._bump(self.aspects[aspect], likes, 1)
+        self._bump(self.locations[loc], likes, 1)
+        group = self.chars.setdefault(char_name, [0, 0, 0, seq])
+        self._bump(group, likes, 1)
+        group[3] = min(group[3], seq)
+        self.conn.execute("INSERT OR REPLACE INTO contrib VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", c)
+
+        score = viral_score(likes, followers)
+        entry = [-score, seq, url, score]
+        if self.viral_complete or (self.viral and entry[:2] < self.viral[-1][:2]):
+            bisect.insort(self.viral, entry, key=lambda e: e[:2])
+            if len(self.viral) > VIRAL_BUFFER:
+                self.viral.pop()
+                self.viral_complete = False
+
+    def _remove(self, c):
+        url, seq, likes, _, _, _, hour, aspect, loc, char_name = c
+        self._bump(self.totals, likes, -1)
+        if hour >= 0: self._bump(self.hours[hour], likes, -1)
+        self._bump(self.aspects[aspect], likes, -1)
+        self._bump(self.locations[loc], likes, -1)
+        self.conn.execute("DELETE FROM contrib WHERE url = ?", (url,))
+
+        group = self.chars[char_name]
+        self._bump(group, likes, -1)
+        if group[1] == 0:
+            del self.chars[char_name]
+        elif group[3] == seq:
+            group[3] = self.conn.execute("SELECT MIN(seq) FROM contrib WHERE char_name = ?", (char_name,)).fetchone()[0]
+
+        self.viral = [e for e in self.viral if e[2] != url]
+
+    def _stored(self, url):
+        return self.conn.execute("SELECT * FROM contrib WHERE url = ?", (url,)).fetchone()
+
+    # --- 更新 ---
+
+    def rebuild(self, rows, authors, generation):
+        """全レコードから作り直す"""
+        self.conn.execute("DELETE FROM contrib")
+        self._reset_aggregates()
+        self.generation = generation
+        self.authors = dict(authors)
+        for url, seq, item in rows:
+            c = self.contribution(url, seq, item, authors)
+            if c: self._add(c)
+        self.conn.commit()
+
+    def apply(self, changed_rows, deleted_urls, authors):
+        """変更されたレコード・削除されたURL・フォロワー数の変化だけを反映する。反映した件数を返す"""
+        touched = 0
+        for url in deleted_urls:
+            old = self._stored(url)
+            if old:
+                self._remove(old)
+                touched += 1
+
+        for url, seq, item in changed_rows:
+            old = self._stored(url)
+            new = self.contribution(url, seq, item, authors)
+            if old == new: continue
+            if old: self._remove(old)
+            if new: self._add(new)
+            touched += 1
+
+        # authors.json で数が変わった人のレコードだけ followers を付け直す
+        changed_users = [u for u in set(self.authors) | set(authors) if self.authors.get(u, 0) != authors.get(u, 0)]
+        for start in range(0, len(changed_users), 500):
+            chunk = changed_users[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT * FROM contrib WHERE member IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for old in rows:
+                followers = authors.get(old[5], 0) or old[4]
+                if followers == old[3]: continue
+                self._remove(old)
+                self._add(old[:3] + (followers,) + old[4:])
+                touched += 1
+        self.authors = dict(authors)
+
+        if len(self.viral) < VIRAL_TOP_K and not self.viral_complete:
+            self._rebuild_viral()
+        self.conn.commit()
+        return touched
+
+    def _rebuild_viral(self):
+        entries = sorted(
+            ([-viral_score(likes, followers), seq, url, viral_score(likes, followers)]
+             for url, seq, likes, followers in self.conn.execute("SELECT url, seq, likes, followers FROM contrib")),
+            key=lambda e: e[:2]
+        )
+        self.viral = entries[:VIRAL_BUFFER]
+        self.viral_complete = len(entries) <= VIRAL_BUFFER
+
+    # --- 出力 ---
+
+    def report(self, total_records, updated_at):
+        """analyze_data.build_report と同じ形の dict を返す（対象0件なら None）"""
+        total_sum, total_count, _ = self.totals
+        if total_count == 0: return None
+
+        def avg(group):
+            return int(group[0] / group[1]) if group[1] else 0
+
+        viral_ranking = []
+        for _, _, url, score in self.viral[:VIRAL_TOP_K]:
+            _, _, likes, followers, _, _, _, _, loc, char_name = self._stored(url)
+            match = STATUS_URL_RE.search(url)
+            viral_ranking.append({
+                'character_name': char_name, 'cosplayer_name': match.group(1) if match else 'Unknown',
+                'like_count': likes, 'followers': followers, 'viral_score': score, 'url': url,
+                'location': LOCATION_LABELS[loc]
+            })
+
+        chars = sorted(self.chars.items(), key=lambda kv: kv[1][3])
+        return {
+            'updated_at': updated_at,
+            'total_analyzed': total_count,
+            'total_records': total_records,
+            'global_avg': int(total_sum / total_count),
+            'hourly_report': [{'hour': h, 'avg_likes': avg(g), 'count': g[1]} for h, g in enumerate(self.hours)],
+            'aspect_report': [{'type': t, 'avg': avg(g), 'count': g[1]} for t, g in zip(ASPECT_LABELS, self.aspects)],
+            'location_report': [{'location': n, 'avg': avg(g), 'count': g[1]} for n, g in zip(LOCATION_LABELS, self.locations)],
+            'member_ranking': sorted([{'name': n, 'avg': avg(g), 'count': g[1]} for n, g in chars], key=lambda x: x['avg'], reverse=True),
+            'viral_ranking': viral_ranking
+        }
@@ -1,8 +1,14 @@
 import json
 import os
 import re
+import sys
+import time
 from datetime import datetime
 
+import numpy as np
+from record_store import RecordStore
+from author_index import STATUS_URL_RE, follower_count, load_authors
+
 INPUT_FILE = 'collect.json'
 OUTPUT_FILE = 'analysis.json'
 
@@ -10,91 +16,194 @@ LOCATION_KEYWORDS = {
     "Event": ["コミケ", "C9", "C10", "夏コミ", "冬コミ", "アコスタ", "acosta", "池ハロ", "となコス", "超会議", "ニコ超", "ラグコス", "ワンフェス", "ホココス", "ビビコス", "ストフェス", "a!"],
     "Studio": ["スタジオ", "studio", "撮", "撮影会", "宅コス", "家", "自撮り", "セルフィー", "笹塚"]
 }
+# キーワードごとの any(k in text) を1本の正規表現にまとめる
+EVENT_RE = re.compile("|".join(map(re.escape, LOCATION_KEYWORDS['Event'])))
+STUDIO_RE = re.compile("|".join(map(re.escape, LOCATION_KEYWORDS['Studio'])))
 
-def analyze_data():
-    if not os.path.exists(INPUT_FILE): return
-    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    valid_data = [d for d in data if d.get('like_count', 0) > 0]
-    if not valid_data: return
-
-    global_avg = int(sum(d['like_count'] for d in valid_data) / len(valid_data))
-
-    hourly_stats = {h: {'likes': [], 'count': 0} for h in range(24)}
-    aspect_stats = {'Portrait': [], 'Landscape': [], 'Square': [], 'Unknown': []}
-    location_stats = {'Event': {'likes': [], 'count': 0}, 'Studio/Home': {'likes': [], 'count': 0}, 'Others': {'likes': [], 'count': 0}}
-    char_stats = {}
-    ranking_data = []
-
-    for item in valid_data:
-        likes = item['like_count']
-        followers = item.get('follower_count', 0)
-        text = item.get('text', "")
-        
-        # --- 1. 時間帯分析 (ISO形式の末尾 Z 対策) ---
-        try:
-            date_str = item.get('created_at', "")
-            if date_str.endswith('Z'):
-                date_str = date_str.replace('Z', '+00:00')
-            dt = datetime.fromisoformat(date_str)
-            hour = dt.hour
-            hourly_stats[hour]['likes'].append(likes)
-            hourly_stats[hour]['count'] += 1
-        except: pass
-
-        # --- 2. 構図分析 (キー名揺れ対策) ---
-        dims = item.get('dimensions') or item.get('image_dimensions')
-        label = 'Unknown'
-        if dims and dims.get('height', 0) > 0:
-            ratio = dims['width'] / dims['height']
-            label = 'Square' if 0.9 <= ratio <= 1.1 else ('Portrait' if ratio < 0.9 else 'Landscape')
-        aspect_stats[label].append(likes)
-
-        # 3. ロケーション / 4. 分離 / 5. スコア (以前と同じ)
-        loc_label = 'Others'
-        if any(k in text for k in LOCATION_KEYWORDS['Event']): loc_label = 'Event'
-        elif any(k in text for k in LOCATION_KEYWORDS['Studio']): loc_label = 'Studio/Home'
-        location_stats[loc_label]['likes'].append(likes)
-        location_stats[loc_label]['count'] += 1
-
-        char_name = item.get('member') or item.get('query') or 'Unknown'
+ASPECT_LABELS = ['Portrait', 'Landscape', 'Square', 'Unknown']
+LOCATION_LABELS = ['Event', 'Studio/Home', 'Others']
+VIRAL_TOP_K = 50
+TRENDING_TOP_K = 20
+TRENDING_WINDOW = 24 * 3600 # この秒数のあいだのいいねの伸びで並べる
+
+def parse_hour(date_str):
+    """created_at から時間帯を取る（ISO形式の末尾 Z 対策）。読めなければ -1"""
+    try:
+        if date_str.endswith('Z'):
+            date_str = date_str.replace('Z', '+00:00')
+        return datetime.fromisoformat(date_str).hour
+    except:
+        return -1
+
+def location_code(text):
+    if EVENT_RE.search(text): return 0
+    if STUDIO_RE.search(text): return 1
+    return 2
+
+def aspect_code(item):
+    """構図分析 (キー名揺れ対策)"""
+    dims = item.get('dimensions') or item.get('image_dimensions')
+    if dims and dims.get('height', 0) > 0:
+        ratio = dims['width'] / dims['height']
+        return 2 if 0.9 <= ratio <= 1.1 else (0 if ratio < 0.9 else 1)
+    return 3
+
+def extract_columns(valid_data, authors):
+    """レコードを1回だけ走査して列（NumPy配列）に変換する"""
+    n = len(valid_data)
+    likes = np.fromiter((d['like_count'] for d in valid_data), dtype=np.int64, count=n)
+    followers = np.fromiter((follower_count(d, authors) for d in valid_data), dtype=np.int64, count=n)
+    hours = np.fromiter((parse_hour(d.get('created_at', "")) for d in valid_data), dtype=np.int64, count=n)
+    aspects = np.fromiter((aspect_code(d) for d in valid_data), dtype=np.int64, count=n)
+    locations = np.fromiter((location_code(d.get('text', "")) for d in valid_data), dtype=np.int64, count=n)
+
+    # キャラ名は初登場順にコード化（ランキングの同点時の並びを保つため）
+    char_names = {}
+    chars = np.fromiter(
+        (char_names.setdefault(d.get('member') or d.get('query') or 'Unknown', len(char_names)) for d in valid_data),
+        dtype=np.int64, count=n
+    )
+    return likes, followers, hours, aspects, locations, chars, list(char_names)
+
+def group_avg(codes, likes, size):
+    """コードごとの (平均, 件数)。平均は int(sum/len) と同じ丸め"""
+    sums = np.bincount(codes, weights=likes, minlength=size)
+    counts = np.bincount(codes, minlength=size)
+    avgs = [int(s / c) if c else 0 for s, c in zip(sums.tolist(), counts.tolist())]
+    return avgs, counts.tolist()
+
+def viral_ranking(valid_data, likes, followers, char_names, chars, locations):
+    """viral_score 上位 VIRAL_TOP_K 件（同点は元の順番）"""
+    n = len(likes)
+    raw = np.zeros(n, dtype=np.float64)
+    has_followers = followers > 0
+    raw[has_followers] = (likes[has_followers] / followers[has_followers]) * 100
+
+    # 丸め後の同点を取りこぼさないよう、K番目の値より少し下まで候補に入れてから正確に並べる
+    if n > VIRAL_TOP_K:
+        kth = np.partition(raw, n - VIRAL_TOP_K)[n - VIRAL_TOP_K]
+        candidates = np.flatnonzero(raw >= kth - 0.01)
+    else:
+        candidates = np.arange(n)
+
+    scored = []
+    for i in candidates.tolist():
+        score = round(float(raw[i]), 2) if has_followers[i] else 0
+        scored.append((score, i))
+    scored.sort(key=lambda x: x[0], reverse=True)
+
+    ranking = []
+    for score, i in scored[:VIRAL_TOP_K]:
+        item = valid_data[i]
         cos_id = 'Unknown'
-        match = re.search(r'(?:twitter|x)\.com/([^/]+)/status', item.get('url', ''))
+        match = STATUS_URL_RE.search(item.get('url', ''))
         if match: cos_id = match.group(1)
+        ranking.append({
+            'character_name': char_names[chars[i]], 'cosplayer_name': cos_id, 'like_count': int(likes[i]),
+            'followers': int(followers[i]), 'viral_score': score, 'url': item.get('url', ''),
+            'location': LOCATION_LABELS[locations[i]]
+        })
+    return ranking
 
-        if char_name not in char_stats: char_stats[char_name] = {'likes': [], 'count': 0}
-        char_stats[char_name]['likes'].append(likes)
-        char_stats[char_name]['count'] += 1
+def build_report(data, authors, updated_at):
+    # 転載（dedup_images.py で duplicate_of が付いたもの）は二重に数えない
+    valid_data = [d for d in data if d.get('like_count', 0) > 0 and not d.get('duplicate_of')]
+    if not valid_data: return None
 
-        viral_score = round((likes / followers) * 100, 2) if followers > 0 else 0
-        ranking_data.append({
-            'character_name': char_name, 'cosplayer_name': cos_id, 'like_count': likes,
-            'followers': followers, 'viral_score': viral_score, 'url': item.get('url', ''),
-            'location': loc_label
-        })
+    likes, followers, hours, aspects, locations, chars, char_names = extract_columns(valid_data, authors)
+    global_avg = int(int(likes.sum()) / len(likes))
+
+    # 1. 時間帯 / 2. 構図 / 3. ロケーション / 4. キャラ をそれぞれ bincount 1回で集計
+    valid_hours = hours >= 0
+    hour_avgs, hour_counts = group_avg(hours[valid_hours], likes[valid_hours], 24)
+    aspect_avgs, aspect_counts = group_avg(aspects, likes, len(ASPECT_LABELS))
+    loc_avgs, loc_counts = group_avg(locations, likes, len(LOCATION_LABELS))
+    char_avgs, char_counts = group_avg(chars, likes, len(char_names))
 
-    # レポート集計 (0除算回避)
-    hourly_report = [{'hour': h, 'avg_likes': int(sum(s['likes'])/len(s['likes'])) if s['likes'] else 0, 'count': s['count']} for h, s in hourly_stats.items()]
-    aspect_report = [{'type': t, 'avg': int(sum(l)/len(l)) if l else 0, 'count': len(l)} for t, l in aspect_stats.items()]
-    location_report = [{'location': n, 'avg': int(sum(s['likes'])/len(s['likes'])) if s['likes'] else 0, 'count': s['count']} for n, s in location_stats.items()]
-    char_ranking = sorted([{'name': n, 'avg': int(sum(s['likes'])/len(s['likes'])), 'count': s['count']} for n, s in char_stats.items()], key=lambda x: x['avg'], reverse=True)
-    viral_ranking = sorted(ranking_data, key=lambda x: x['viral_score'], reverse=True)[:50]
+    hourly_report = [{'hour': h, 'avg_likes': hour_avgs[h], 'count': hour_counts[h]} for h in range(24)]
+    aspect_report = [{'type': t, 'avg': aspect_avgs[k], 'count': aspect_counts[k]} for k, t in enumerate(ASPECT_LABELS)]
+    location_report = [{'location': n, 'avg': loc_avgs[k], 'count': loc_counts[k]} for k, n in enumerate(LOCATION_LABELS)]
+    char_ranking = sorted([{'name': n, 'avg': char_avgs[k], 'count': char_counts[k]} for k, n in enumerate(char_names)], key=lambda x: x['avg'], reverse=True)
 
-    output = {
-        'updated_at': datetime.now().strftime('%Y/%m/%d %H:%M'),
-        'total_analyzed': len(ranking_data),
+    return {
+        'updated_at': updated_at,
+        'total_analyzed': len(valid_data),
         'total_records': len(data),
         'global_avg': global_avg,
         'hourly_report': hourly_report,
         'aspect_report': aspect_report,
         'location_report': location_report,
         'member_ranking': char_ranking,
-        'viral_ranking': viral_ranking
+        'viral_ranking': viral_ranking(valid_data, likes, followers, char_names, chars, locations)
     }
+
+def trending_report(store, top=TRENDING_TOP_K):
+    """metric_snapshots の時系列から、直近でいいねが伸びている投稿（転載は除く）"""
+    from metric_snapshots import SNAPSHOT_FILE, SnapshotStore
+    if not os.path.exists(SNAPSHOT_FILE): return []
+    snapshots = SnapshotStore()
+    ranking = snapshots.velocity_ranking(top * 2, window=TRENDING_WINDOW)
+    records = store.get_many(r['url'] for r in ranking)
+    trending = []
+    for r in ranking:
+        item = records.get(r['url'])
+        if item is None or item.get('duplicate_of'): continue
+        match = STATUS_URL_RE.search(r['url'])
+        trending.append({
+            'member_name': item.get('member_name', ''),
+            'cosplayer_name': match.group(1) if match else 'Unknown',
+            'url': r['url'],
+            'like_count': r['likes'],
+            'likes_per_hour': r['likes_per_hour'],
+            'gain': r['gain'],
+            'snapshots': len(snapshots.series(r['url'])[0]),
+        })
+    return trending[:top]
+
+def analyze_data(full=False):
+    """
+    前回からの差分だけを analysis_state に反映して analysis.json を作る。
+    full=True (--full) なら全件で計算し直した結果と一致するかも確認する
+    """
+    if not os.path.exists(INPUT_FILE): return
+    from analysis_state import AnalysisState
+
+    store = RecordStore(json_path=INPUT_FILE)
+    authors = load_authors()
+    state = AnalysisState()
+    started = time.time()
+
+    if state.generation != store.generation():
+        state.rebuild(store.rows(), authors, store.generation())
+        print(f"🔄 集計状態を作り直しました ({state.totals[1]} 件)")
+    else:
+        touched = state.apply(store.changed_since(state.synced_at), store.deleted_since(state.synced_at), authors)
+        print(f"➕ 差分 {touched} 件を反映しました")
+    state.synced_at = started
+    state.save()
+
+    updated_at = datetime.now().strftime('%Y/%m/%d %H:%M')
+    output = state.report(len(store), updated_at)
+
+    if full:
+        expected = build_report(store.load(), authors, updated_at)
+        if json.dumps(expected, ensure_ascii=False) == json.dumps(output, ensure_ascii=False):
+            print("✅ 差分集計と全件集計が一致しました")
+        else:
+            print("❌ 差分集計が全件集計と一致しません。全件の結果を使い、集計状態を作り直します")
+            output = expected
+            state.rebuild(store.rows(), authors, store.generation())
+            state.save()
+    if output is not None:
+        # 時系列がある投稿の「伸び」（最終的ないいね数の集計とは別に、差分集計の外で作る）
+        output['trending'] = trending_report(store)
+    state.close()
+    store.close()
+    if output is None: return
+
     with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
         json.dump(output, f, ensure_ascii=False, indent=2)
-    print(f"✨ 分析完了！ {len(ranking_data)} 件を処理しました。")
+    print(f"✨ 分析完了！ {output['total_analyzed']} 件を処理しました。")
 
 if __name__ == "__main__":
-    analyze_data()
\ No newline at end of file
+    analyze_data(full='--full' in sys.argv)
@@ -1,6 +1,6 @@
-import json
 import os
 from datetime import datetime
+from record_store import RecordStore
 
 def analyze_trends():
     file_path = 'collect.json'
@@ -9,8 +9,9 @@ def analyze_trends():
         print("データファイルが見つかりません。")
         return
 
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    store = RecordStore(json_path=file_path)
+    data = store.load()
+    store.close()
 
     # 数値が入っているデータだけを抽出
     analyzable_data = [d for d in data if d.get('like_count', 0) > 0]
@@ -0,0 +1,60 @@
+import json
+import os
+import re
+
+AUTHORS_FILE = 'authors.json' # ユーザーID -> フォロワー数 の正規化テーブル
+
+STATUS_URL_RE = re.compile(r'(?:twitter|x)\.com/([^/]+)/status')
+
+# URLからユーザーIDを抜き出す関数
+def extract_user_id(url):
+    # https://x.com/user_id/status/12345... から user_id を抽出
+    match = STATUS_URL_RE.search(url)
+    if match:
+        return match.group(1)
+    return None
+
+def load_authors(path=AUTHORS_FILE):
+    if not os.path.exists(path): return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        try: return json.load(f)
+        except: return {}
+
+def save_authors(authors, path=AUTHORS_FILE):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(authors, f, ensure_ascii=False, indent=2)
+
+def build_author_index(data):
+    """
+    ユーザーID -> そのユーザーのレコード位置リスト を1回の走査で作る。
+    ついでに memberキーをURL由来のユーザーIDに正規化する（書き換えたレコード位置の集合も返す）
+    """
+    index = {}
+    changed = set()
+    for i, d in enumerate(data):
+        user_id = extract_user_id(d.get('url', ''))
+        if not user_id: continue
+        if d.get('member') != user_id:
+            d['member'] = user_id
+            changed.add(i)
+        index.setdefault(user_id, []).append(i)
+    return index, changed
+
+def migrate_follower_counts(data, index, authors):
+    """
+    レコードにコピーされていた follower_count を authors テーブルへ移し、レコード側からは消す。
+    書き換えたレコード位置の集合を返す
+    """
+    moved = set()
+    for user_id, rows in index.items():
+        for i in rows:
+            count = data[i].pop('follower_count', None)
+            if count is None: continue
+            moved.add(i)
+            if count > 0 and authors.get(user_id, 0) == 0:
+                authors[user_id] = count
+    return moved
+
+def follower_count(item, authors):
+    """レコードのフォロワー数（authorsテーブル優先、古いデータはレコードの値）"""
+    return authors.get(item.get('member'), 0) or item.get('follower_count', 0)
@@ -0,0 +1,135 @@
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from analyze_data import LOCATION_KEYWORDS, build_report
+from author_index import STATUS_URL_RE, follower_count
+
+# 使い方: python bench_analyze.py [件数 ...]  (デフォルト: 6000 100000 1000000)
+SIZES = [6000, 100000, 1000000]
+UPDATED_AT = '2000/01/01 00:00'
+
+def legacy_report(data, authors):
+    """ベクトル化前の analyze_data（比較用にそのまま残したもの）"""
+    valid_data = [d for d in data if d.get('like_count', 0) > 0]
+    if not valid_data: return None
+
+    global_avg = int(sum(d['like_count'] for d in valid_data) / len(valid_data))
+
+    hourly_stats = {h: {'likes': [], 'count': 0} for h in range(24)}
+    aspect_stats = {'Portrait': [], 'Landscape': [], 'Square': [], 'Unknown': []}
+    location_stats = {'Event': {'likes': [], 'count': 0}, 'Studio/Home': {'likes': [], 'count': 0}, 'Others': {'likes': [], 'count': 0}}
+    char_stats = {}
+    ranking_data = []
+
+    for item in valid_data:
+        likes = item['like_count']
+        followers = follower_count(item, authors)
+        text = item.get('text', "")
+
+        try:
+            date_str = item.get('created_at', "")
+            if date_str.endswith('Z'):
+                date_str = date_str.replace('Z', '+00:00')
+            dt = datetime.fromisoformat(date_str)
+            hour = dt.hour
+            hourly_stats[hour]['likes'].append(likes)
+            hourly_stats[hour]['count'] += 1
+        except: pass
+
+        dims = item.get('dimensions') or item.get('image_dimensions')
+        label = 'Unknown'
+        if dims and dims.get('height', 0) > 0:
+            ratio = dims['width'] / dims['height']
+            label = 'Square' if 0.9 <= ratio <= 1.1 else ('Portrait' if ratio < 0.9 else 'Landscape')
+        aspect_stats[label].append(likes)
+
+        loc_label = 'Others'
+        if any(k in text for k in LOCATION_KEYWORDS['Event']): loc_label = 'Event'
+        elif any(k in text for k in LOCATION_KEYWORDS['Studio']): loc_label = 'Studio/Home'
+        location_stats[loc_label]['likes'].append(likes)
+        location_stats[loc_label]['count'] += 1
+
+        char_name = item.get('member') or item.get('query') or 'Unknown'
+        cos_id = 'Unknown'
+        match = STATUS_URL_RE.search(item.get('url', ''))
+        if match: cos_id = match.group(1)
+
+        if char_name not in char_stats: char_stats[char_name] = {'likes': [], 'count': 0}
+        char_stats[char_name]['likes'].append(likes)
+        char_stats[char_name]['count'] += 1
+
+        viral_score = round((likes / followers) * 100, 2) if followers > 0 else 0
+        ranking_data.append({
+            'character_name': char_name, 'cosplayer_name': cos_id, 'like_count': likes,
+            'followers': followers, 'viral_score': viral_score, 'url': item.get('url', ''),
+            'location': loc_label
+        })
+
+    hourly_report = [{'hour': h, 'avg_likes': int(sum(s['likes'])/len(s['likes'])) if s['likes'] else 0, 'count': s['count']} for h, s in hourly_stats.items()]
+    aspect_report = [{'type': t, 'avg': int(sum(l)/len(l)) if l else 0, 'count': len(l)} for t, l in aspect_stats.items()]
+    location_report = [{'location': n, 'avg': int(sum(s['likes'])/len(s['likes'])) if s['likes'] else 0, 'count': s['count']} for n, s in location_stats.items()]
+    char_ranking = sorted([{'name': n, 'avg': int(sum(s['likes'])/len(s['likes'])), 'count': s['count']} for n, s in char_stats.items()], key=lambda x: x['avg'], reverse=True)
+    viral_ranking = sorted(ranking_data, key=lambda x: x['viral_score'], reverse=True)[:50]
+
+    return {
+        'updated_at': UPDATED_AT,
+        'total_analyzed': len(ranking_data),
+        'total_records': len(data),
+        'global_avg': global_avg,
+        'hourly_report': hourly_report,
+        'aspect_report': aspect_report,
+        'location_report': location_report,
+        'member_ranking': char_ranking,
+        'viral_ranking': viral_ranking
+    }
+
+def synthetic_data(n, seed=0):
+    """collect.json に似せたダミーデータ"""
+    rng = random.Random(seed)
+    users = [f"user{i}" for i in range(max(10, n // 20))]
+    authors = {u: rng.choice([0, rng.randint(50, 100000)]) for u in users}
+    words = LOCATION_KEYWORDS['Event'] + LOCATION_KEYWORDS['Studio'] + ["かわいい", "コスプレ", "#ぶいすぽ", "new"]
+    base = datetime(2025, 1, 1)
+    data = []
+    for i in range(n):
+        user = rng.choice(users)
+        item = {
+            'url': f"https://x.com/{user}/status/{10**17 + i}",
+            'member': user,
+            'like_count': rng.choice([0, rng.randint(1, 5000), rng.randint(1, 50)]),
+            'text': " ".join(rng.choice(words) for _ in range(rng.randint(0, 6))),
+        }
+        if rng.random() < 0.8:
+            item['created_at'] = (base + timedelta(minutes=rng.randint(0, 500000))).isoformat() + rng.choice(["Z", "+09:00", ""])
+        if rng.random() < 0.5:
+            item['dimensions'] = {'width': rng.randint(300, 4000), 'height': rng.choice([0, rng.randint(300, 4000)])}
+        if rng.random() < 0.1:
+            item['follower_count'] = rng.randint(1, 1000)
+        data.append(item)
+    return data, authors
+
+def dumps(report):
+    return json.dumps(report, ensure_ascii=False, indent=2)
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or SIZES
+    print(f"{'records':>10} {'legacy(s)':>10} {'numpy(s)':>10} {'speedup':>8}  identical")
+    for n in sizes:
+        data, authors = synthetic_data(n)
+
+        started = time.perf_counter()
+        old = legacy_report(data, authors)
+        legacy_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        new = build_report(data, authors, UPDATED_AT)
+        new_time = time.perf_counter() - started
+
+        same = dumps(old) == dumps(new)
+        print(f"{n:>10} {legacy_time:>10.3f} {new_time:>10.3f} {legacy_time / new_time:>7.1f}x  {same}")
+
+if __name__ == "__main__":
+    main()
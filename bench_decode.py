@@ -0,0 +1,121 @@
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from clip_backends import IMAGE_MEAN, IMAGE_SIZE, IMAGE_STD, crop_pixels, preprocess
+from image_fetcher import DRAFT_SIZE, decode_image
+
+# 使い方: python bench_decode.py [枚数]  (デフォルト: 20)
+# スマホ写真くらいの大きさのJPEGで、CLIPに入れるまでの1枚あたりの時間を比べる
+#   full : 元の大きさでデコード → 1枚ずつ縮小・切り抜き・正規化（これまでの方法）
+#   draft: draft() で縮小デコード → crop_pixels → バッチでまとめて正規化
+# CLIPが読み込めれば collect.json の画像で、両方の前処理の合否が一致するかも確かめる
+SIZES = [(4032, 3024), (3000, 4000), (2048, 1536), (1200, 1600)]
+COUNT = 20
+WORKERS = 8
+INPUT_FILE = 'collect.json'
+SAMPLE_SIZE = 50
+
+def synthetic_jpeg(size, seed):
+    """グラデーション + ノイズ（真っ平らな画像だとデコードが速すぎて比べにならない）"""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    x = np.linspace(0, 255, w, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None, None]
+    pixels = (x * rng.random(3) + y * rng.random(3)) / 2 + rng.normal(0, 4, (h, w, 3))
+    buf = BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+def legacy_preprocess(image):
+    """短辺224に縮小 → 中央切り抜き → 正規化 を1枚ずつ（比較用）"""
+    w, h = image.size
+    scale = IMAGE_SIZE / min(w, h)
+    image = image.resize((max(IMAGE_SIZE, int(w * scale)), max(IMAGE_SIZE, int(h * scale))), Image.BICUBIC)
+    left = (image.width - IMAGE_SIZE) // 2
+    top = (image.height - IMAGE_SIZE) // 2
+    image = image.crop((left, top, left + IMAGE_SIZE, top + IMAGE_SIZE))
+    pixels = (np.asarray(image, dtype=np.float32) / 255.0 - IMAGE_MEAN) / IMAGE_STD
+    return pixels.transpose(2, 0, 1)
+
+def run_full(blobs):
+    return np.stack([legacy_preprocess(decode_image(b, draft_size=0)) for b in blobs])
+
+def run_draft(blobs, workers=1):
+    load = lambda b: crop_pixels(decode_image(b))
+    if workers == 1: return preprocess([load(b) for b in blobs])
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return preprocess(list(pool.map(load, blobs)))
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+def check_verdicts():
+    """collect.json の画像を両方の前処理で判定して合否の一致率を出す"""
+    from clip_classifier import LABELS_X, ClipJudge
+    from image_fetcher import shared_fetcher
+    judge = ClipJudge(LABELS_X, use_cache=False)
+    if not judge.available:
+        print("⚠️ CLIP is not available, skipped verdict check")
+        return
+    try:
+        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        print(f"⚠️ {INPUT_FILE} not found, skipped verdict check")
+        return
+
+    fetcher = shared_fetcher()
+    full, draft = [], []
+    for item in data:
+        if len(full) >= SAMPLE_SIZE: break
+        if not item.get('images'): continue
+        try:
+            content, _ = fetcher.fetch(item['images'][0])
+        except Exception:
+            continue
+        if content is None: continue
+        member = item.get('member_name') or "VSPO"
+        full.append((decode_image(content, draft_size=0), member))
+        draft.append((decode_image(content), member))
+    if not full: return
+
+    reference = judge.judge(full)
+    candidate = judge.judge(draft)
+    disagreements = [i for i, (a, b) in enumerate(zip(reference, candidate)) if a.accepted != b.accepted]
+    drift = max(abs(a.top_score - b.top_score) for a, b in zip(reference, candidate))
+    print(f"📊 accept/reject agreement ({judge.backend.kind}): {1 - len(disagreements) / len(full):.1%} "
+          f"on {len(full)} images, max score drift {drift:.3f}")
+    for i in disagreements:
+        a, b = reference[i], candidate[i]
+        print(f"   #{i}: full={a.accepted} ({a.top_index}, {a.top_score:.2f}) draft={b.accepted} ({b.top_index}, {b.top_score:.2f})")
+    print(fetcher.report())
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else COUNT
+    blobs = [synthetic_jpeg(SIZES[i % len(SIZES)], i) for i in range(count)]
+    print(f"🖼️ {count} JPEGs ({sum(map(len, blobs)) / 1e6:.1f} MB), draft size {DRAFT_SIZE}px")
+
+    full, t_full = timed(run_full, blobs)
+    draft, t_draft = timed(run_draft, blobs)
+    _, t_threads = timed(run_draft, blobs, WORKERS)
+    print(f"⏱️ full decode + per-image preprocess : {t_full / count * 1000:7.1f} ms/image")
+    print(f"⏱️ draft decode + crop + batch norm   : {t_draft / count * 1000:7.1f} ms/image "
+          f"({t_full / t_draft:.1f}x)")
+    print(f"⏱️ {f'same, {WORKERS} worker threads':<35}: {t_threads / count * 1000:7.1f} ms/image "
+          f"({t_full / t_threads:.1f}x)")
+
+    diff = np.abs(full - draft)
+    print(f"📏 pixel_values diff: max {diff.max():.3f}, mean {diff.mean():.4f} "
+          f"(normalized units, 1 gray level ≈ {1 / 255 / IMAGE_STD.min():.3f})")
+    check_verdicts()
+
+if __name__ == "__main__":
+    main()
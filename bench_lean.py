@@ -0,0 +1,95 @@
+import asyncio
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from playwright.async_api import async_playwright
+from lean_browser import TimingHistogram, new_context, warm_up
+
+# 使い方: python bench_lean.py [URL数]  (デフォルト: 30)
+# ローカルの HTTP サーバーで「画像・動画・フォント・行動ログだらけのツイートページ」を再現し、
+# 通常のコンテキストと lean コンテキストで1URLあたりの読み込み時間と転送量を比べる
+URLS = 30
+IMAGES_PER_PAGE = 12
+ASSET_DELAY = 0.05 # 画像などのサーバー側の遅延（秒）
+
+PAGE = """<!doctype html><html><head>
+<style>@font-face {{ font-family: Chirp; src: url(/font-{n}.woff2); }} body {{ font-family: Chirp; }}
+article {{ animation: fade 0.5s; }} @keyframes fade {{ from {{ opacity: 0; }} to {{ opacity: 1; }} }}</style>
+<script src="/i/api/1.1/jot/client_event.js?n={n}"></script>
+</head><body>
+<article data-testid="tweet">
+  <div data-testid="tweetText">stand-in tweet {n}</div>
+  <div data-testid="tweetPhoto">{images}</div>
+  <video src="/media-{n}.mp4" autoplay muted></video>
+  <div data-testid="like" aria-label="{n}23 Likes. Like"></div>
+  <a href="/user/status/{n}/analytics" aria-label="{n}4K views"></a>
+</article></body></html>"""
+
+class StandIn(BaseHTTPRequestHandler):
+    bytes_sent = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type, delay=0.0):
+        if delay: time.sleep(delay)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+        StandIn.bytes_sent += len(body)
+
+    def do_GET(self):
+        path = self.path
+        if path.startswith("/status/"):
+            n = path.rsplit("/", 1)[-1]
+            images = "".join(f'<img src="/img/{n}-{k}.jpg">' for k in range(IMAGES_PER_PAGE))
+            self._send(PAGE.format(n=n, images=images).encode(), "text/html")
+        elif path.startswith("/img/"):
+            self._send(b"\xff\xd8" + b"\0" * 150_000, "image/jpeg", ASSET_DELAY)
+        elif path.startswith("/media-"):
+            self._send(b"\0" * 1_000_000, "video/mp4", ASSET_DELAY)
+        elif path.startswith("/font-"):
+            self._send(b"\0" * 100_000, "font/woff2", ASSET_DELAY)
+        elif "/jot/" in path:
+            self._send(b"/* tracking */", "application/javascript", ASSET_DELAY * 4)
+        else:
+            self._send(b"<!doctype html><title>home</title>", "text/html")
+
+async def run(browser, base, lean, n):
+    context = await new_context(browser, lean=lean)
+    page = await context.new_page()
+    await warm_up(page, base + "/")
+    hist = TimingHistogram(f"{'lean' if lean else 'full'} profile")
+    StandIn.bytes_sent = 0
+    for i in range(n):
+        with hist.time():
+            await page.goto(f"{base}/status/{i + 1}", wait_until="load")
+            await page.wait_for_selector('[data-testid="like"]')
+    hist.report()
+    print(f"   transferred {StandIn.bytes_sent / 1e6:.1f} MB, blocked {getattr(context, 'blocked_requests', 0)} requests")
+    await context.close()
+    return hist
+
+async def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else URLS
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        full = await run(browser, base, False, n)
+        lean = await run(browser, base, True, n)
+        await browser.close()
+    server.shutdown()
+
+    full_p50, lean_p50 = full.percentile(0.5), lean.percentile(0.5)
+    print(f"📊 p50 {full_p50:.2f}s → {lean_p50:.2f}s ({full_p50 / lean_p50 if lean_p50 else 0:.1f}x)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
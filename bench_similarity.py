@@ -0,0 +1,59 @@
+import sys
+import time
+
+import numpy as np
+
+from similarity import IVFIndex, normalize, top_k
+
+# 使い方: python bench_similarity.py [件数 ...]  (デフォルト: 6000 50000 200000)
+# 似た画像の多い埋め込みを真似た、クラスタ付きのランダムな正規化ベクトルで比べる
+SIZES = [6000, 50000, 200000]
+DIM = 512       # CLIP ViT-B/32 の埋め込み次元
+QUERIES = 1000  # 検索する行数（新しく足された行を想定）
+TOP_K = 6
+
+def synthetic_vectors(n, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.standard_normal((max(1, n // 50), DIM)))
+    noise = rng.standard_normal((n, DIM)).astype(np.float32) * 0.04
+    return normalize(centers[rng.integers(0, len(centers), n)] + noise)
+
+def legacy_top_k(queries, corpus, rows, k):
+    """1行ずつ全件と内積を取ってソートする素朴な方法（比較用）"""
+    found = []
+    for row, query in zip(rows, queries):
+        order = np.argsort(-(corpus @ query))
+        found.append([i for i in order[:k + 1] if i != row][:k])
+    return np.array(found)
+
+def recall(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or SIZES
+    print(f"{'vectors':>8} {'legacy(s)':>10} {'blocked(s)':>10} {'ivf build':>10} {'ivf(s)':>8} {'recall@6':>9}")
+    for n in sizes:
+        corpus = synthetic_vectors(n)
+        rows = np.random.default_rng(1).choice(n, min(QUERIES, n), replace=False)
+        queries = corpus[rows]
+
+        started = time.perf_counter()
+        legacy = legacy_top_k(queries, corpus, rows, TOP_K)
+        legacy_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        exact, _ = top_k(queries, corpus, TOP_K, exclude=rows)
+        blocked_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        ivf = IVFIndex(corpus)
+        build_time = time.perf_counter() - started
+        started = time.perf_counter()
+        approx, _ = ivf.search(queries, TOP_K, exclude=rows)
+        ivf_time = time.perf_counter() - started
+
+        assert recall(exact, legacy) == 1.0, "blocked top_k does not match the legacy result"
+        print(f"{n:>8} {legacy_time:>10.3f} {blocked_time:>10.3f} {build_time:>10.3f} {ivf_time:>8.3f} {recall(approx, exact):>9.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import json
+import os
+import sys
+
+from graphql_capture import is_graphql_response, parse_payload
+
+# 使い方: python check_graphql_parser.py
+# fixtures/graphql/ のレスポンス（個人情報を除いて縮めたもの）を parse_payload にかけて、期待値と比べる。
+# X のレスポンス形式が変わったら、新しいレスポンスを fixtures に足してここに期待値を書く
+FIXTURE_DIR = os.path.join('fixtures', 'graphql')
+
+EXPECTED = {
+    'tweet_detail.json': {
+        '1800000000000000001': {'likes': 3520, 'views': 151000, 'author': 'sample_cos', 'followers': 48200,
+                                'created_at': '2023-12-10T18:30:00+09:00'},
+        '1800000000000000002': {'likes': 3, 'views': 0, 'author': 'sample_fan', 'followers': 120},
+        # 閲覧制限付き（TweetWithVisibilityResults）
+        '1800000000000000003': {'likes': 41, 'views': 2100, 'author': 'sample_limited'},
+    },
+    'search_timeline.json': {
+        # screen_name が user.core にある新しい形式 + 長文ツイート
+        '1800000000000000010': {'likes': 1200, 'views': 0, 'author': 'sample_new', 'followers': 7300,
+                                'text': '長文ツイート 長文ツイート 長文ツイート 長文ツイート 長文ツイート'},
+        # 引用元
+        '1790000000000000009': {'likes': 880, 'views': 40500, 'author': 'sample_quoted'},
+        '1800000000000000011': {'likes': 98, 'views': 5400, 'created_at': '2023-12-13T00:00:00+09:00'},
+    },
+    'tweet_result_by_rest_id.json': {
+        '1800000000000000020': {'likes': 2, 'views': 77, 'author': 'sample_solo', 'followers': 15},
+    },
+    'tweet_unavailable.json': {},
+}
+
+URLS = {
+    'https://x.com/i/api/graphql/abc123/TweetDetail?variables=%7B%7D': True,
+    'https://x.com/i/api/graphql/xyz/SearchTimeline?variables=%7B%7D': True,
+    'https://x.com/i/api/graphql/xyz/UserByScreenName?variables=%7B%7D': False,
+    'https://x.com/i/api/2/badge_count/badge_count.json': False,
+}
+
+def main():
+    failures = 0
+    for name, expected in EXPECTED.items():
+        with open(os.path.join(FIXTURE_DIR, name), 'r', encoding='utf-8') as f:
+            tweets = parse_payload(json.load(f))
+        if set(tweets) != set(expected):
+            print(f"❌ {name}: tweet ids {sorted(tweets)} != {sorted(expected)}")
+            failures += 1
+            continue
+        for tweet_id, fields in expected.items():
+            for key, value in fields.items():
+                if tweets[tweet_id][key] != value:
+                    print(f"❌ {name} {tweet_id} {key}: {tweets[tweet_id][key]!r} != {value!r}")
+                    failures += 1
+        print(f"✅ {name}: {len(tweets)} tweets")
+
+    for url, expected in URLS.items():
+        if is_graphql_response(url) != expected:
+            print(f"❌ is_graphql_response({url}) != {expected}")
+            failures += 1
+
+    print("✨ All fixtures parsed as expected" if not failures else f"💥 {failures} mismatches")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
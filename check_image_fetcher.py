@@ -0,0 +1,110 @@
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image
+from image_fetcher import ImageFetcher
+
+# 使い方: python check_image_fetcher.py
+# ローカルの HTTP サーバー（ETag / Last-Modified / Cache-Control を返す）を相手に
+# image_fetcher のキャッシュヒット・条件付きGET(304)・LRU追い出し・デコードの使い回しを確かめる
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+def make_image(color, size=(64, 48)):
+    buf = BytesIO()
+    Image.new("RGB", size, color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+class StandIn(BaseHTTPRequestHandler):
+    images = {}        # パス -> バイト列
+    max_age = {}       # パス -> Cache-Control の max-age
+    requests = []      # (パス, If-None-Match, If-Modified-Since)
+
+    def do_GET(self):
+        body = self.images.get(self.path)
+        self.requests.append((self.path, self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since')))
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('Cache-Control', f"max-age={self.max_age.get(self.path, 3600)}")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Cache-Control', f"max-age={self.max_age.get(self.path, 3600)}")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    cache_dir = tempfile.mkdtemp(prefix="image_cache_")
+    StandIn.images = {f"/{c}.jpg": make_image(c) for c in ("red", "green", "blue")}
+    StandIn.max_age = {"/green.jpg": 0}
+
+    try:
+        fetcher = ImageFetcher(cache_dir=cache_dir)
+        red, digest = fetcher.image(f"{base}/red.jpg")
+        assert red.size == (64, 48) and digest == hashlib.sha256(StandIn.images["/red.jpg"]).hexdigest()
+        # 2回目はネットワークに出ず、デコード済みの画像をそのまま返す
+        again, _ = fetcher.image(f"{base}/red.jpg")
+        assert again is red and len(StandIn.requests) == 1
+        assert fetcher.stats['hits'] == 1 and fetcher.stats['memory_hits'] == 1
+        print("✅ fresh hit served from disk without a request, decode reused")
+
+        # 別プロセス（別インスタンス）でもディスクから読める
+        other = ImageFetcher(cache_dir=cache_dir)
+        content, _ = other.fetch(f"{base}/red.jpg")
+        assert content == StandIn.images["/red.jpg"] and len(StandIn.requests) == 1
+        assert other.probe_size(f"{base}/red.jpg") == (64, 48) and len(StandIn.requests) == 1
+        print("✅ second fetcher reads the shared disk cache (fetch and probe_size)")
+
+        # max-age=0 の画像は毎回確かめ直し、変わっていなければ 304
+        fetcher.fetch(f"{base}/green.jpg")
+        fetcher.fetch(f"{base}/green.jpg")
+        path, etag, since = StandIn.requests[-1]
+        assert path == "/green.jpg" and etag and since == LAST_MODIFIED
+        assert fetcher.stats['revalidated'] == 1
+        print("✅ stale entry revalidated with If-None-Match / If-Modified-Since → 304")
+
+        # 中身が変わっていれば 200 で取り直す
+        StandIn.images["/green.jpg"] = make_image("yellow")
+        content, _ = fetcher.fetch(f"{base}/green.jpg")
+        assert content == StandIn.images["/green.jpg"]
+        print("✅ changed image re-downloaded after revalidation")
+
+        assert fetcher.fetch(f"{base}/missing.jpg") == (None, None)
+        print("✅ HTTP error returns (None, None)")
+
+        # サイズ上限を超えたら最後に使ったのが古いものから消す
+        size = len(StandIn.images["/red.jpg"])
+        small = ImageFetcher(cache_dir=tempfile.mkdtemp(prefix="image_cache_", dir=cache_dir), max_bytes=int(size * 2.5))
+        for name in ("red", "green", "blue"):
+            small.fetch(f"{base}/{name}.jpg")
+            time.sleep(0.01)
+        assert small.stats['evicted'] >= 1 and small._entry(f"{base}/red.jpg") is None
+        assert small._entry(f"{base}/blue.jpg") is not None
+        print("✅ LRU eviction keeps the cache under its size limit")
+
+        print(fetcher.report())
+        for f in (fetcher, other, small): f.close()
+    finally:
+        server.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import json
+import sys
+import time
+
+from clip_classifier import LABELS_X, ClipJudge, download_image
+
+# 使い方: python check_parity.py [画像URL ...]
+# torch版とONNX(int8)版で同じ画像を判定して、合否がどれだけ一致するかを見る。
+# どちらも本番と同じ入力にする（torch版 = 元の大きさでデコード、ONNX版 = draft で縮小デコード）。
+# URLを渡さなければ collect.json の先頭 SAMPLE_SIZE 件を使う
+INPUT_FILE = 'collect.json'
+SAMPLE_SIZE = 100
+MEMBER = "VSPO"
+
+def sample_images():
+    urls = sys.argv[1:]
+    if urls: return [(url, MEMBER) for url in urls]
+    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    pairs = []
+    for item in data:
+        if item.get('images'):
+            pairs.append((item['images'][0], item.get('member_name') or MEMBER))
+        if len(pairs) >= SAMPLE_SIZE: break
+    return pairs
+
+def run(kind, pairs):
+    judge = ClipJudge(LABELS_X, use_cache=False, backend=kind)
+    if not judge.available or judge.backend.impl.name != kind:
+        print(f"❌ {kind} backend is not available")
+        return None
+    started = time.perf_counter()
+    verdicts = judge.judge(pairs)
+    per_image = (time.perf_counter() - started) / max(1, len(pairs)) * 1000
+    print(f"⏱️ {kind}: load {judge.backend.load_seconds:.1f}s, {per_image:.0f} ms/image")
+    return verdicts
+
+def main():
+    full, reduced = [], []
+    for url, member in sample_images():
+        try:
+            image, _ = download_image(url, draft_size=0)
+            small, _ = download_image(url)
+        except Exception as e:
+            print(f"⚠️ Skip {url}: {e}")
+            continue
+        if image is not None:
+            full.append((image, member))
+            reduced.append((small, member))
+    print(f"🖼️ {len(full)} images")
+    if not full: return
+
+    reference = run("torch", full)
+    candidate = run("onnx", reduced)
+    if reference is None or candidate is None: return
+
+    disagreements = [i for i, (a, b) in enumerate(zip(reference, candidate)) if a.accepted != b.accepted]
+    agreement = 1 - len(disagreements) / len(full)
+    print(f"📊 accept/reject agreement: {agreement:.1%} ({len(disagreements)} disagreements)")
+    for i in disagreements:
+        a, b = reference[i], candidate[i]
+        print(f"   #{i}: torch={a.accepted} ({a.top_index}, {a.top_score:.2f}) onnx={b.accepted} ({b.top_index}, {b.top_score:.2f})")
+
+if __name__ == "__main__":
+    main()
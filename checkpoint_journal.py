@@ -0,0 +1,108 @@
+import json
+import os
+import time
+
+# 長く走るジョブ（fetch_metrics / fetch_authors / clean_data）の途中経過を残す追記専用の journal。
+# 1件処理するごとに「何をどう変えたか」を1行追記するだけなので、チェックポイントは O(1)。
+# ジョブが途中で止められても、次の実行は journal にある分を飛ばして続きから始め、
+# 最後に fold_into() でストアへまとめて反映してから clear() する。
+# GitHub Actions では journals/ をキャンセル・タイムアウト時にも保存する（if: always() の cache/save）
+JOURNAL_DIR = os.environ.get("JOURNAL_DIR", "journals")
+FSYNC_EVERY = int(os.environ.get("JOURNAL_FSYNC_EVERY", 20)) # これだけ追記するごとにディスクまで書き切る
+
+class Journal:
+    """
+    1行目はヘッダ（ジョブ名と設定）、2行目以降が1件ずつのエントリ:
+      {"key": URL など, "ts": 時刻, "fields": {変えた項目: 値（None は項目を消す）}}
+      {"key": URL, "ts": 時刻, "delete": true}
+      ほかの項目は自由（fetch_authors のフォロワー数など、ストア以外に反映するもの）
+    設定（config）が前回と違えば、前回の journal は使わずに捨てる
+    """
+
+    def __init__(self, job, config=None, directory=JOURNAL_DIR):
+        self.job = job
+        self.config = config
+        self.path = os.path.join(directory, f"{job}.jsonl")
+        self.entries = {}  # key → 最後のエントリ
+        os.makedirs(directory, exist_ok=True)
+        valid_size = self._load()
+        with open(self.path, 'ab'):
+            pass
+        self._file = open(self.path, 'r+b')
+        # 書き込みの途中で落ちた最後の行は切り捨てる
+        self._file.truncate(valid_size)
+        self._file.seek(valid_size)
+        if valid_size == 0:
+            self._write({"job": job, "config": config, "started": time.time()})
+        self._unsynced = 0
+        if self.entries:
+            print(f"📒 Resuming {job}: {len(self.entries)} entries from {self.path}")
+
+    def _load(self):
+        """前回の journal を読み込んで、正しく書けている所までのバイト数を返す"""
+        if not os.path.exists(self.path): return 0
+        with open(self.path, 'rb') as f:
+            raw = f.read()
+        offset = 0
+        for line in raw.splitlines(keepends=True):
+            if not line.endswith(b'\n'): break
+            try: entry = json.loads(line)
+            except ValueError: break
+            if offset == 0 and (entry.get('job') != self.job or entry.get('config') != self.config):
+                print(f"🧹 {self.path} was written with different settings, starting over")
+                return 0
+            if offset > 0: self.entries[entry['key']] = entry
+            offset += len(line)
+        return offset
+
+    def _write(self, entry):
+        self._file.write((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8'))
+        self._file.flush()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def record(self, key, fields=None, delete=False, **extra):
+        """1件分の結果を追記する"""
+        entry = {"key": key, "ts": time.time(), **extra}
+        if fields is not None: entry['fields'] = fields
+        if delete: entry['delete'] = True
+        self.entries[key] = entry
+        self._write(entry)
+        self._unsynced += 1
+        if self._unsynced >= FSYNC_EVERY:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def fold_into(self, store):
+        """
+        journal の内容を RecordStore に反映する（何回呼んでも同じ結果になる）。
+        (更新した行数, 削除した行数) を返す
+        """
+        deletes = [key for key, e in self.entries.items() if e.get('delete')]
+        updates = {key: e['fields'] for key, e in self.entries.items() if e.get('fields') and not e.get('delete')}
+        changed = []
+        for url, record in store.get_many(updates).items():
+            for name, value in updates[url].items():
+                if value is None: record.pop(name, None)
+                else: record[name] = value
+            changed.append(record)
+        updated = store.upsert_many(changed) if changed else 0
+        removed = store.delete(deletes) if deletes else 0
+        return updated, removed
+
+    def clear(self):
+        """ストアに反映し終わったら消す（次の実行は最初から）"""
+        self.close()
+        try: os.remove(self.path)
+        except OSError: pass
+        self.entries = {}
+
+    def close(self):
+        if self._file.closed: return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
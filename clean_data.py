@@ -1,67 +1,70 @@
-import json
+import itertools
 import os
-import requests
-from io import BytesIO
-from PIL import Image
-import torch
-from transformers import CLIPProcessor, CLIPModel
+import time
+from collections import Counter
+from clip_classifier import ClipJudge, LABELS_STRICT, MemberJudge
+from image_fetcher import shared_fetcher
+from record_store import RecordStore
+from checkpoint_journal import Journal
+from time_budget import TimeBudget
 
 # --- 設定 ---
-MODEL_ID = "openai/clip-vit-base-patch32"
 # 判定の厳しさ（0.6 ~ 0.8 推奨）
 CONFIDENCE_THRESHOLD = 0.70 
-
-print("🚀 Loading CLIP model...")
-model = CLIPModel.from_pretrained(MODEL_ID)
-processor = CLIPProcessor.from_pretrained(MODEL_ID)
-
-def check_image_locally(image_url, member_name):
-    try:
-        # 1. 画像取得
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(image_url, headers=headers, timeout=10)
-        if response.status_code != 200:
-            return False
-        
-        image = Image.open(BytesIO(response.content)).convert("RGB")
-
-        # 2. ラベル定義（ここが精度向上のカギ！）
-        # 0番目: 正解（少し具体的に書く）
-        # 1番目以降: 間違いの選択肢（よく混ざる作品名を名指しする）
-        labels = [
-            f"a high quality cosplay photo of {member_name} from VSPO VTuber group", # 正解
-            "Demon Slayer Kimetsu no Yaiba cosplay", # 鬼滅
-            "Genshin Impact or Honkai Star Rail character", # 原神・スタレ
-            "generic anime girl figure or drawing", # フィギュア・絵
-            "screenshot of text or game UI or twitter timeline" # スクショ
-        ]
-
-        # 3. AI推論
-        inputs = processor(text=labels, images=image, return_tensors="pt", padding=True)
-        with torch.no_grad():
-            outputs = model(**inputs)
-        
-        # 確率計算
-        probs = outputs.logits_per_image.softmax(dim=1)
-        
-        # ★ ここで変数を定義（前回のエラー箇所修正）
-        top_index = probs.argmax().item()
-        top_score = probs[0][top_index].item()
-
-        # 4. 判定ロジック
-        # 「0番目（正解）が選ばれた」 かつ 「確信度が閾値を超えている」 場合のみ合格
-        if top_index == 0 and top_score > CONFIDENCE_THRESHOLD:
-            print(f"✅ OK ({member_name}) - Score: {top_score:.2f}")
-            return True
-        else:
-            # 何と間違えたか表示（デバッグ用）
-            rejected_reason = labels[top_index] if top_index < len(labels) else "Unknown"
-            print(f"🗑️ REJECT - Score: {top_score:.2f} (Matched: {rejected_reason})")
-            return False
-
-    except Exception as e:
-        print(f"⚠️ Error checking {image_url}: {e}")
-        return True # エラー時は安全のため残す
+# "strict": 検索したメンバー vs 間違いの選択肢
+# "members": members.json の全メンバー + 間違いの選択肢（別メンバーのコスプレが紛れ込んだものも見つける）
+MODE = os.environ.get("CLEAN_MODE", "strict")
+# members モードで、別メンバーである確率（メンバーの中での割合）がこれ以上なら member_name を付け替える。
+# 未満なら suggested_member を付けて要確認にするだけ
+REASSIGN_THRESHOLD = float(os.environ.get("CLEAN_REASSIGN_THRESHOLD", "0.8"))
+# 1回の実行で使う時間（秒）。GitHub Actions の6時間制限に、セットアップとモデルの書き出しの分を残した値。
+# 間に合わない分は journal に載らないので、次の実行がそこから続ける
+TIME_BUDGET = int(os.environ.get("CLEAN_TIME_BUDGET", 5 * 3600))
+
+# ラベル定義（ここが精度向上のカギ！）は clip_classifier.LABELS_STRICT を参照
+# 0番目: 正解 / 1番目以降: よく混ざる作品名を名指しした間違いの選択肢
+if MODE == "members":
+    judge = MemberJudge(LABELS_STRICT, threshold=CONFIDENCE_THRESHOLD)
+else:
+    judge = ClipJudge(LABELS_STRICT, threshold=CONFIDENCE_THRESHOLD)
+
+def report(item, verdict):
+    """判定結果をログに出す（デバッグ用）"""
+    member_name = item['member_name']
+    if verdict.error:
+        print(f"⚠️ Error checking {item['images'][0]}: {verdict.error}")
+    elif verdict.accepted and verdict.top_index < 0:
+        print(f"✅ OK ({member_name}) - Not judged (model unavailable)")
+    elif verdict.accepted:
+        print(f"✅ OK ({member_name}) - Score: {verdict.top_score:.2f}")
+    elif verdict.duplicate_of:
+        print(f"🔁 REJECT - Duplicate of {verdict.duplicate_of}")
+    elif verdict.top_index < 0:
+        print("🗑️ REJECT - Download failed")
+    else:
+        # 何と間違えたか表示
+        labels = judge.label_texts(member_name)
+        rejected_reason = labels[verdict.top_index] if verdict.top_index < len(labels) else "Unknown"
+        print(f"🗑️ REJECT - Score: {verdict.top_score:.2f} (Matched: {rejected_reason})")
+
+def check_member(item, verdict):
+    """
+    members モードで、一番近いメンバーが member_name と違うレコードを付け替えるか要確認にする。
+    レコードを書き換えたら 'reassigned' / 'flagged' / 'cleared'（要確認を外した）、そのままなら None
+    """
+    if not verdict.accepted or verdict.member is None: return None
+    if verdict.member == item['member_name']:
+        return 'cleared' if item.pop('suggested_member', None) is not None else None
+    if verdict.member_score >= REASSIGN_THRESHOLD:
+        print(f"   🔀 Reassign {item['member_name']} → {verdict.member} ({verdict.member_score:.2f})")
+        item.setdefault('original_member_name', item['member_name'])
+        item['member_name'] = verdict.member
+        item.pop('suggested_member', None)
+        return 'reassigned'
+    if item.get('suggested_member') == verdict.member: return None
+    print(f"   🚩 Maybe {verdict.member} ({verdict.member_score:.2f}), filed under {item['member_name']}")
+    item['suggested_member'] = verdict.member
+    return 'flagged'
 
 def main():
     data_file = 'collect.json'
@@ -69,36 +72,55 @@ def main():
         print("collect.json not found.")
         return
 
-    # バックアップ作成
-    import shutil
-    shutil.copy('collect.json', 'collect_backup.json')
+    if not judge.available:
+        print("❌ CLIP model is not available. Abort.")
+        return
+    budget = TimeBudget("clean_data", TIME_BUDGET)
 
-    with open(data_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    store = RecordStore(json_path=data_file)
+    data = store.load()
+    # 1件判定するごとに結果を journal に1行追記する（途中で止められたら次の実行は続きから）。
+    # 設定を変えた時は前回の途中結果を使わない
+    journal = Journal('clean_data', config=f"{MODE}:{CONFIDENCE_THRESHOLD}:{REASSIGN_THRESHOLD}")
 
-    print(f"🔍 Cleaning {len(data)} items with Strict Mode (Threshold: {CONFIDENCE_THRESHOLD})...")
+    print(f"🔍 Cleaning {len(data)} items with {MODE} mode (Threshold: {CONFIDENCE_THRESHOLD}, Batch: {judge.batch_size})...")
     
-    cleaned_data = []
-    removed_count = 0
-
-    for i, item in enumerate(data):
-        if not item.get('images'):
-            cleaned_data.append(item)
-            continue
-            
+    targets = [item for item in data if item.get('images') and item['url'] not in journal]
+    # 推論はバッチ単位でまとめて走るので、次の1バッチが締め切りまでに終わる見込みの間だけ画像を流す
+    pulled = itertools.takewhile(lambda item: budget.can_start(judge.batch_size), targets)
+    verdicts = judge.judge_stream((item['images'][0], item['member_name']) for item in pulled)
+
+    # 画像なしのデータはそのまま残す
+    last = time.monotonic()
+    for i, (item, verdict) in enumerate(zip(targets, verdicts)):
+        now = time.monotonic()
+        budget.add(now - last)
+        last = now
         # 進行状況表示
-        if i % 10 == 0: print(f"Processing {i}/{len(data)}...")
-
-        if check_image_locally(item['images'][0], item['member_name']):
-            cleaned_data.append(item)
+        if i % 10 == 0: print(f"Processing {i}/{len(targets)}...")
+        report(item, verdict)
+        if not verdict.accepted:
+            journal.record(item['url'], delete=True, decision='rejected')
+        elif (change := check_member(item, verdict)):
+            fields = {k: item.get(k) for k in ('member_name', 'original_member_name', 'suggested_member')}
+            journal.record(item['url'], fields, decision=change)
         else:
-            removed_count += 1
-
-    with open(data_file, 'w', encoding='utf-8') as f:
-        json.dump(cleaned_data, f, ensure_ascii=False, indent=2)
-
-    print(f"\n✨ Done! Removed {removed_count} items.")
-    print(f"Original: {len(data)} -> Cleaned: {len(cleaned_data)}")
+            journal.record(item['url'], decision='kept')
+
+    # 消すのは不合格の行だけ（members モードで付け替え・要確認にした行は更新）。前回の途中結果もここで反映する
+    member_changes = Counter(e['decision'] for e in journal.entries.values() if e['decision'] not in ('rejected', 'kept'))
+    _, removed_count = journal.fold_into(store)
+    if member_changes: print(f"🔀 Member check: {dict(member_changes)}")
+    cleaned_count = store.export_json()
+    store.close()
+    # 時間切れで残りがあれば journal は残し、次の実行は判定済みの分を飛ばして続きから始める
+    if budget.exhausted: journal.close()
+    else: journal.clear()
+    budget.summary(len(targets) - budget.count)
+
+    print(f"\n✨ Done! Removed {removed_count} items. ({judge.stats()})")
+    print(shared_fetcher().report())
+    print(f"Original: {len(data)} -> Cleaned: {cleaned_count}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+# --- 設定 ---
+MODEL_ID = "openai/clip-vit-base-patch32"
+# "onnx" (int8量子化, 既定) か "torch" (元の実装, 比較用)
+BACKEND = os.environ.get("CLIP_BACKEND", "onnx")
+ONNX_DIR = os.environ.get("CLIP_ONNX_DIR", "clip_onnx") # export_onnx.py の出力先
+
+# CLIPの前処理（CLIPImageProcessor と同じ値）
+IMAGE_SIZE = 224
+IMAGE_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)
+IMAGE_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32)
+
+def _normalize(feats):
+    feats = np.asarray(feats, dtype=np.float32)
+    return feats / np.linalg.norm(feats, axis=-1, keepdims=True)
+
+def crop_pixels(image):
+    """
+    短辺224にバイキュービック縮小 → 中央切り抜き を1回の resize(box=...) で行い、[224, 224, 3] の uint8 にする。
+    縮小するのは切り抜く範囲だけ。グレースケールはここで3チャンネルに広げる（スレッドから呼んでよい）
+    """
+    w, h = image.size
+    scale = IMAGE_SIZE / min(w, h)
+    size = (IMAGE_SIZE, int(h * scale)) if w <= h else (int(w * scale), IMAGE_SIZE)
+    left = (size[0] - IMAGE_SIZE) // 2
+    top = (size[1] - IMAGE_SIZE) // 2
+    box = (left / scale, top / scale, (left + IMAGE_SIZE) / scale, (top + IMAGE_SIZE) / scale)
+    if image.mode not in ("RGB", "L"): image = image.convert("RGB")
+    pixels = np.asarray(image.resize((IMAGE_SIZE, IMAGE_SIZE), Image.BICUBIC, box=box))
+    if pixels.ndim == 2: pixels = np.repeat(pixels[:, :, None], 3, axis=2)
+    return pixels
+
+def preprocess(images):
+    """
+    画像（PIL か crop_pixels 済みの配列）のリストを正規化して [n, 3, 224, 224] にする。
+    正規化と並べ替えはバッチ全体で1回の NumPy 演算
+    """
+    batch = np.stack([image if isinstance(image, np.ndarray) else crop_pixels(image) for image in images])
+    batch = (batch.astype(np.float32) / 255.0 - IMAGE_MEAN) / IMAGE_STD
+    return np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+
+class TorchBackend:
+    """transformers + torch の元の実装（精度の基準）"""
+    name = "torch"
+
+    def __init__(self, num_threads=0):
+        import torch
+        from transformers import CLIPProcessor, CLIPModel
+        self.torch = torch
+        if num_threads > 0: torch.set_num_threads(num_threads)
+        self.model = CLIPModel.from_pretrained(MODEL_ID)
+        self.model.eval()
+        self.processor = CLIPProcessor.from_pretrained(MODEL_ID)
+        self.logit_scale = self.model.logit_scale.exp().item()
+        # キャッシュ照合用のモデルバージョン（HFのコミットハッシュ）
+        self.version = getattr(self.model.config, "_commit_hash", None) or "unknown"
+
+    def text_features(self, texts):
+        inputs = self.processor(text=texts, return_tensors="pt", padding=True)
+        with self.torch.no_grad():
+            feats = self.model.get_text_features(**inputs)
+        return _normalize(feats.numpy())
+
+    def image_features(self, images):
+        inputs = self.processor(images=images, return_tensors="pt")
+        with self.torch.no_grad():
+            feats = self.model.get_image_features(pixel_values=inputs["pixel_values"])
+        return _normalize(feats.numpy())
+
+class OnnxBackend:
+    """export_onnx.py で書き出した int8 量子化モデルを ONNX Runtime で動かす（torch不要）"""
+    name = "onnx"
+
+    def __init__(self, num_threads=0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        self.meta = read_onnx_meta()
+        options = ort.SessionOptions()
+        if num_threads > 0: options.intra_op_num_threads = num_threads
+        providers = ["CPUExecutionProvider"]
+        self.vision = ort.InferenceSession(os.path.join(ONNX_DIR, "vision_int8.onnx"), options, providers=providers)
+        self.text = ort.InferenceSession(os.path.join(ONNX_DIR, "text_int8.onnx"), options, providers=providers)
+        self.tokenizer = Tokenizer.from_file(os.path.join(ONNX_DIR, "tokenizer.json"))
+        self.tokenizer.enable_padding(pad_id=self.meta["pad_token_id"], pad_token=self.meta["pad_token"])
+        self.tokenizer.enable_truncation(self.meta["max_length"])
+        self.logit_scale = self.meta["logit_scale"]
+        self.version = onnx_version(self.meta)
+
+    def text_features(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feats = self.text.run(None, {"input_ids": input_ids, "attention_mask": attention_mask})[0]
+        return _normalize(feats)
+
+    def image_features(self, images):
+        feats = self.vision.run(None, {"pixel_values": preprocess(images)})[0]
+        return _normalize(feats)
+
+def read_onnx_meta():
+    with open(os.path.join(ONNX_DIR, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def onnx_version(meta):
+    return f"onnx-{meta['quantization']}:{meta['commit']}"
+
+def onnx_ready():
+    """ONNX版を使えるか（書き出し済みで onnxruntime が入っている）"""
+    if not os.path.exists(os.path.join(ONNX_DIR, "meta.json")): return False
+    try:
+        import onnxruntime, tokenizers
+        return True
+    except ImportError:
+        return False
+
+class LazyBackend:
+    """
+    最初に画像を判定する時まで読み込まないバックエンド。
+    members.json や auth.json が無くてすぐ終わる実行では torch も ONNX も読み込まない
+    """
+
+    def __init__(self, backend=BACKEND, num_threads=0):
+        self.requested = backend
+        self.num_threads = num_threads
+        self.impl = None
+        self.error = None
+        self.load_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def kind(self):
+        """実際に使うバックエンド名（ONNX版が用意されていなければ torch）"""
+        if self.requested == "onnx" and onnx_ready(): return "onnx"
+        return "torch"
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    def version(self):
+        """キャッシュ照合用のバージョン。ONNX版は meta.json だけで分かるのでモデルを読まない"""
+        if self.kind == "onnx": return onnx_version(read_onnx_meta())
+        impl = self.get()
+        return impl.version if impl else "unavailable"
+
+    def get(self):
+        """バックエンドを1回だけ読み込む（失敗時は None を返す）"""
+        with self._lock:
+            if self.impl is not None or self.error is not None:
+                return self.impl
+            kind = self.kind
+            if self.requested == "onnx" and kind != "onnx":
+                print(f"⚠️ ONNX model not found in {ONNX_DIR}/ (run export_onnx.py). Falling back to torch.")
+            print(f"🚀 Loading Local AI (CLIP, {kind})... This takes a moment.")
+            started = time.perf_counter()
+            try:
+                self.impl = (OnnxBackend if kind == "onnx" else TorchBackend)(self.num_threads)
+                self.load_seconds = time.perf_counter() - started
+                print(f"✅ CLIP Model Loaded! ({self.load_seconds:.1f}s)")
+            except Exception as e:
+                print(f"⚠️ Failed to load CLIP: {e}")
+                self.error = e
+            return self.impl
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+def shared_backend(backend=BACKEND, num_threads=0):
+    """同じプロセス内の ClipJudge どうしでモデルを1回だけ読み込むための共有インスタンス"""
+    with _shared_lock:
+        key = (backend, num_threads)
+        if key not in _shared:
+            _shared[key] = LazyBackend(backend, num_threads)
+        return _shared[key]
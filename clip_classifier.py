@@ -0,0 +1,334 @@
+import os
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from embedding_cache import EmbeddingCache
+from image_hash import dhash, phash
+from clip_backends import BACKEND, MODEL_ID, crop_pixels, shared_backend
+from image_fetcher import DRAFT_SIZE, shared_fetcher
+
+# --- 設定 ---
+MEMBERS_FILE = 'members.json'
+# MemberJudge の [ラベル数, dim] テキスト埋め込み（members.json・ラベル・モデルが変わった時だけ作り直す）
+MEMBER_TEXT_FILE = os.environ.get("CLIP_MEMBER_TEXT_FILE", "clip_member_text.npz")
+# 1回の画像側フォワードでまとめて処理する枚数
+BATCH_SIZE = int(os.environ.get("CLIP_BATCH_SIZE", "16"))
+# CPUランナー用のスレッド数 (0 = バックエンドのデフォルト)
+NUM_THREADS = int(os.environ.get("CLIP_NUM_THREADS", "0"))
+
+# 判定ラベル（英語のほうが精度が良い）
+# 0番目が「正解」、それ以外は間違いの選択肢。{member} にメンバー名が入る
+LABELS_X = [
+    "a cosplay photo of {member}",
+    "a screenshot of a video game or anime",
+    "text or merchandise or random object"
+]
+LABELS_INSTAGRAM = [
+    "a cosplay photo of {member}",
+    "game screenshot or text",
+    "random object"
+]
+LABELS_STRICT = [
+    "a high quality cosplay photo of {member} from VSPO VTuber group", # 正解
+    "Demon Slayer Kimetsu no Yaiba cosplay", # 鬼滅
+    "Genshin Impact or Honkai Star Rail character", # 原神・スタレ
+    "generic anime girl figure or drawing", # フィギュア・絵
+    "screenshot of text or game UI or twitter timeline" # スクショ
+]
+
+# accepted: 合格か / top_index: 一番高かったラベル / top_score: その確率 / error: 例外メッセージ
+# duplicate_of: 既存画像の転載としてCLIPの前に弾いた場合、その元のURL
+# member / member_score: MemberJudge で一番近かったメンバーと、メンバーの中でのその確率
+Verdict = namedtuple('Verdict', ['accepted', 'top_index', 'top_score', 'error', 'duplicate_of', 'member', 'member_score'],
+                     defaults=(None, None, None))
+# 推論前の下ごしらえ結果。verdict があれば判定済み、vector ならキャッシュ済み、image なら要推論
+# phash / dhash はダウンロードした時だけ入る（image_hash。URLでキャッシュに当たった時は with_hashes=True の時だけ）
+Prepared = namedtuple('Prepared', ['url', 'member_name', 'verdict', 'vector', 'image', 'content_hash', 'phash', 'dhash'],
+                      defaults=(None, None))
+
+def download_image(image_url, timeout=10, draft_size=DRAFT_SIZE):
+    """
+    画像を取得して (RGB画像, コンテンツハッシュ) を返す。HTTPエラー時は (None, None)。
+    共有の image_fetcher を通すので、他のスクリプトが取った画像はディスクキャッシュから読む。
+    JPEG は draft_size まで縮小してデコードする（0 なら元の大きさ）
+    """
+    return shared_fetcher().image(image_url, timeout, draft_size)
+
+def softmax(x):
+    x = x - x.max(axis=-1, keepdims=True)
+    e = np.exp(x)
+    return e / e.sum(axis=-1, keepdims=True)
+
+class ClipJudge:
+    """
+    (画像, メンバー名) のペアをまとめてCLIPで判定する。
+    テキスト側の埋め込みはメンバーごとに1回だけ計算して使い回す。
+    use_cache=True なら画像埋め込みを EmbeddingCache に読み書きし、
+    一度見た画像はダウンロードも画像側フォワードもせずに判定する。
+    モデルは最初に推論が必要になった時に読み込む（clip_backends.LazyBackend, プロセス内で共有）。
+    """
+
+    def __init__(self, labels, threshold=None, batch_size=BATCH_SIZE, num_threads=NUM_THREADS,
+                 use_cache=True, backend=BACKEND):
+        self.labels = labels
+        self.threshold = threshold
+        self.batch_size = max(1, batch_size)
+        self.backend = shared_backend(backend, num_threads) # X と Instagram を同時に回してもモデルは1つ
+        self.use_cache = use_cache
+        self._cache = None
+        self._cache_lock = threading.Lock()
+        self._text_cache = {}
+        self.images_embedded = 0
+        self.embed_seconds = 0.0
+
+    @property
+    def available(self):
+        return self.backend.get() is not None
+
+    @property
+    def cache(self):
+        if not self.use_cache or self.backend.failed: return None
+        with self._cache_lock:
+            if self._cache is None:
+                version = self.backend.version() # torch版はここでモデルを読み込む
+                if self.backend.failed: return None
+                self._cache = EmbeddingCache(MODEL_ID, version)
+        return self._cache
+
+    @property
+    def logit_scale(self):
+        return self.backend.get().logit_scale
+
+    def label_texts(self, member_name):
+        return [label.format(member=member_name) for label in self.labels]
+
+    def _text_features(self, member_name):
+        """メンバーのラベル一式のテキスト埋め込み（正規化済み）"""
+        if member_name not in self._text_cache:
+            self._text_cache[member_name] = self.backend.get().text_features(self.label_texts(member_name))
+        return self._text_cache[member_name]
+
+    def embed_images(self, images):
+        """画像のリストを1回のフォワードで埋め込みに変換する（正規化済み, [n, dim]）"""
+        started = time.perf_counter()
+        feats = self.backend.get().image_features(images)
+        self.embed_seconds += time.perf_counter() - started
+        self.images_embedded += len(images)
+        return feats
+
+    def score(self, image_feats, member_names):
+        """画像埋め込み [n, dim] とメンバーごとのテキスト埋め込みの行列積で判定を出す"""
+        image_feats = np.asarray(image_feats, dtype=np.float32)
+        verdicts = [None] * len(member_names)
+        by_member = {}
+        for i, member_name in enumerate(member_names):
+            by_member.setdefault(member_name, []).append(i)
+
+        for member_name, rows in by_member.items():
+            probs = softmax(self.logit_scale * image_feats[rows] @ self._text_features(member_name).T)
+            top_indices = probs.argmax(axis=1)
+            for row, probs_row, top_index in zip(rows, probs, top_indices):
+                top_score = float(probs_row[top_index])
+                accepted = top_index == 0
+                if self.threshold is not None:
+                    accepted = accepted and top_score > self.threshold
+                verdicts[row] = Verdict(bool(accepted), int(top_index), top_score, None)
+        return verdicts
+
+    def judge(self, pairs, keys=None):
+        """
+        (PIL画像, メンバー名) のリストを batch_size ごとに判定する。
+        keys に (URL, コンテンツハッシュ) を渡すと埋め込みをキャッシュに保存する
+        """
+        pairs = list(pairs)
+        if not self.available:
+            return [Verdict(True, -1, 0.0, None) for _ in pairs] # モデルなしはスルーして保存
+
+        verdicts = []
+        for start in range(0, len(pairs), self.batch_size):
+            chunk = pairs[start:start + self.batch_size]
+            try:
+                feats = self.embed_images([image for image, _ in chunk])
+                verdicts.extend(self.score(feats, [member for _, member in chunk]))
+            except Exception as e:
+                # エラー時は安全のため残す
+                verdicts.extend(Verdict(True, -1, 0.0, str(e)) for _ in chunk)
+                continue
+            if self.cache is not None and keys is not None:
+                for (url, content_hash), feat in zip(keys[start:start + self.batch_size], feats):
+                    self.cache.put(url, content_hash, feat)
+        return verdicts
+
+    def load_image(self, image_url):
+        """
+        バックエンドに合わせて画像を取得し、(画像, embed_images に渡す形, コンテンツハッシュ) を返す。取れなければ全部 None。
+        ONNX版は縮小デコードして縮小・切り抜きもここ（呼び出し側のスレッド）で済ませ、推論側は正規化だけにする。
+        torch版は精度の基準なので、元の大きさの画像をそのまま CLIPProcessor に渡す。
+        埋め込みをキャッシュに入れる所は必ずこれを通す（同じキーに違う前処理の埋め込みが混ざらないように）
+        """
+        onnx = self.backend.kind == "onnx"
+        image, content_hash = download_image(image_url, draft_size=DRAFT_SIZE if onnx else 0)
+        if image is None: return None, None, None
+        return image, crop_pixels(image) if onnx else image, content_hash
+
+    def prepare(self, image_url, member_name, with_hashes=False):
+        """
+        キャッシュ参照とダウンロードだけを行う（推論はしないのでスレッドから呼んでよい）。
+        with_hashes=True なら、URLで埋め込みキャッシュに当たった時も画像を取って知覚ハッシュを付ける（転載チェック用）
+        """
+        try:
+            cached = self.cache.get(image_url) if self.cache is not None else None
+            if cached is not None:
+                if not with_hashes:
+                    return Prepared(image_url, member_name, None, cached, None, None)
+                # ハッシュ用なので縮小デコードで足りる（画像はたいてい image_fetcher のディスクキャッシュにある）
+                image, content_hash = download_image(image_url)
+                if image is None:
+                    return Prepared(image_url, member_name, None, cached, None, None)
+                return Prepared(image_url, member_name, None, cached, None, content_hash, phash(image), dhash(image))
+            if self.backend.failed:
+                return Prepared(image_url, member_name, Verdict(True, -1, 0.0, None), None, None, None)
+
+            image, pixels, content_hash = self.load_image(image_url)
+            if image is None:
+                return Prepared(image_url, member_name, Verdict(False, -1, 0.0, None), None, None, None)
+
+            # 転載チェック用の知覚ハッシュもここで計算しておく
+            p, d = phash(image), dhash(image)
+
+            # 別URLで同じ画像を既に見ていれば再利用
+            cached = self.cache.get_by_hash(content_hash) if self.cache is not None else None
+            if cached is not None:
+                self.cache.put(image_url, content_hash, cached)
+                return Prepared(image_url, member_name, None, cached, None, content_hash, p, d)
+            return Prepared(image_url, member_name, None, None, pixels, content_hash, p, d)
+        except Exception as e:
+            # エラー時は安全のため残す
+            return Prepared(image_url, member_name, Verdict(True, -1, 0.0, str(e)), None, None, None)
+
+    def judge_prepared(self, prepared):
+        """prepare() の結果のリストを入力順の Verdict にする（画像は batch_size ごとに推論）"""
+        verdicts = [p.verdict for p in prepared]
+
+        cached_rows = [i for i, p in enumerate(prepared) if p.verdict is None and p.vector is not None]
+        if cached_rows:
+            feats = np.stack([prepared[i].vector for i in cached_rows])
+            try:
+                scored = self.score(feats, [prepared[i].member_name for i in cached_rows])
+            except Exception as e:
+                # モデルが読み込めなかった時など。エラー時は安全のため残す
+                scored = [Verdict(True, -1, 0.0, str(e)) for _ in cached_rows]
+            for i, verdict in zip(cached_rows, scored):
+                verdicts[i] = verdict
+
+        image_rows = [i for i, p in enumerate(prepared) if p.verdict is None and p.vector is None]
+        if image_rows:
+            fresh = self.judge(
+                [(prepared[i].image, prepared[i].member_name) for i in image_rows],
+                keys=[(prepared[i].url, prepared[i].content_hash) for i in image_rows]
+            )
+            for i, verdict in zip(image_rows, fresh):
+                verdicts[i] = verdict
+        return verdicts
+
+    def judge_stream(self, pairs):
+        """
+        (画像URL, メンバー名) を順に受け取り、推論待ちの画像が batch_size 枚たまるごとに判定して
+        入力と同じ順番で Verdict を返すジェネレータ。
+        キャッシュにある画像はダウンロードせず、保存済みの埋め込みとの行列積だけで判定する
+        """
+        pending = []
+        waiting_images = 0
+        for image_url, member_name in pairs:
+            prepared = self.prepare(image_url, member_name)
+            pending.append(prepared)
+            if prepared.image is not None:
+                waiting_images += 1
+            if waiting_images >= self.batch_size:
+                yield from self.judge_prepared(pending)
+                pending, waiting_images = [], 0
+        if pending:
+            yield from self.judge_prepared(pending)
+
+    def judge_urls(self, pairs):
+        return list(self.judge_stream(pairs))
+
+    def stats(self):
+        """読み込み時間・1枚あたりの推論時間・キャッシュのヒット数"""
+        if self.backend.impl is None:
+            model = "model: not loaded"
+        else:
+            per_image = self.embed_seconds / self.images_embedded * 1000 if self.images_embedded else 0.0
+            model = (f"{self.backend.impl.name}: loaded in {self.backend.load_seconds:.1f}s, "
+                     f"{self.images_embedded} images, {per_image:.0f} ms/image")
+        if self._cache is None: return f"{model} / cache: off"
+        return f"{model} / cache: {self._cache.hits} hits / {self._cache.misses} misses ({len(self._cache)} stored)"
+
+
+class MemberJudge(ClipJudge):
+    """
+    members.json の全メンバー + 間違いの選択肢 を1本のラベル行列にして判定する。
+    画像側のフォワードは ClipJudge と同じ1回で、テキスト側は [ラベル数, dim] の行列積が1回増えるだけ。
+    合格 = メンバーのどれかのラベルが1位（threshold があればメンバーの確率の合計がそれを超える）。
+    verdict.member は一番近いメンバーで、検索したメンバーと違えば付け替え・要確認の候補になる
+    """
+
+    def __init__(self, labels=LABELS_STRICT, members_path=MEMBERS_FILE, text_path=MEMBER_TEXT_FILE, **kwargs):
+        # labels[0] はメンバーごとのラベル、labels[1:] は間違いの選択肢
+        super().__init__(labels, **kwargs)
+        self.members_path = members_path
+        self.text_path = text_path
+        with open(members_path, 'r', encoding='utf-8') as f:
+            self.members_bytes = f.read().encode('utf-8')
+        self.members = [m['name'] for m in json.loads(self.members_bytes)]
+        self._matrix = None
+
+    def label_texts(self, member_name=None):
+        """全ラベル（0 .. メンバー数-1 がメンバー、その後ろが間違いの選択肢）"""
+        return [self.labels[0].format(member=m) for m in self.members] + list(self.labels[1:])
+
+    def _matrix_key(self):
+        h = hashlib.sha1(self.members_bytes)
+        h.update("\n".join(self.labels).encode('utf-8'))
+        h.update(f"{MODEL_ID}:{self.backend.version()}".encode('utf-8'))
+        return h.hexdigest()
+
+    def text_matrix(self):
+        """[ラベル数, dim] のテキスト埋め込み（ディスクにキャッシュ）"""
+        if self._matrix is not None: return self._matrix
+        key = self._matrix_key()
+        if os.path.exists(self.text_path):
+            try:
+                saved = np.load(self.text_path)
+                if str(saved['key']) == key: self._matrix = saved['matrix']
+            except Exception:
+                pass
+        if self._matrix is None:
+            self._matrix = np.asarray(self.backend.get().text_features(self.label_texts()), dtype=np.float32)
+            np.savez(self.text_path, key=key, matrix=self._matrix)
+            print(f"🧾 Built member text matrix: {self._matrix.shape[0]} labels ({len(self.members)} members)")
+        return self._matrix
+
+    def score(self, image_feats, member_names):
+        image_feats = np.asarray(image_feats, dtype=np.float32)
+        n_members = len(self.members)
+        probs = softmax(self.logit_scale * image_feats @ self.text_matrix().T)
+        member_probs = probs[:, :n_members]
+        member_total = member_probs.sum(axis=1)
+        top_indices = probs.argmax(axis=1)
+        best = member_probs.argmax(axis=1)
+
+        verdicts = []
+        for i in range(len(member_names)):
+            accepted = top_indices[i] < n_members
+            if self.threshold is not None:
+                accepted = accepted and member_total[i] > self.threshold
+            verdicts.append(Verdict(
+                bool(accepted), int(top_indices[i]), float(probs[i, top_indices[i]]), None,
+                member=self.members[best[i]], member_score=float(member_probs[i, best[i]] / max(member_total[i], 1e-12))
+            ))
+        return verdicts
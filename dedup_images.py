@@ -0,0 +1,82 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from image_fetcher import shared_fetcher
+from image_hash import DEDUP_RADIUS, DuplicateIndex, dhash, from_hex, phash, to_hex
+from record_store import RecordStore
+
+# collect.json の既存レコードに知覚ハッシュを付け、転載・再投稿をまとめる（オフライン用）
+# 各グループの最初のレコード（保存順）を元とし、それ以外に duplicate_of を付ける。analyze_data は duplicate_of 付きを数えない
+LIMIT = int(os.environ.get("DEDUP_LIMIT", 0)) # 1回でハッシュを計算する上限（0 = 未計算分すべて）
+HASH_WORKERS = 16
+
+def hash_image(url):
+    image, _ = shared_fetcher().image(url)
+    if image is None: return None
+    return phash(image), dhash(image)
+
+def add_hashes(targets):
+    """targets の画像をダウンロードして phash / dhash を付ける。付けたレコードのリストを返す"""
+    updated = []
+    with ThreadPoolExecutor(HASH_WORKERS) as pool:
+        futures = [pool.submit(hash_image, item['images'][0]) for item in targets]
+        for item, future in zip(targets, futures):
+            try:
+                hashes = future.result()
+            except Exception as e:
+                print(f"  ❌ Skip {item['images'][0]}: {e}")
+                continue
+            if not hashes: continue
+            item['phash'], item['dhash'] = to_hex(hashes[0]), to_hex(hashes[1])
+            updated.append(item)
+            if len(updated) % 100 == 0: print(f"  [{len(updated)}/{len(targets)}] hashed")
+    return updated
+
+def cluster(data, radius=DEDUP_RADIUS):
+    """
+    保存順に見ていき、既に索引にある画像と近ければそのグループに入れる。
+    {元のURL: [重複のURL, ...]} を返す
+    """
+    index = DuplicateIndex(radius)
+    groups = {}
+    for item in data:
+        if not (item.get('phash') and item.get('dhash')): continue
+        original = index.check_and_add(from_hex(item['phash']), from_hex(item['dhash']), item['url'])
+        if original is not None:
+            groups.setdefault(original, []).append(item['url'])
+    return groups
+
+def dedup_images():
+    file_path = 'collect.json'
+    if not os.path.exists(file_path): return
+
+    store = RecordStore(json_path=file_path)
+    data = store.load()
+
+    targets = [item for item in data if item.get('images') and not item.get('phash')]
+    if LIMIT: targets = targets[:LIMIT]
+    print(f"🔑 知覚ハッシュ未計算: {len(targets)} 件")
+    changed = {item['url']: item for item in add_hashes(targets)}
+
+    groups = cluster(data)
+    duplicate_of = {dup: original for original, dups in groups.items() for dup in dups}
+    for item in data:
+        expected = duplicate_of.get(item['url'])
+        if item.get('duplicate_of') != expected:
+            if expected: item['duplicate_of'] = expected
+            else: item.pop('duplicate_of', None)
+            changed[item['url']] = item
+
+    for original, dups in sorted(groups.items(), key=lambda kv: -len(kv[1]))[:20]:
+        print(f"  🔁 {original} ← {len(dups)} 件")
+    print(f"📊 {len(groups)} グループ / 重複 {len(duplicate_of)} 件 (半径 {DEDUP_RADIUS})")
+
+    if changed:
+        store.upsert_many(changed.values())
+        store.export_json()
+    store.close()
+    print(f"✨ 完了！ {len(changed)} 件を更新しました。")
+    print(shared_fetcher().report())
+
+if __name__ == "__main__":
+    dedup_images()
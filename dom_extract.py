@@ -0,0 +1,76 @@
+import re
+
+# ページ内の要素は1回の eval_on_selector_all でまとめて読む（要素ごとに await するとCDPの往復が増える）
+# セレクタが変わったらここだけ直せばよい
+X_SELECTORS = {
+    "tweet": 'article[data-testid="tweet"]',
+    "text": '[data-testid="tweetText"]',
+    "photo": 'div[data-testid="tweetPhoto"] img',
+    "link": 'a[href*="/status/"]',
+    "like": '[data-testid="like"]',
+    "views": 'a[href$="/analytics"]',
+}
+INSTAGRAM_SELECTORS = {
+    "post": 'a[href*="/p/"]',
+}
+
+_TWEETS_JS = """(tweets, sel) => tweets.map(tweet => {
+    const attr = (s, name) => { const el = tweet.querySelector(s); return el ? el.getAttribute(name) : null; };
+    const text = tweet.querySelector(sel.text);
+    return {
+        text: text ? text.innerText : "",
+        images: Array.from(tweet.querySelectorAll(sel.photo)).map(img => img.getAttribute('src')).filter(Boolean),
+        href: attr(sel.link, 'href'),
+        like_label: attr(sel.like, 'aria-label'),
+        views_label: attr(sel.views, 'aria-label'),
+    };
+})"""
+
+_POSTS_JS = """posts => posts.map(post => {
+    const img = post.querySelector('img');
+    return {
+        has_img: img !== null,
+        href: post.getAttribute('href'),
+        src: img ? img.getAttribute('src') : null,
+        alt: img ? img.getAttribute('alt') : null,
+    };
+})"""
+
+METRIC_RE = re.compile(r'(\d[\d,.]*[KkMm万]?)')
+
+# 数値変換
+def parse_metric(text):
+    if not text: return 0
+    text = text.replace(',', '').strip()
+    try:
+        if '万' in text: return int(float(text.replace('万', '')) * 10000)
+        if 'K' in text: return int(float(text.replace('K', '')) * 1000)
+        if 'M' in text: return int(float(text.replace('M', '')) * 1000000)
+        return int(''.join(filter(str.isdigit, text)) or 0)
+    except: return 0
+
+def metric_from_label(aria):
+    """'123 Likes. Like' のような aria-label から数値を取り出す"""
+    if not aria: return 0
+    match = METRIC_RE.search(aria)
+    return parse_metric(match.group(1)) if match else 0
+
+async def extract_tweets(page):
+    """表示中のツイートを上から順に {text, images, url, likes, views} のリストで返す（1往復）"""
+    raw = await page.eval_on_selector_all(X_SELECTORS["tweet"], _TWEETS_JS, X_SELECTORS)
+    return [{
+        "text": r["text"] or "",
+        "images": r["images"],
+        "url": f"https://x.com{r['href']}" if r["href"] else "",
+        "likes": metric_from_label(r["like_label"]),
+        "views": metric_from_label(r["views_label"]),
+    } for r in raw]
+
+async def extract_posts(page):
+    """表示中のInstagram投稿を上から順に {url, image, caption} のリストで返す（1往復、画像なしは除く）"""
+    raw = await page.eval_on_selector_all(INSTAGRAM_SELECTORS["post"], _POSTS_JS)
+    return [{
+        "url": f"https://www.instagram.com{r['href']}",
+        "image": r["src"],
+        "caption": r["alt"] or "",
+    } for r in raw if r["has_img"]]
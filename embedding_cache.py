@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+
+# --- 設定 ---
+CACHE_FILE = os.environ.get("CLIP_CACHE_FILE", "clip_embeddings.sqlite")
+
+class EmbeddingCache:
+    """
+    CLIPの画像埋め込みを画像URLとコンテンツハッシュで保存するSQLiteストア。
+    モデルIDとバージョンが一致するものだけを返すので、モデルを変えたら自然に無効化される。
+    """
+
+    def __init__(self, model_id, model_version, path=CACHE_FILE):
+        self.model_id = model_id
+        self.model_version = model_version
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                url TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                model_id TEXT NOT NULL,
+                model_version TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (url, model_id, model_version)
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_hash ON embeddings (content_hash, model_id, model_version)"
+        )
+        self._conn.commit()
+
+    def _fetch(self, column, value):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT vector FROM embeddings WHERE {column} = ? AND model_id = ? AND model_version = ? LIMIT 1",
+                (value, self.model_id, self.model_version)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def get(self, url):
+        """URLで引く（ダウンロード前に使う）"""
+        return self._fetch("url", url)
+
+    def get_by_hash(self, content_hash):
+        """画像の中身のハッシュで引く（URLが違う同一画像用）"""
+        return self._fetch("content_hash", content_hash)
+
+    def get_many(self, urls):
+        """URLのリストをまとめて引いて {URL: 埋め込み} を返す（類似画像検索の行列作り用）"""
+        urls = list(dict.fromkeys(urls))
+        found = {}
+        with self._lock:
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT url, vector FROM embeddings WHERE model_id = ? AND model_version = ? "
+                    f"AND url IN ({','.join('?' * len(chunk))})",
+                    [self.model_id, self.model_version, *chunk]
+                ).fetchall()
+                for url, blob in rows:
+                    found[url] = np.frombuffer(blob, dtype=np.float32)
+        self.hits += len(found)
+        self.misses += len(urls) - len(found)
+        return found
+
+    def put(self, url, content_hash, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, content_hash, self.model_id, self.model_version, vector.shape[0],
+                 vector.tobytes(), datetime.now().isoformat())
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE model_id = ? AND model_version = ?",
+                (self.model_id, self.model_version)
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
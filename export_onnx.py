@@ -0,0 +1,75 @@
+import json
+import os
+
+import torch
+from transformers import CLIPModel, CLIPProcessor
+from onnxruntime.quantization import QuantType, quantize_dynamic
+
+from clip_backends import MODEL_ID, ONNX_DIR
+
+# 使い方: python export_onnx.py
+# CLIPの画像側・テキスト側をONNXに書き出して int8 に動的量子化する（clip_backends.OnnxBackend 用）
+OPSET = 17
+MAX_LENGTH = 77
+
+class VisionTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+class TextTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+def export(module, args, input_names, dynamic_axes, name):
+    fp32_path = os.path.join(ONNX_DIR, f"{name}_fp32.onnx")
+    int8_path = os.path.join(ONNX_DIR, f"{name}_int8.onnx")
+    torch.onnx.export(
+        module, args, fp32_path,
+        input_names=input_names, output_names=["features"],
+        dynamic_axes={**dynamic_axes, "features": {0: "batch"}},
+        opset_version=OPSET
+    )
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+    print(f"💾 {int8_path} ({os.path.getsize(int8_path) / 1e6:.1f} MB)")
+
+def main():
+    os.makedirs(ONNX_DIR, exist_ok=True)
+    print(f"🚀 Loading {MODEL_ID} ...")
+    model = CLIPModel.from_pretrained(MODEL_ID)
+    model.eval()
+    processor = CLIPProcessor.from_pretrained(MODEL_ID)
+
+    with torch.no_grad():
+        pixel_values = torch.zeros(1, 3, 224, 224)
+        export(VisionTower(model), (pixel_values,), ["pixel_values"],
+               {"pixel_values": {0: "batch"}}, "vision")
+
+        tokens = processor(text=["a cosplay photo"], return_tensors="pt", padding=True)
+        export(TextTower(model), (tokens["input_ids"], tokens["attention_mask"]), ["input_ids", "attention_mask"],
+               {"input_ids": {0: "batch", 1: "seq"}, "attention_mask": {0: "batch", 1: "seq"}}, "text")
+
+    processor.tokenizer.backend_tokenizer.save(os.path.join(ONNX_DIR, "tokenizer.json"))
+    meta = {
+        "model_id": MODEL_ID,
+        "commit": getattr(model.config, "_commit_hash", None) or "unknown",
+        "logit_scale": model.logit_scale.exp().item(),
+        "quantization": "dynamic-int8",
+        "pad_token_id": processor.tokenizer.pad_token_id,
+        "pad_token": processor.tokenizer.pad_token,
+        "max_length": MAX_LENGTH
+    }
+    with open(os.path.join(ONNX_DIR, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    print(f"✅ Exported to {ONNX_DIR}/")
+
+if __name__ == "__main__":
+    main()
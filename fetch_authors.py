@@ -1,80 +1,83 @@
-import json
 import os
 import asyncio
 import random
 import re
+import time
 from playwright.async_api import async_playwright
+from author_index import build_author_index, load_authors, migrate_follower_counts, save_authors
+from record_store import RecordStore
+from dom_extract import parse_metric
+from lean_browser import LEAN, TimingHistogram, new_context, warm_up
+from refresh_scheduler import authors_queue
+from checkpoint_journal import Journal
+from time_budget import TimeBudget
 
 AUTH_FILE = 'auth.json'
 DATA_FILE = 'collect.json'
-
-def parse_metric(text):
-    if not text: return 0
-    text = text.replace(',', '').strip()
-    try:
-        if '万' in text: return int(float(text.replace('万', '')) * 10000)
-        if 'K' in text: return int(float(text.replace('K', '')) * 1000)
-        if 'M' in text: return int(float(text.replace('M', '')) * 1000000)
-        return int(''.join(filter(str.isdigit, text)) or 0)
-    except: return 0
-
-# URLからユーザーIDを抜き出す関数
-def extract_user_id(url):
-    # https://x.com/user_id/status/12345... から user_id を抽出
-    match = re.search(r'(?:twitter|x)\.com/([^/]+)/status', url)
-    if match:
-        return match.group(1)
-    return None
+# 1回の実行で使う時間（秒）。次の1人が間に合わなさそうになったら残りは次回に回す
+TIME_BUDGET = int(os.environ.get("AUTHORS_TIME_BUDGET", 30 * 60))
 
 async def fetch_authors():
     if not os.path.exists(DATA_FILE): return
-    with open(DATA_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    budget = TimeBudget("fetch_authors", TIME_BUDGET)
+    store = RecordStore(json_path=DATA_FILE)
+    data = store.load()
 
-    # 1. 全データからURLを使ってユーザーIDを洗い出す
-    #    (フォロワー数がまだ0の人だけをリストアップ)
-    target_users = set()
-    
+    # 1. 全データからURLを使ってユーザーID -> レコード位置の索引を1回だけ作る
+    #    (memberキーもここで正規化する)
     print("🔍 URLからユーザーIDを抽出中...")
-    for d in data:
-        user_id = extract_user_id(d.get('url', ''))
-        if user_id:
-            # ついでにmemberキーを正規化（データを綺麗にする）
-            d['member'] = user_id 
-            
-            # フォロワー未取得ならターゲットに追加
-            if d.get('follower_count', 0) == 0:
-                target_users.add(user_id)
-
-    target_list = list(target_users)
-    print(f"🎯 取得対象: {len(target_list)} 人 (URL解析完了)")
+    index, changed_rows = build_author_index(data)
+
+    # フォロワー数は authors.json の1テーブルで持ち、レコードは member (ユーザーID) で参照する
+    authors = load_authors()
+    # 前回止められた実行で取れた分を戻す（authors.json に入るので今回の対象から外れる）
+    journal = Journal('fetch_authors')
+    for user_id, entry in journal.entries.items():
+        if entry['followers'] > 0: authors[user_id] = entry['followers']
+    changed_rows |= migrate_follower_counts(data, index, authors)
+    # 書き換えたレコードだけストアに反映
+    if store.upsert_many(data[i] for i in sorted(changed_rows)):
+        store.export_json()
+
+    # フォロワー未取得の人だけをターゲットにする（authors.json にある人は取り直さない）
+    # 優先メンバーの投稿がある人・投稿数が多い人から順に取る
+    queue = authors_queue(data, index, authors)
+    # 前回見つからなかった（0人のままの）ユーザーも journal にあれば今回は飛ばす
+    target_list = [u for u in (queue.pop() for _ in range(len(queue))) if u not in journal]
+    print(f"🎯 取得対象: {len(target_list)} 人 / 既知 {len(index) - len(target_list)} 人 (URL解析完了)")
 
     if not target_list:
         print("✅ 全てのフォロワー数が取得済みです。")
-        # データの正規化（memberキーの統一）だけ保存しておく
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        save_authors(authors)
+        store.close()
+        journal.clear()
         return
 
     # 2. スクレイピング開始
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
-        context_options = {
-            "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
+        context_options = {}
         if os.path.exists(AUTH_FILE):
             context_options["storage_state"] = AUTH_FILE
-        
-        context = await browser.new_context(**context_options)
+
+        # 画像・動画・フォント・解析系を止めた軽いコンテキストで、温めた1枚のページを使い回す
+        context = await new_context(browser, **context_options)
         page = await context.new_page()
+        await warm_up(page, "https://x.com/")
+        timings = TimingHistogram(f"profile load (lean={LEAN})")
 
         for i, user_id in enumerate(target_list):
+            if not budget.can_start(): break
+            item_started = time.monotonic()
             url = f"https://x.com/{user_id}"
             print(f"[{i+1}/{len(target_list)}] Checking: {user_id} ... ", end="", flush=True)
 
             try:
+                started = time.perf_counter()
                 await page.goto(url, wait_until="domcontentloaded", timeout=30000)
-                await asyncio.sleep(random.uniform(2, 4))
+                # 固定の待ち時間ではなく、フォロワー数のリンクが出るまで待つ
+                try: await page.wait_for_selector('a[href$="/followers"]', timeout=10000)
+                except: pass
 
                 follower_count = 0
                 # 複数のセレクタ候補
@@ -83,7 +86,7 @@ async def fetch_authors():
                     f'a[href="/{user_id}/followers"]',
                     'a[href$="/followers"]'
                 ]
-                
+
                 for sel in selectors:
                     elem = await page.query_selector(sel)
                     if elem:
@@ -92,35 +95,33 @@ async def fetch_authors():
                         if match:
                             follower_count = parse_metric(match.group(1))
                             if follower_count > 0: break
+                timings.add(time.perf_counter() - started)
 
                 if follower_count > 0:
-                    print(f"✅ {follower_count}")
-                    # 3. 取得した数値を、そのユーザーIDを持つ全データに反映
-                    count_updated = 0
-                    for d in data:
-                        # ここでもURLからIDを確認して一致判定する（確実性重視）
-                        u_id = extract_user_id(d.get('url', ''))
-                        if u_id == user_id:
-                            d['follower_count'] = follower_count
-                            d['member'] = user_id # 念のため更新
-                            count_updated += 1
+                    # 3. authors テーブルを1行更新するだけ（そのユーザーの全レコードはここを参照する）
+                    authors[user_id] = follower_count
+                    print(f"✅ {follower_count} ({len(index[user_id])} posts)")
                 else:
+                    # 取れなかった人は authors.json に書かない（0 を本当の値と区別できないため）
                     print("❌ Not found")
+                # 1人ずつ journal に1行追記する（authors.json は最後に1回だけ書く。0 = 見つからなかった）
+                journal.record(user_id, followers=follower_count)
 
             except Exception as e:
                 print(f"❌ Error: {e}")
 
-            # こまめに保存
-            if i % 5 == 0:
-                with open(DATA_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
+            await asyncio.sleep(random.uniform(2, 4)) # BAN対策の休憩
+            budget.add(time.monotonic() - item_started)
 
         await browser.close()
+    timings.report()
+    budget.summary(len(target_list) - budget.count)
 
     # 最終保存
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    save_authors(authors)
+    store.close()
+    journal.clear()
     print("✨ フォロワー数の更新完了！データ構造も正規化されました。")
 
 if __name__ == "__main__":
-    asyncio.run(fetch_authors())
\ No newline at end of file
+    asyncio.run(fetch_authors())
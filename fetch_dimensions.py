@@ -1,57 +1,102 @@
-import json
 import os
-import requests
-from PIL import Image
-from io import BytesIO
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from image_fetcher import shared_fetcher
+from image_probe import original_variant, probe_size
+from record_store import RecordStore
+from refresh_scheduler import dimensions_queue
+from time_budget import TimeBudget
+
+# 1回の実行で処理する上限（0 = 未取得分すべて）。ヘッダだけ読むので全件でも軽い
+LIMIT = int(os.environ.get("DIMENSIONS_LIMIT", 0))
+# 1回の実行で使う時間（秒）。間に合わなさそうな分は取らずに次回に回す
+TIME_BUDGET = int(os.environ.get("DIMENSIONS_TIME_BUDGET", 10 * 60))
+PROBE_WORKERS = 16 # 同時リクエスト数（セッションは image_fetcher と共有）
+
+def aspect_type(width, height):
+    # アスペクト比の判定
+    ratio = width / height
+    if ratio < 0.85:
+        return 'Portrait (縦長)'
+    elif ratio > 1.15:
+        return 'Landscape (横長)'
+    else:
+        return 'Square (正方形)'
+
+def probe_item(fetcher, item):
+    """表示用画像（ディスクキャッシュにあればそこから）と、twimgなら元画像(name=orig)のサイズを調べる"""
+    img_url = item['images'][0]
+    size = fetcher.probe_size(img_url)
+    orig_size = None
+    orig_url = original_variant(img_url)
+    if size and orig_url:
+        try:
+            orig_size = probe_size(orig_url, session=fetcher.session)
+        except Exception:
+            orig_size = None
+    return size, orig_size
+
+def probe_timed(budget, fetcher, item):
+    with budget.time():
+        return probe_item(fetcher, item)
 
 def fetch_dimensions():
     file_path = 'collect.json'
     if not os.path.exists(file_path): return
+    budget = TimeBudget("fetch_dimensions", TIME_BUDGET)
 
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    store = RecordStore(json_path=file_path)
+    data = store.load()
 
     print("📸 画像サイズの解析を開始します...")
+
+    # 画像URLがあり、まだサイズが記録されていないもの（優先メンバー・新しい投稿から順に）
+    queue = dimensions_queue(data)
+    targets = deque(queue.pop() for _ in range(min(LIMIT, len(queue)) if LIMIT else len(queue)))
+    print(f"🎯 対象: {len(targets)} 件")
+
+    fetcher = shared_fetcher()
+
     count = 0
-    # 1回の実行で処理する上限（GitHub Actionsの制限時間を考慮）
-    limit = 100 
-
-    for item in data:
-        if count >= limit: break
-        
-        # 画像URLがあり、まだサイズが記録されていないもの
-        if item.get('images') and not item.get('width'):
-            img_url = item['images'][0]
-            try:
-                # タイムアウトを短めに設定して効率化
-                response = requests.get(img_url, timeout=5)
-                img = Image.open(BytesIO(response.content))
-                width, height = img.size
-                
+    updated = []
+    pending = {} # future → item
+    with ThreadPoolExecutor(PROBE_WORKERS) as pool:
+        while targets or pending:
+            # 空いたスレッドに、締め切りまでに終わる見込みのある分だけ次を渡す
+            while targets and len(pending) < PROBE_WORKERS and budget.can_start():
+                item = targets.popleft()
+                pending[pool.submit(probe_timed, budget, fetcher, item)] = item
+            if not pending: break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    size, orig_size = future.result()
+                except Exception as e:
+                    print(f"  ❌ Skip {item['images'][0]}: {e}")
+                    continue
+                if not size or not size[1]: continue
+
+                width, height = size
                 item['width'] = width
                 item['height'] = height
-                
-                # アスペクト比の判定
-                ratio = width / height
-                if ratio < 0.85:
-                    item['aspect_type'] = 'Portrait (縦長)'
-                elif ratio > 1.15:
-                    item['aspect_type'] = 'Landscape (横長)'
-                else:
-                    item['aspect_type'] = 'Square (正方形)'
-                
+                item['aspect_type'] = aspect_type(width, height)
+                if orig_size:
+                    item['orig_width'], item['orig_height'] = orig_size
+
+                updated.append(item)
                 count += 1
                 print(f"  [{count}] Processed: {item['aspect_type']} ({width}x{height})")
 
-            except Exception as e:
-                print(f"  ❌ Skip {img_url}: {e}")
-                continue
-
     if count > 0:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    
+        store.upsert_many(updated)
+        store.export_json()
+    store.close()
+
+    budget.summary(len(targets))
     print(f"✨ 完了！ 新たに {count} 件のサイズを特定しました。")
+    print(fetcher.report())
 
 if __name__ == "__main__":
-    fetch_dimensions()
\ No newline at end of file
+    fetch_dimensions()
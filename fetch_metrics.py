@@ -1,146 +1,239 @@
-import json
 import os
 import asyncio
+import contextlib
 import random
 import re
+import time
 from playwright.async_api import async_playwright
 from datetime import datetime
+from rate_governor import RateGovernor
+from dom_extract import X_SELECTORS, extract_tweets
+from graphql_capture import GraphQLCapture
+from lean_browser import LEAN, TimingHistogram, new_context, warm_up
+from author_index import extract_user_id, load_authors, save_authors
+from record_store import RecordStore
+from refresh_scheduler import metrics_queue
+from metric_snapshots import SnapshotStore
+from checkpoint_journal import Journal
+from time_budget import TimeBudget
 
 # --- 設定 ---
-BATCH_SIZE = 150
+# 1回の実行で使う時間（秒）。件数ではなく時間で区切る（GitHub Actionsの制限時間を考慮）。
+# 1件あたりの時間の移動平均から、次の1件が間に合わなさそうになったら新しく取らずに終わる
+TIME_BUDGET = int(os.environ.get("METRICS_TIME_BUDGET", 40 * 60))
+WORKERS = int(os.environ.get("METRICS_WORKERS", 3))                 # 同時に開くページ数
+REQUESTS_PER_MINUTE = int(os.environ.get("METRICS_RPM", 30))        # 全ワーカー合計の上限
+# "graphql": ページが読み込むJSONから読む（取れなければDOM） / "dom": 従来どおりDOMから読む
+MODE = os.environ.get("METRICS_MODE", "graphql")
 DATA_FILE = 'collect.json'
 AUTH_FILE = 'auth.json'
 DEBUG_DIR = 'debug_screenshots' # エラー時の写真を保存する場所
-
-# 数値変換
-def parse_metric(text):
-    if not text: return 0
-    text = text.replace(',', '').strip()
+# journal に残す項目（1件取るごとにこれだけを1行追記し、最後にまとめてストアへ反映する）
+JOURNAL_FIELDS = ('like_count', 'impression_count', 'text', 'last_fetched', 'created_at')
+
+class LoginWallError(Exception):
+    pass
+
+def apply_captured(item, tweet, authors):
+    """GraphQL から取れたツイートで item と authors を更新する"""
+    item['like_count'] = tweet['likes']
+    item['impression_count'] = tweet['views']
+    item['text'] = tweet['text'].replace('\n', ' ')
+    item['last_fetched'] = datetime.now().isoformat()
+    if tweet['created_at'] and not item.get('created_at'):
+        item['created_at'] = tweet['created_at']
+    if authors is not None and tweet['author'] and tweet['followers'] > 0:
+        # analyze_data は URL のユーザーIDで引くので、GraphQL の screen_name（大文字小文字が違うことがある）ではなくそちらで持つ
+        authors[extract_user_id(item['url']) or tweet['author']] = tweet['followers']
+    return item['like_count'], item['text']
+
+async def fetch_one(page, item, governor, capture=None, authors=None, timings=None):
+    """1件分のいいね数・インプ・本文を取得して item を更新する（timings には待ち時間を除いた読み込み時間を記録）"""
+    await governor.acquire()
+    with timings.time() if timings is not None else contextlib.nullcontext():
+        return await read_status_page(page, item, capture, authors)
+
+async def read_status_page(page, item, capture, authors):
+    url = item['url']
+    status_id = url.split('?')[0].rstrip('/').split('/')[-1]
+    if capture is not None: capture.tweets.clear()
+
+    # タイムアウト延長 (30秒 -> 60秒)
+    await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+    if "/login" in page.url or "/i/flow/" in page.url:
+        raise LoginWallError("Redirected to login")
+
+    # --- GraphQL のレスポンスに目的のツイートが入っていればそれを使う ---
+    if capture is not None:
+        tweet = await capture.wait_for(status_id, timeout=20)
+        if tweet: return apply_captured(item, tweet, authors)
+
+    # 記事が表示されるまで待つ (10秒 -> 20秒に延長)
     try:
-        if '万' in text: return int(float(text.replace('万', '')) * 10000)
-        if 'K' in text: return int(float(text.replace('K', '')) * 1000)
-        if 'M' in text: return int(float(text.replace('M', '')) * 1000000)
-        return int(''.join(filter(str.isdigit, text)) or 0)
-    except: return 0
+        await page.wait_for_selector(X_SELECTORS["tweet"], timeout=20000)
+    except:
+        # 失敗したら例外を投げてリトライ処理へ
+        raise TimeoutError("Timeout: Tweet content not loaded")
+
+    await asyncio.sleep(random.uniform(1.5, 3.0))
+
+    # --- 数値と本文を1回の evaluate でまとめて取得 ---
+    tweets = await extract_tweets(page)
+    if not tweets: raise TimeoutError("Timeout: Tweet content not loaded")
+    # 返信スレッドの場合に備えて、URLが一致するツイートを優先する
+    tweet = next((t for t in tweets if t['url'].rstrip('/').endswith(f"/status/{status_id}")), tweets[0])
+    likes = tweet['likes']
+    views = tweet['views']
+    text_content = tweet['text'].replace('\n', ' ')
+
+    # データ更新
+    item['like_count'] = likes
+    item['impression_count'] = views
+    item['text'] = text_content
+    item['last_fetched'] = datetime.now().isoformat()
+    return likes, text_content
+
+async def worker(worker_id, context, queue, governor, state):
+    """スケジューラーから優先度順にレコードを取り出して処理するワーカー（ページはワーカーごとに1枚）"""
+    page = await context.new_page()
+    capture = GraphQLCapture(page) if MODE == "graphql" else None
+    await warm_up(page, "https://x.com/") # 1枚のページを温めて使い回す
+    while state['budget'].can_start():
+        item = queue.pop()
+        if item is None: break
+        item_started = time.monotonic()
+        i = state['started']
+        state['started'] += 1
+        url = item['url']
+        print(f"[w{worker_id}] [{i+1}/{state['total']}] Accessing: {url}")
+
+        # --- リトライループ (最大2回挑戦) ---
+        success = False
+        followers = {} # この1件で GraphQL から分かったフォロワー数（journal にも残す）
+        for attempt in range(2):
+            try:
+                likes, text_content = await fetch_one(page, item, governor, capture, followers, state['timings'])
+                governor.reward()
+                # 上書きされる前の値も残るように、取れた数値を時系列に追記する
+                snapshot = [int(time.time()), likes, item.get('impression_count', 0)]
+                state['snapshots'].add(url, snapshot[1], snapshot[2], ts=snapshot[0])
+
+                log_msg = f"   ✅ Likes: {likes}"
+                if text_content: log_msg += f", Text: {text_content[:15]}..."
+                else: log_msg += " (No Text)"
+                print(log_msg)
+
+                success = True
+                break # 成功したらループを抜ける
+
+            except Exception as e:
+                print(f"   ⚠️ [w{worker_id}] Attempt {attempt+1} failed: {e}")
+                if isinstance(e, (LoginWallError, TimeoutError)) or "Timeout" in str(e):
+                    governor.penalize(type(e).__name__)
+                await asyncio.sleep(2) # 少し休んでリトライ
+
+        # --- 2回とも失敗した場合 ---
+        if not success:
+            print(f"   ❌ Failed to fetch. Saving screenshot...")
+            # URLから安全なファイル名を生成
+            safe_name = re.sub(r'[^a-zA-Z0-9]', '_', url.split('/')[-1])
+            shot_path = f"{DEBUG_DIR}/error_{safe_name}.png"
+            try:
+                await page.screenshot(path=shot_path)
+                print(f"   📸 Screenshot saved: {shot_path}")
+            except:
+                print("   Could not save screenshot.")
+
+            # エラー記録（前回取れたいいね数・本文は消さず、取りに行った時刻と失敗だけ残す。スケジューラーが間隔を空ける）
+            item['last_fetched'] = item['last_failed'] = datetime.now().isoformat()
+
+        # 1件ずつ journal に1行追記する（止められても次の実行はここから続ける）
+        if success:
+            item.pop('last_failed', None)
+            fields = {k: item[k] for k in JOURNAL_FIELDS if k in item}
+            state['authors'].update(followers)
+            state['journal'].record(url, {**fields, 'last_failed': None}, snapshot=snapshot, followers=followers)
+        else:
+            state['journal'].record(url, {'last_fetched': item['last_fetched'], 'last_failed': item['last_failed']})
+        state['processed'] += 1
+        state['budget'].add(time.monotonic() - item_started)
+
+    await page.close()
+
+def resume(journal, store, snapshots, authors):
+    """
+    前回止められた実行の journal をストアと時系列とフォロワー数に戻す。
+    取れた分は last_fetched が新しくなるので、スケジューラーが今回の対象から外す
+    """
+    if not len(journal): return
+    restored = 0
+    for url, entry in journal.entries.items():
+        authors.update(entry.get('followers') or {})
+        if 'snapshot' not in entry: continue
+        ts, likes, views = entry['snapshot']
+        saved_ts, _, _ = snapshots.series(url)
+        if not len(saved_ts) or saved_ts[-1] < ts: # 前回 flush 済みの行は足さない
+            snapshots.add(url, likes, views, ts=ts)
+            restored += 1
+    updated, _ = journal.fold_into(store)
+    print(f"📒 前回の続きから再開: {len(journal)} 件済み (ストア更新 {updated} 件, 時系列 {restored} 行)")
+
+def finish(store, journal, snapshots, authors):
+    """時系列とフォロワー数を保存し、journal をストアに反映して collect.json に書き出してから journal を消す"""
+    snapshots.flush()
+    save_authors(authors) # GraphQL で分かったフォロワー数
+    journal.fold_into(store)
+    store.export_json()
+    store.close()
+    journal.clear()
 
 async def fetch_metrics():
     if not os.path.exists(DATA_FILE): return
-    with open(DATA_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    budget = TimeBudget("fetch_metrics", TIME_BUDGET)
+    store = RecordStore(json_path=DATA_FILE)
+    journal = Journal('fetch_metrics')
+    snapshots = SnapshotStore()
+    authors = load_authors()
+    resume(journal, store, snapshots, authors)
+    data = store.load()
 
     # デバッグ用フォルダ作成
     if not os.path.exists(DEBUG_DIR):
         os.makedirs(DEBUG_DIR)
 
-    targets = [d for d in data if d.get('like_count', 0) == 0 or 'text' not in d]
-    current_batch = targets[:BATCH_SIZE]
-    
-    print(f"🎯 対象: {len(current_batch)} 件 / 残り {len(targets)} 件")
-    if not current_batch: return
+    # 未取得のもの → 期限が来た取り直し の順（新しい投稿ほど頻繁に、古い投稿はたまに取り直す）
+    queue = metrics_queue(data)
+    new_count = sum(1 for d in data if d.get('url') and not d.get('last_fetched'))
+
+    print(f"🎯 対象: {len(queue)} 件 (未取得 {new_count} / 取り直し {len(queue) - new_count}) (制限時間 {TIME_BUDGET}s, {WORKERS} workers, {REQUESTS_PER_MINUTE} req/min, mode: {MODE})")
+    if not queue:
+        finish(store, journal, snapshots, authors)
+        return
+
+    state = {
+        'journal': journal, 'authors': authors, 'total': len(queue), 'started': 0, 'processed': 0, 'budget': budget,
+        'timings': TimingHistogram(f"page load ({MODE}, lean={LEAN})"), 'snapshots': snapshots
+    }
+    governor = RateGovernor(requests_per_minute=REQUESTS_PER_MINUTE)
 
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
-        
-        context_options = {
-            "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
+
+        context_options = {}
         if os.path.exists(AUTH_FILE):
             context_options["storage_state"] = AUTH_FILE
 
-        context = await browser.new_context(**context_options)
-        page = await context.new_page()
-
-        processed_count = 0
-        for i, item in enumerate(current_batch):
-            url = item['url']
-            print(f"[{i+1}/{len(current_batch)}] Accessing: {url}")
-
-            # --- リトライループ (最大2回挑戦) ---
-            success = False
-            for attempt in range(2): 
-                try:
-                    # タイムアウト延長 (30秒 -> 60秒)
-                    await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                    
-                    # 記事が表示されるまで待つ (10秒 -> 20秒に延長)
-                    try:
-                        await page.wait_for_selector('article[data-testid="tweet"]', timeout=20000)
-                    except:
-                        # 失敗したら例外を投げてリトライ処理へ
-                        raise Exception("Timeout: Tweet content not loaded")
-
-                    await asyncio.sleep(random.uniform(1.5, 3.0))
-
-                    # --- A. 数値取得 ---
-                    likes = 0
-                    views = 0
-                    
-                    like_elem = await page.query_selector('[data-testid="like"]')
-                    if like_elem:
-                        aria = await like_elem.get_attribute('aria-label')
-                        if aria:
-                            match = re.search(r'(\d[\d,.]*[KkMm万]?)', aria)
-                            if match: likes = parse_metric(match.group(1))
-                    
-                    view_elem = await page.query_selector('a[href$="/analytics"]')
-                    if view_elem:
-                        aria = await view_elem.get_attribute('aria-label')
-                        if aria:
-                            match = re.search(r'(\d[\d,.]*[KkMm万]?)', aria)
-                            if match: views = parse_metric(match.group(1))
-
-                    # --- B. 本文取得 ---
-                    text_content = ""
-                    text_elem = await page.query_selector('[data-testid="tweetText"]')
-                    if text_elem:
-                        text_content = await text_elem.inner_text()
-                        text_content = text_content.replace('\n', ' ')
-
-                    # データ更新
-                    item['like_count'] = likes
-                    item['impression_count'] = views
-                    item['text'] = text_content
-                    item['last_fetched'] = datetime.now().isoformat()
-
-                    log_msg = f"   ✅ Likes: {likes}"
-                    if text_content: log_msg += f", Text: {text_content[:15]}..."
-                    else: log_msg += " (No Text)"
-                    print(log_msg)
-                    
-                    success = True
-                    break # 成功したらループを抜ける
-
-                except Exception as e:
-                    print(f"   ⚠️ Attempt {attempt+1} failed: {e}")
-                    await asyncio.sleep(2) # 少し休んでリトライ
-
-            # --- 2回とも失敗した場合 ---
-            if not success:
-                print(f"   ❌ Failed to fetch. Saving screenshot...")
-                # URLから安全なファイル名を生成
-                safe_name = re.sub(r'[^a-zA-Z0-9]', '_', url.split('/')[-1])
-                shot_path = f"{DEBUG_DIR}/error_{safe_name}.png"
-                try:
-                    await page.screenshot(path=shot_path)
-                    print(f"   📸 Screenshot saved: {shot_path}")
-                except:
-                    print("   Could not save screenshot.")
-                
-                # エラー記録 (スキップ用)
-                item['like_count'] = 0
-                item['text'] = ""
-                item['last_fetched'] = datetime.now().isoformat()
-
-            processed_count += 1
-            if processed_count % 5 == 0:
-                with open(DATA_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
+        # 画像・動画・フォント・解析系を止めた軽いコンテキスト（BROWSER_LEAN=0 で従来どおり）
+        context = await new_context(browser, **context_options)
+        await asyncio.gather(*(worker(w, context, queue, governor, state) for w in range(WORKERS)))
 
         await browser.close()
 
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"✨ バッチ処理完了！ {processed_count} 件更新しました。")
+    finish(store, journal, snapshots, authors)
+    state['timings'].report()
+
+    budget.summary(len(queue))
+    print(f"✨ バッチ処理完了！ {state['processed']} 件更新しました。 (back-off {governor.penalties} 回)")
 
 if __name__ == "__main__":
-    asyncio.run(fetch_metrics())
\ No newline at end of file
+    asyncio.run(fetch_metrics())
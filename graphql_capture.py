@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+# ページが自分で読み込む GraphQL のレスポンスから数値を取る（DOMや表示言語が変わっても壊れにくい）
+GRAPHQL_OPERATIONS = ("TweetDetail", "TweetResultByRestId", "SearchTimeline", "UserTweets")
+JST = timezone(timedelta(hours=9))
+
+def _parse_twitter_time(value):
+    """'Wed Oct 10 20:19:24 +0000 2018' → 日本時間のISO形式（analyze_data の時間帯集計用）"""
+    try:
+        return datetime.strptime(value, "%a %b %d %H:%M:%S %z %Y").astimezone(JST).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+def _int(value):
+    try: return int(value)
+    except (TypeError, ValueError): return 0
+
+def _tweet_result(node):
+    """tweet_results.result を Tweet 本体にする（閲覧制限付きは tweet の下に入っている）"""
+    if node.get("__typename") == "TweetWithVisibilityResults":
+        node = node.get("tweet") or {}
+    return node if node.get("rest_id") and isinstance(node.get("legacy"), dict) else None
+
+def _author(tweet):
+    user = (((tweet.get("core") or {}).get("user_results") or {}).get("result") or {})
+    legacy = user.get("legacy") or {}
+    # 新しいレスポンスでは screen_name が user.core の下に移っている
+    handle = (user.get("core") or {}).get("screen_name") or legacy.get("screen_name")
+    return handle, _int(legacy.get("followers_count"))
+
+def parse_tweet(tweet):
+    """Tweet オブジェクト1件を fetch_metrics で使う形の dict にする"""
+    legacy = tweet["legacy"]
+    handle, followers = _author(tweet)
+    text = ((tweet.get("note_tweet") or {}).get("note_tweet_results") or {}).get("result", {}).get("text")
+    return {
+        "id": tweet["rest_id"],
+        "likes": _int(legacy.get("favorite_count")),
+        "views": _int((tweet.get("views") or {}).get("count")),
+        "created_at": _parse_twitter_time(legacy.get("created_at")),
+        "text": text or legacy.get("full_text", ""),
+        "author": handle,
+        "followers": followers,
+    }
+
+def parse_payload(payload):
+    """
+    GraphQL のレスポンス全体から Tweet を全部探して {ツイートID: dict} を返す。
+    タイムラインの入れ子の形は操作ごとに違うので、構造を決め打ちせずに木をたどる
+    """
+    found = {}
+    stack = [payload]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+            continue
+        if not isinstance(node, dict): continue
+        results = node.get("tweet_results") or node.get("tweetResult") or node.get("quoted_status_result")
+        if isinstance(results, dict) and isinstance(results.get("result"), dict):
+            tweet = _tweet_result(results["result"])
+            if tweet and tweet["rest_id"] not in found:
+                found[tweet["rest_id"]] = parse_tweet(tweet)
+        stack.extend(node.values())
+    return found
+
+def is_graphql_response(url):
+    return "/graphql/" in url and any(f"/{op}" in url for op in GRAPHQL_OPERATIONS)
+
+class GraphQLCapture:
+    """
+    page.on("response") で GraphQL のレスポンスを拾い、中のツイートを tweets に貯める。
+    wait_for(ツイートID) でそのツイートが届くまで待てる
+    """
+
+    def __init__(self, page):
+        self.tweets = {}
+        self.payloads = 0
+        self._waiters = {}
+        page.on("response", self._on_response)
+
+    async def _on_response(self, response):
+        if not is_graphql_response(response.url): return
+        try:
+            payload = await response.json()
+        except Exception:
+            return
+        self.payloads += 1
+        self.add(parse_payload(payload))
+
+    def add(self, tweets):
+        self.tweets.update(tweets)
+        for tweet_id in tweets:
+            event = self._waiters.get(tweet_id)
+            if event: event.set()
+
+    async def wait_for(self, tweet_id, timeout):
+        """届いていればすぐ、届かなければ timeout 秒で None を返す"""
+        if tweet_id in self.tweets: return self.tweets[tweet_id]
+        event = self._waiters.setdefault(tweet_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._waiters.pop(tweet_id, None)
+        return self.tweets.get(tweet_id)
@@ -0,0 +1,232 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image
+from image_probe import parse_dimensions, probe_size
+
+# 画像の取得をまとめる層。スクレイパーの判定・fetch_dimensions・clean_data・dedup_images などが同じ画像を
+# 何度もダウンロードしないよう、中身のハッシュで保存するディスクキャッシュ（サイズ上限つきLRU）と
+# keep-alive のセッションを1つだけ持つ。期限が切れたら If-None-Match / If-Modified-Since で確かめ直す
+CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", "image_cache")
+CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MB", "1024")) * 1024 * 1024
+DEFAULT_MAX_AGE = float(os.environ.get("IMAGE_CACHE_MAX_AGE_DAYS", "7")) * 86400 # Cache-Control がない時の有効期限
+POOL_SIZE = 16          # コネクションプールの大きさ（同時ダウンロード数の上限）
+MEMORY_IMAGES = 64      # デコード済みの画像をプロセス内で使い回す枚数
+# JPEG は DCT の段階で 1/2・1/4・1/8 に縮めてデコードし、短辺がこの大きさ以上のうち一番小さいものにする
+# （CLIPの入力224pxの2倍。phash・代表色もこれで足りる。0 なら元の大きさでデコード）
+DRAFT_SIZE = int(os.environ.get("IMAGE_DRAFT_SIZE", "448"))
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+def decode_image(content, draft_size=DRAFT_SIZE):
+    """バイト列 → RGB画像（JPEG なら draft() で縮小デコード）"""
+    image = Image.open(BytesIO(content))
+    if draft_size and image.format == "JPEG":
+        image.draft("RGB", (draft_size, draft_size))
+    return image.convert("RGB")
+
+def _max_age(response):
+    match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+class ImageFetcher:
+    """
+    fetch(url) で画像のバイト列とそのSHA-256を返す。
+    キャッシュが新しければネットワークに出ず、古ければ条件付きGETで 304 なら保存済みのものを使う。
+    image(url) はRGB画像（JPEG は draft_size まで縮小デコード、0 なら元の大きさ）を返し、
+    同じプロセス内ではデコードも1回で済ませる（書き換えないこと）
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, pool_size=POOL_SIZE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(cache_dir, 'blobs'), exist_ok=True)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._images = OrderedDict()
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'errors': 0, 'memory_hits': 0,
+                      'bytes_downloaded': 0, 'bytes_saved': 0, 'evicted': 0}
+        self._conn = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_blobs_used ON blobs (last_used);
+        """)
+        self._conn.commit()
+
+    # --- ディスク上のBLOB ---
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, 'blobs', digest[:2], digest)
+
+    def _read_blob(self, digest):
+        try:
+            with open(self._blob_path(digest), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_blob(self, digest, content):
+        path = self._blob_path(digest)
+        if os.path.exists(path): return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _entry(self, url):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT digest, etag, last_modified, expires_at FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+
+    def _touch(self, digest, url=None, expires_at=None):
+        with self._lock:
+            self._conn.execute("UPDATE blobs SET last_used = ? WHERE digest = ?", (time.time(), digest))
+            if url is not None:
+                self._conn.execute("UPDATE entries SET expires_at = ? WHERE url = ?", (expires_at, url))
+            self._conn.commit()
+
+    def _store(self, url, content, response):
+        digest = hashlib.sha256(content).hexdigest()
+        self._write_blob(digest, content)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)", (digest, len(content), time.time()))
+            self._conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", (
+                url, digest, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                time.time() + _max_age(response)
+            ))
+            self._conn.commit()
+            self._evict()
+        return digest
+
+    def _evict(self):
+        """合計がサイズ上限を超えたら、最後に使った時刻が古いものから上限の9割まで消す（ロック内で呼ぶ）"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes: return
+        target = self.max_bytes * 0.9
+        victims = []
+        for digest, size in self._conn.execute("SELECT digest, size FROM blobs ORDER BY last_used"):
+            if total <= target: break
+            victims.append(digest)
+            total -= size
+        for digest in victims:
+            try: os.remove(self._blob_path(digest))
+            except OSError: pass
+        self._conn.executemany("DELETE FROM blobs WHERE digest = ?", ((d,) for d in victims))
+        self._conn.executemany("DELETE FROM entries WHERE digest = ?", ((d,) for d in victims))
+        self._conn.commit()
+        self.stats['evicted'] += len(victims)
+
+    # --- 取得 ---
+
+    def _count(self, **amounts):
+        """stats を足す（スレッドから同時に呼ばれるのでロックの中で。ロックを持ったまま呼ばないこと）"""
+        with self._lock:
+            for name, amount in amounts.items():
+                self.stats[name] += amount
+
+    def fetch(self, url, timeout=10):
+        """(バイト列, SHA-256) を返す。HTTPエラーなら (None, None)"""
+        entry = self._entry(url)
+        content = self._read_blob(entry[0]) if entry else None
+        headers = dict(HEADERS)
+        if content is not None:
+            digest, etag, last_modified, expires_at = entry
+            if time.time() < expires_at:
+                self._count(hits=1, bytes_saved=len(content))
+                self._touch(digest)
+                return content, digest
+            if etag: headers['If-None-Match'] = etag
+            if last_modified: headers['If-Modified-Since'] = last_modified
+
+        try:
+            response = self.session.get(url, headers=headers, timeout=timeout)
+        except Exception:
+            self._count(errors=1)
+            raise
+        if response.status_code == 304 and content is not None:
+            self._count(revalidated=1, bytes_saved=len(content))
+            self._touch(entry[0], url, time.time() + _max_age(response))
+            return content, entry[0]
+        if response.status_code != 200:
+            self._count(errors=1)
+            return None, None
+        self._count(misses=1, bytes_downloaded=len(response.content))
+        return response.content, self._store(url, response.content, response)
+
+    def image(self, url, timeout=10, draft_size=DRAFT_SIZE):
+        """(RGB画像, SHA-256)。HTTPエラーなら (None, None)"""
+        content, digest = self.fetch(url, timeout)
+        if content is None: return None, None
+        key = (digest, draft_size)
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return image, digest
+        image = decode_image(content, draft_size)
+        with self._lock:
+            self._images[key] = image
+            if len(self._images) > MEMORY_IMAGES: self._images.popitem(last=False)
+        return image, digest
+
+    def probe_size(self, url, timeout=5):
+        """
+        画像サイズ。キャッシュにあればファイルの先頭から読み、なければヘッダだけ取る（image_probe）。
+        サイズのためだけに画像全体をダウンロードしてキャッシュに入れることはしない
+        """
+        entry = self._entry(url)
+        if entry is not None:
+            content = self._read_blob(entry[0])
+            if content is not None:
+                self._count(hits=1, bytes_saved=len(content))
+                return parse_dimensions(content) or Image.open(BytesIO(content)).size
+        return probe_size(url, session=self.session, timeout=timeout)
+
+    def report(self):
+        s = self.stats
+        lookups = s['hits'] + s['revalidated'] + s['misses']
+        hit_rate = (s['hits'] + s['revalidated']) / lookups * 100 if lookups else 0.0
+        return (f"🗂️ image cache: {s['hits']} hits / {s['revalidated']} revalidated (304) / {s['misses']} misses "
+                f"({hit_rate:.0f}%), {s['bytes_downloaded'] / 1e6:.1f} MB downloaded, "
+                f"{s['bytes_saved'] / 1e6:.1f} MB saved, {s['memory_hits']} decode reuses, "
+                f"{s['errors']} errors, {s['evicted']} evicted")
+
+    def close(self):
+        self.session.close()
+        with self._lock:
+            self._conn.close()
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared_fetcher():
+    """プロセス内で1つの ImageFetcher（スクレイパーとCLIP判定などで共有）"""
+    global _shared
+    with _shared_lock:
+        if _shared is None: _shared = ImageFetcher()
+        return _shared
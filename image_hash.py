@@ -0,0 +1,140 @@
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+# --- 設定 ---
+# これ以下のハミング距離（64ビット中）なら同じ写真の再投稿・転載とみなす
+DEDUP_RADIUS = int(os.environ.get("DEDUP_RADIUS", "6"))
+
+def _dct_matrix(n):
+    """n×n の DCT-II 行列（phash 用）"""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m
+
+_DCT32 = _dct_matrix(32)
+
+def _bits_to_int(bits):
+    value = 0
+    for b in bits.ravel().tolist():
+        value = (value << 1) | int(b)
+    return value
+
+def phash(image):
+    """
+    知覚ハッシュ（64ビット int）。32×32 のグレースケールに縮めて DCT をかけ、
+    低周波 8×8 の係数が中央値より大きいかどうかをビットにする。縮小・再圧縮・軽い色調補正に強い
+    """
+    pixels = np.asarray(image.convert("L").resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    coeffs = (_DCT32 @ pixels @ _DCT32.T)[:8, :8]
+    return _bits_to_int(coeffs > np.median(coeffs.ravel()[1:]))
+
+def dhash(image):
+    """差分ハッシュ（64ビット int）。9×8 に縮めて左右に隣り合う画素の明暗をビットにする"""
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+def to_hex(value):
+    return f"{value:016x}"
+
+def from_hex(text):
+    return int(text, 16)
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    """
+    ハミング距離の BK-tree。search(h, r) は三角不等式で枝を刈るので、全件比較せずに半径 r 以内を探せる。
+    ノードは [ハッシュ, キー, {距離: 子ノード}]
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, key):
+        self.size += 1
+        node = [value, key, {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            d = hamming(value, current[0])
+            child = current[2].get(d)
+            if child is None:
+                current[2][d] = node
+                return
+            current = child
+
+    def search(self, value, radius):
+        """半径 radius 以内の (距離, キー) を距離の近い順に返す"""
+        if self.root is None: return []
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= radius: found.append((d, node[1]))
+            for edge, child in node[2].items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+        found.sort(key=lambda x: x[0])
+        return found
+
+    def __len__(self):
+        return self.size
+
+class DuplicateIndex:
+    """
+    pHash の BK-tree で近い候補を探し、dHash でも近いものだけを重複とみなす。
+    スクレイピング中は別スレッドから同時に呼ばれるのでロックを取る
+    """
+
+    def __init__(self, radius=DEDUP_RADIUS):
+        self.radius = radius
+        self.tree = BKTree()
+        self.dhashes = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_records(cls, records, radius=DEDUP_RADIUS):
+        """phash / dhash を持つレコードから索引を作る"""
+        index = cls(radius)
+        for item in records:
+            if item.get('phash') and item.get('dhash'):
+                index.add(from_hex(item['phash']), from_hex(item['dhash']), item['url'])
+        return index
+
+    def add(self, p, d, key):
+        with self._lock:
+            self.tree.add(p, key)
+            self.dhashes[key] = d
+
+    def _match(self, p, d):
+        for _, key in self.tree.search(p, self.radius):
+            if hamming(d, self.dhashes[key]) <= self.radius:
+                return key
+        return None
+
+    def find(self, p, d):
+        """一番近い重複のキー（なければ None）"""
+        with self._lock:
+            return self._match(p, d)
+
+    def check_and_add(self, p, d, key):
+        """重複ならそのキーを返し、そうでなければ索引に足して None を返す（同じ実行内の転載も拾う）"""
+        with self._lock:
+            match = self._match(p, d)
+            if match is None:
+                self.tree.add(p, key)
+                self.dhashes[key] = d
+            return match
+
+    def __len__(self):
+        return len(self.tree)
@@ -0,0 +1,98 @@
+import re
+import struct
+from io import BytesIO
+
+import requests
+from PIL import Image
+
+# 最初に読むバイト数。EXIFが大きいJPEGは2段目で広げて読む
+PROBE_BYTES = (16 * 1024, 128 * 1024)
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+# SOFマーカー（DHT=C4, JPG=C8, DAC=CC 以外の C0〜CF）
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _jpeg_size(buf):
+    i = 2
+    n = len(buf)
+    while i + 4 <= n:
+        if buf[i] != 0xFF:
+            i += 1
+            continue
+        marker = buf[i + 1]
+        if marker == 0xFF: # フィルバイト
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9: # 長さなしのマーカー
+            i += 2
+            continue
+        length = struct.unpack(">H", buf[i + 2:i + 4])[0]
+        if marker in _SOF_MARKERS:
+            if i + 9 > n: return None
+            height, width = struct.unpack(">HH", buf[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+def _webp_size(buf):
+    chunk = buf[12:16]
+    if chunk == b"VP8 " and len(buf) >= 30:
+        width, height = struct.unpack("<HH", buf[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(buf) >= 25:
+        b0, b1, b2, b3 = buf[21:25]
+        width = 1 + (b0 | ((b1 & 0x3F) << 8))
+        height = 1 + ((b1 >> 6) | (b2 << 2) | ((b3 & 0x0F) << 10))
+        return width, height
+    if chunk == b"VP8X" and len(buf) >= 30:
+        width = 1 + int.from_bytes(buf[24:27], "little")
+        height = 1 + int.from_bytes(buf[27:30], "little")
+        return width, height
+    return None
+
+def parse_dimensions(buf):
+    """画像の先頭バイト列から (幅, 高さ) を読む。足りない・未対応なら None"""
+    if buf[:2] == b"\xff\xd8":
+        return _jpeg_size(buf)
+    if buf[:8] == b"\x89PNG\r\n\x1a\n" and len(buf) >= 24 and buf[12:16] == b"IHDR":
+        return struct.unpack(">II", buf[16:24])
+    if buf[:4] == b"RIFF" and buf[8:12] == b"WEBP":
+        return _webp_size(buf)
+    if buf[:6] in (b"GIF87a", b"GIF89a") and len(buf) >= 10:
+        return struct.unpack("<HH", buf[6:10])
+    return None
+
+def _read_head(session, url, nbytes, timeout):
+    """Rangeリクエスト + ストリーム読みで先頭 nbytes だけ取る（Range非対応でもそこで切る）"""
+    headers = dict(HEADERS, Range=f"bytes=0-{nbytes - 1}")
+    with session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code not in (200, 206): return None
+        buf = b""
+        for chunk in response.iter_content(8192):
+            buf += chunk
+            if len(buf) >= nbytes: break
+        return buf
+
+def probe_size(url, session=None, timeout=5):
+    """
+    ヘッダだけ読んで画像サイズを返す。読めなかった時だけ全体をダウンロードしてPILで開く
+    """
+    session = session or requests
+    for nbytes in PROBE_BYTES:
+        buf = _read_head(session, url, nbytes, timeout)
+        if buf is None: return None
+        size = parse_dimensions(buf)
+        if size: return size
+        if len(buf) < nbytes: break # ファイル全体を読んだのに分からない
+
+    response = session.get(url, headers=HEADERS, timeout=timeout)
+    return Image.open(BytesIO(response.content)).size
+
+def original_variant(url):
+    """pbs.twimg.com の name=small などを name=orig に置き換えたURL（対象外なら None）"""
+    if "pbs.twimg.com/media/" not in url: return None
+    if re.search(r'[?&]name=', url):
+        orig = re.sub(r'([?&]name=)[^&]*', r'\1orig', url)
+    else:
+        orig = url + ("&" if "?" in url else "?") + "name=orig"
+    return orig if orig != url else None
@@ -1,75 +1,168 @@
 import csv
-import json
+import hashlib
 import os
+from collections import Counter
 from datetime import datetime
+from record_store import RecordStore, file_hash
+
+# vspo_data.csv（スプレッドシートの書き出し）を collect.json に取り込む。
+# 数千行ずつ読んでツイートURLで upsert するので、CSVが何百万行になってもメモリは増えない。
+# ファイルのハッシュが前回と同じなら何もせず、変わっていても前回と同じ行は読み飛ばす
+CSV_FILE = 'vspo_data.csv'
+JSON_FILE = 'collect.json'
+SOURCE = 'vspo_data.csv' # 行ハッシュを保存する時の取り込み元の名前
+CHUNK_ROWS = int(os.environ.get("IMPORT_CHUNK", "2000"))
+
+# CSVが持ち主のレコードのキー（CSVで空欄になったらレコードから消す）
+CSV_FIELDS = ['unit', 'checked', 'photographer', 'photographer_url', 'main_color', 'color_name', 'similar_images', 'tags']
+
+def split_list(text, sep=','):
+    return [x.strip() for x in text.replace('、', sep).split(sep) if x.strip()]
+
+def parse_color(text):
+    """'#a29d94' → 0xa29d94（不正な値は None）"""
+    text = text.strip().lstrip('#')
+    if len(text) != 6: return None
+    try: return int(text, 16)
+    except ValueError: return None
+
+def parse_row(row, col):
+    """
+    CSVの1行を型付きのフィールドに変換する。
+    similar_images は CSV のデータ行の番号（0始まり）のリスト
+    """
+    def cell(name):
+        i = col.get(name)
+        return row[i].strip() if i is not None and i < len(row) else ''
+
+    return {
+        "member_name": cell('member'),  # ぶいすぽメンバー
+        "author_name": cell('cosplayer'), # コスプレイヤー
+        "image": cell('image'),         # 画像(twimg)
+        "url": cell('link'),            # 元ツイート
+        "unit": cell('ユニット') or None,
+        "checked": cell('') == '✅ OK',   # 目視チェック済み
+        "photographer": cell('Photographer') or None,
+        "photographer_url": cell('Photographer URL') or None,
+        "main_color": parse_color(cell('MainColor')),
+        "color_name": cell('ColorName') or None,
+        "similar_images": [int(x) for x in split_list(cell('SimilarImages')) if x.isdigit()] or None,
+        "tags": split_list(cell('Tags')) or None,
+    }
+
+def merge(record, fields):
+    """CSVの値をレコードに反映する（いいね数などスクレイピングで付けた値はそのまま）"""
+    if fields['image'] and fields['image'] not in record.setdefault('images', []):
+        record['images'].append(fields['image'])
+    for key in ('member_name', 'author_name'):
+        if fields[key] and not record.get(key): record[key] = fields[key]
+    for key in CSV_FIELDS:
+        if fields[key] is None or fields[key] is False: record.pop(key, None)
+        else: record[key] = fields[key]
+    return record
+
+def new_record(fields):
+    """共通フォーマットへ変換"""
+    return merge({
+        "member_name": fields['member_name'],
+        "author_name": fields['author_name'],
+        "images": [],
+        "url": fields['url'],
+        "source": "X",
+        "content": f"Cosplayer: {fields['author_name']}", # 本文の代わりにレイヤー名を記載
+        "like_count": 0,
+        "impression_count": 0,
+        "collected_at": datetime.now().isoformat()
+    }, fields)
+
+def row_hash(row):
+    return hashlib.sha1('\x1f'.join(row).encode('utf-8')).hexdigest()
+
+def read_chunks(f, size=CHUNK_ROWS):
+    """(ヘッダー, 行のリストを size 件ずつ返すジェネレーター)"""
+    reader = csv.reader(f)
+    header = next(reader, None)
+
+    def chunks():
+        chunk = []
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk: yield chunk
+    return header, chunks()
+
+def import_chunk(store, rows, col, report):
+    """1チャンク分を取り込んで、行ハッシュを更新する"""
+    keyed = []
+    for row in rows:
+        fields = parse_row(row, col)
+        if not fields['url']:
+            report['invalid'] += 1
+            continue
+        # 同じツイートに画像が複数ある時は行が分かれるので、URL + 画像 を行のキーにする
+        keyed.append((f"{fields['url']}\t{fields['image']}", row_hash(row), fields))
+
+    known = store.import_row_hashes(SOURCE, [k for k, _, _ in keyed])
+    changed = [(k, h, fields) for k, h, fields in keyed if known.get(k) != h]
+    report['unchanged_rows'] += len(keyed) - len(changed)
+    if not changed: return
+
+    existing = store.get_many(fields['url'] for _, _, fields in changed)
+    new_records, updated = {}, {}
+    for _, _, fields in changed:
+        url = fields['url']
+        if url in new_records or url in updated: report['merged_rows'] += 1
+        if url in existing or url in updated:
+            updated[url] = merge(updated.get(url) or existing[url], fields)
+        elif url in new_records:
+            merge(new_records[url], fields)
+        else:
+            new_records[url] = new_record(fields)
+            report['members'][fields['member_name']] += 1
+
+    # 新規は日付順（新しい順）の先頭に足す。既存の行の並びは変えない
+    report['new'] += store.upsert_many(new_records.values(), front=True)
+    report['updated'] += store.upsert_many(updated.values())
+    store.set_import_row_hashes(SOURCE, ((k, h) for k, h, _ in changed))
 
 def import_csv_to_json():
-    csv_file = 'vspo_data.csv'
-    json_file = 'collect.json'
-    
-    if not os.path.exists(csv_file):
-        print(f"❌ {csv_file} が見つかりません。")
+    if not os.path.exists(CSV_FILE):
+        print(f"❌ {CSV_FILE} が見つかりません。")
+        return
+
+    store = RecordStore(json_path=JSON_FILE)
+    csv_hash = file_hash(CSV_FILE)
+    if csv_hash == store.import_file_hash(SOURCE):
+        print(f"✅ {CSV_FILE} は前回の取り込みから変わっていません。")
+        store.close()
         return
 
-    # 既存データの読み込み
-    current_data = []
-    if os.path.exists(json_file):
-        with open(json_file, 'r', encoding='utf-8') as f:
-            try:
-                current_data = json.load(f)
-            except:
-                current_data = []
-    
-    # 重複チェック用のURLセット
-    existing_urls = {item['url'] for item in current_data}
-    new_count = 0
-
-    with open(csv_file, 'r', encoding='utf-8') as f:
-        # UTF-8 with BOM や、カンマ区切りを考慮して読み込み
-        reader = csv.reader(f)
-        try:
-            header = next(reader) # ヘッダー行をスキップ
-        except StopIteration:
+    report = {'rows': 0, 'invalid': 0, 'unchanged_rows': 0, 'merged_rows': 0, 'new': 0, 'updated': 0,
+              'members': Counter()}
+    # UTF-8 with BOM も読めるように utf-8-sig で開く
+    with open(CSV_FILE, 'r', encoding='utf-8-sig', newline='') as f:
+        header, chunks = read_chunks(f)
+        if header is None:
+            store.close()
             return
+        col = {name.strip(): i for i, name in enumerate(header)}
+        for rows in chunks:
+            report['rows'] += len(rows)
+            import_chunk(store, rows, col, report)
+            print(f"  [{report['rows']}] rows read")
 
-        for row in reader:
-            # A:メンバー, B:レイヤー名, C:画像, D:ツイートURL
-            if len(row) < 4:
-                continue
-            
-            m_name = row[0].strip() # ぶいすぽメンバー
-            a_name = row[1].strip() # コスプレイヤー
-            img_url = row[2].strip() # 画像(twimg)
-            tweet_url = row[3].strip() # 元ツイート
-            
-            # URLが空、または既に登録済みの場合はスキップ
-            if not tweet_url or tweet_url in existing_urls:
-                continue
-
-            # 共通フォーマットへ変換
-            current_data.append({
-                "member_name": m_name,
-                "author_name": a_name,
-                "images": [img_url] if img_url else [],
-                "url": tweet_url,
-                "source": "X",
-                "content": f"Cosplayer: {a_name}", # 本文の代わりにレイヤー名を記載
-                "like_count": 0,
-                "impression_count": 0,
-                "collected_at": datetime.now().isoformat()
-            })
-            existing_urls.add(tweet_url)
-            new_count += 1
-
-    # 日付順（新しい順）に並び替えて保存
-    current_data.sort(key=lambda x: x.get('collected_at', ''), reverse=True)
-
-    with open(json_file, 'w', encoding='utf-8') as f:
-        json.dump(current_data, f, ensure_ascii=False, indent=2)
+    total = store.export_json() if report['new'] or report['updated'] else len(store)
+    store.set_import_file_hash(SOURCE, csv_hash)
+    store.close()
 
     print(f"✅ インポート完了！")
-    print(f"新規追加: {new_count}件")
-    print(f"現在の合計: {len(current_data)}件")
+    print(f"読み込み: {report['rows']}行 (前回と同じ行: {report['unchanged_rows']} / URLなし: {report['invalid']} / 同じツイートの別画像: {report['merged_rows']})")
+    print(f"新規追加: {report['new']}件 / 更新: {report['updated']}件")
+    for member, count in report['members'].most_common(10):
+        print(f"  ➕ {member}: {count}件")
+    print(f"現在の合計: {total}件")
 
 if __name__ == "__main__":
     import_csv_to_json()
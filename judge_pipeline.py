@@ -0,0 +1,159 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from clip_classifier import Prepared, Verdict
+from image_fetcher import shared_fetcher
+from image_hash import to_hex
+
+# --- 設定 ---
+QUEUE_SIZE = 32        # 各ステージ間のキューの上限（ブラウザが先走りすぎないように）
+DOWNLOAD_WORKERS = 8   # 同時ダウンロード数（セッションとディスクキャッシュは image_fetcher で共有）
+
+_DONE = object()
+
+class JudgePipeline:
+    """
+    ブラウザ巡回 → 画像ダウンロード → CLIP推論 を別々に動かすパイプライン。
+
+    巡回側は submit() で候補を積むだけなので、ダウンロードや推論を待たずにスクロールを続けられる。
+    ダウンロードは共有の image_fetcher でスレッド並列、推論は専用スレッドでバッチ実行し、
+    drain() で投入順のまま (候補, Verdict) を返す。
+    dedup (image_hash.DuplicateIndex) を渡すと、既に保存済みの画像の転載はダウンロード直後にCLIPに回さずに弾く。
+    ここでは索引に足さない。今回の候補どうしの転載は sweep_scheduler.merge_accepted() に同じ dedup を渡して、
+    結果の並び順（scrape_all では X → Instagram）に見る（複数サイトを同時に回しても残る方が変わらないように）
+    """
+
+    def __init__(self, judge, queue_size=QUEUE_SIZE, download_workers=DOWNLOAD_WORKERS, dedup=None):
+        self.judge = judge
+        self.dedup = dedup
+        self.duplicates = 0
+        self.download_workers = download_workers
+        self.candidates = asyncio.Queue(maxsize=queue_size)
+        self.prepared = asyncio.Queue(maxsize=queue_size)
+        self.results = {}
+        self.next_seq = 0
+
+        self.download_pool = ThreadPoolExecutor(download_workers)
+        self.infer_pool = ThreadPoolExecutor(1)
+
+        # ステージごとの [件数, 作業時間(秒)]
+        self.stats = {"browse": [0, 0.0], "download": [0, 0.0], "inference": [0, 0.0]}
+        self.started_at = None
+        self.tasks = []
+
+    async def __aenter__(self):
+        self.started_at = time.perf_counter()
+        self.tasks = [asyncio.create_task(self._download_worker()) for _ in range(self.download_workers)]
+        self.infer_task = asyncio.create_task(self._inference_worker())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self.infer_task.done():
+            await self._finish()
+        self.download_pool.shutdown(wait=False)
+        self.infer_pool.shutdown(wait=False)
+
+    async def submit(self, candidate, browse_seconds=0.0):
+        """候補（images[0] と member_name を持つdict）を投入する。キューが満杯なら空くまで待つ"""
+        self.stats["browse"][0] += 1
+        self.stats["browse"][1] += browse_seconds
+        seq = self.next_seq # 複数のコンテキストから同時に呼ばれても番号が重ならないよう先に確保
+        self.next_seq += 1
+        await self.candidates.put((seq, candidate))
+
+    async def _download_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            entry = await self.candidates.get()
+            if entry is _DONE: break
+            seq, candidate = entry
+            started = time.perf_counter()
+            try:
+                prepared = await loop.run_in_executor(
+                    self.download_pool, self.judge.prepare,
+                    candidate['images'][0], candidate['member_name'], self.dedup is not None
+                )
+            except Exception as e:
+                # エラー時は安全のため残す（1件の失敗でステージを止めない）
+                prepared = Prepared(candidate['images'][0], candidate['member_name'], Verdict(True, -1, 0.0, str(e)), None, None, None)
+            self.stats["download"][0] += 1
+            self.stats["download"][1] += time.perf_counter() - started
+            await self.prepared.put((seq, candidate, self._check_duplicate(candidate, prepared)))
+
+    def _check_duplicate(self, candidate, prepared):
+        """
+        知覚ハッシュを候補に記録し、既に索引にある（保存済みの）画像の転載なら判定済みにする。
+        索引には足さない（今回の候補どうしは merge_accepted() で見る）
+        """
+        if prepared.phash is None: return prepared
+        candidate['phash'] = to_hex(prepared.phash)
+        candidate['dhash'] = to_hex(prepared.dhash)
+        if self.dedup is None: return prepared
+        original = self.dedup.find(prepared.phash, prepared.dhash)
+        if original is None or original == candidate['url']: return prepared
+        self.duplicates += 1
+        return prepared._replace(verdict=Verdict(False, -1, 0.0, None, original), image=None)
+
+    async def _inference_worker(self):
+        loop = asyncio.get_running_loop()
+        finished = False
+        while not finished:
+            entry = await self.prepared.get()
+            if entry is _DONE: break
+            batch = [entry]
+            # 溜まっている分はまとめて1バッチにする
+            while len(batch) < self.judge.batch_size and not self.prepared.empty():
+                entry = self.prepared.get_nowait()
+                if entry is _DONE:
+                    finished = True
+                    break
+                batch.append(entry)
+
+            started = time.perf_counter()
+            prepared = [p for _, _, p in batch]
+            try:
+                verdicts = await loop.run_in_executor(self.infer_pool, self.judge.judge_prepared, prepared)
+            except Exception as e:
+                # モデルが読み込めなかった時などは、ClipJudge.judge と同じく安全のため残す
+                # （ここで落ちるとダウンロード側が満杯のキューで止まり、drain() が返らなくなる）
+                print(f"⚠️ Inference failed for {len(batch)} items: {e}")
+                verdicts = [p.verdict or Verdict(True, -1, 0.0, str(e)) for p in prepared]
+            self.stats["inference"][0] += len(batch)
+            self.stats["inference"][1] += time.perf_counter() - started
+            for (seq, candidate, _), verdict in zip(batch, verdicts):
+                self.results[seq] = (candidate, verdict)
+
+    async def _finish(self):
+        """各ステージに終わりを伝えて待つ。どこかのステージが例外で落ちていても最後まで止める"""
+        try:
+            for _ in self.tasks:
+                await self.candidates.put(_DONE)
+            for result in await asyncio.gather(*self.tasks, return_exceptions=True):
+                if isinstance(result, Exception): print(f"⚠️ Download stage failed: {result}")
+            if not self.infer_task.done():
+                await self.prepared.put(_DONE)
+            try:
+                await self.infer_task
+            except Exception as e:
+                print(f"⚠️ Inference stage failed: {e}")
+        finally:
+            for task in [*self.tasks, self.infer_task]:
+                if not task.done(): task.cancel()
+
+    async def drain(self):
+        """全ステージの完了を待ち、投入順に (候補, Verdict) のリストを返す"""
+        await self._finish()
+        return [self.results[seq] for seq in sorted(self.results)]
+
+    def report(self):
+        """ステージごとのスループットを表示する"""
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        print(f"⏱️ Pipeline finished in {elapsed:.1f}s")
+        for stage, (count, busy) in self.stats.items():
+            rate = count / elapsed if elapsed > 0 else 0.0
+            per_item = busy / count if count else 0.0
+            print(f"   {stage:<10} {count:>4} items, {rate:.2f} items/s, {per_item:.2f}s/item")
+        if self.dedup is not None:
+            print(f"   duplicates {self.duplicates:>4} items already saved elsewhere ({len(self.dedup)} hashes indexed)")
+        print(f"   {shared_fetcher().report()}")
@@ -0,0 +1,91 @@
+import bisect
+import os
+
+from time_budget import Timer
+
+# --- 設定 ---
+LEAN = os.environ.get("BROWSER_LEAN", "1") == "1" # 0 にすると従来どおり全部読み込む
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# 数値を読むだけのページで要らないもの
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+BLOCKED_URL_PARTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+    "ads-twitter.com", "analytics.twitter.com", "/jot/", "client_event", # X の行動ログ
+)
+# アニメーションとトランジションを止めて描画を早く落ち着かせる
+NO_ANIMATION_SCRIPT = """
+document.addEventListener('DOMContentLoaded', () => {
+    const style = document.createElement('style');
+    style.textContent = '*, *::before, *::after { animation: none !important; transition: none !important; scroll-behavior: auto !important; }';
+    document.head.appendChild(style);
+});
+"""
+
+def should_block(resource_type, url):
+    return resource_type in BLOCKED_RESOURCE_TYPES or any(part in url for part in BLOCKED_URL_PARTS)
+
+async def new_context(browser, lean=LEAN, **options):
+    """
+    lean=True なら画像・動画・フォント・解析系のリクエストを止め、アニメーションを切ったコンテキストを作る。
+    ブロックした件数は context.blocked_requests に数える
+    """
+    options.setdefault("user_agent", USER_AGENT)
+    if not lean:
+        return await browser.new_context(**options)
+
+    context = await browser.new_context(reduced_motion="reduce", service_workers="block", **options)
+    context.blocked_requests = 0
+
+    async def handle(route):
+        request = route.request
+        if should_block(request.resource_type, request.url):
+            context.blocked_requests += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await context.route("**/*", handle)
+    await context.add_init_script(NO_ANIMATION_SCRIPT)
+    return context
+
+async def warm_up(page, url, timeout=30000):
+    """最初に1回だけトップを開いて、アプリ本体のJSをキャッシュに載せておく（失敗しても続行）"""
+    try:
+        await page.goto(url, wait_until="domcontentloaded", timeout=timeout)
+    except Exception as e:
+        print(f"⚠️ Warm-up failed: {e}")
+
+class TimingHistogram:
+    """URLごとの処理時間（秒）を貯めて、バケットごとの件数と p50/p90 を表示する"""
+    BUCKETS = [0.5, 1, 2, 4, 8, 16, 32]
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = []
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def time(self):
+        """with hist.time(): ... で区間の時間を記録する"""
+        return Timer(self)
+
+    def percentile(self, p):
+        if not self.samples: return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    def report(self):
+        n = len(self.samples)
+        print(f"⏱️ {self.name}: {n} URLs, p50 {self.percentile(0.5):.2f}s, p90 {self.percentile(0.9):.2f}s, "
+              f"total {sum(self.samples):.0f}s")
+        if not n: return
+        counts = [0] * (len(self.BUCKETS) + 1)
+        for s in self.samples:
+            counts[bisect.bisect_left(self.BUCKETS, s)] += 1
+        lower = 0
+        for upper, count in zip(self.BUCKETS + [None], counts):
+            label = f"{lower:>4}-{upper:<4}s" if upper is not None else f"{lower:>4}+    s"
+            print(f"   {label} {count:>5} {'#' * round(40 * count / n)}")
+            lower = upper
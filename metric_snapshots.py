@@ -0,0 +1,228 @@
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+# いいね数・インプの時系列（fetch_metrics が取るたびに1行追記する）
+# metric_snapshots.bin : 1回の書き込み = 1ブロックの追記専用ファイル。ブロックの中は
+#                        (url_id, ts, likes, views) を列ごとに差分 → zigzag → varint にして zlib で圧縮したもの
+#                        （url_id は昇順の差、ts はブロック先頭からの秒、likes / views は同じURLの前回からの差）
+# metric_snapshots.urls: url_id → URL（1行1URL、追記のみ）
+# 1行あたり数バイトなので、10万投稿 × 数十回でも Actions からコミットできる大きさに収まる
+SNAPSHOT_FILE = 'metric_snapshots.bin'
+URLS_FILE = 'metric_snapshots.urls'
+MAGIC = b'VSN1'
+HEADER = struct.Struct('<4sIqI') # マジック, 行数, 基準時刻, 圧縮後のバイト数
+DAY = 86400
+
+def _zigzag(x):
+    x = np.asarray(x, dtype=np.int64)
+    return ((x << 1) ^ (x >> 63)).astype(np.uint64)
+
+def _unzigzag(u):
+    u = np.asarray(u, dtype=np.uint64)
+    return (u >> np.uint64(1)).astype(np.int64) ^ -(u & np.uint64(1)).astype(np.int64)
+
+def encode_varints(values):
+    """符号なし整数の配列を LEB128 の varint に詰める（ループはバイト数の最大値ぶんだけ）"""
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    starts = np.cumsum(nbytes) - nbytes
+    for i in range(int(nbytes.max(initial=0))):
+        sel = nbytes > i
+        byte = (values[sel] >> np.uint64(7 * i)) & np.uint64(0x7f)
+        more = np.where(nbytes[sel] > i + 1, 0x80, 0).astype(np.uint64)
+        out[starts[sel] + i] = (byte | more).astype(np.uint8)
+    return out.tobytes()
+
+def decode_varints(buf):
+    b = np.frombuffer(buf, dtype=np.uint8)
+    if not len(b): return np.empty(0, dtype=np.uint64)
+    ends = np.flatnonzero(b < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    pos = np.arange(len(b)) - np.repeat(starts, ends - starts + 1)
+    values = (b & 0x7f).astype(np.uint64) << (7 * pos).astype(np.uint64)
+    return np.add.reduceat(values, starts)
+
+def _group_cumsum(keys, deltas):
+    """keys で安定ソート済みの deltas を、キーごとに累積和する"""
+    total = np.cumsum(deltas)
+    first = np.concatenate(([True], keys[1:] != keys[:-1]))
+    base = (total - deltas)[first]
+    return total - np.repeat(base, np.diff(np.concatenate((np.flatnonzero(first), [len(keys)]))))
+
+class SnapshotStore:
+    """
+    メモリ上では URL ごと・時刻順に並べた列（url_id, ts, likes, views）として持つ。
+    add() した行は flush() で1ブロックとして追記する
+    """
+
+    def __init__(self, path=SNAPSHOT_FILE, urls_path=URLS_FILE):
+        self.path = path
+        self.urls_path = urls_path
+        self.urls = []
+        if os.path.exists(urls_path):
+            with open(urls_path, 'r', encoding='utf-8') as f:
+                self.urls = [line.rstrip('\n') for line in f]
+        self.url_ids = {url: i for i, url in enumerate(self.urls)}
+        self._saved_urls = len(self.urls)
+        self._pending = []
+        self._load()
+
+    def _load(self):
+        columns = [[], [], [], []]
+        self._valid_size = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                raw = f.read()
+            offset = 0
+            while offset + HEADER.size <= len(raw):
+                magic, rows, base_ts, size = HEADER.unpack_from(raw, offset)
+                payload = raw[offset + HEADER.size:offset + HEADER.size + size]
+                if magic != MAGIC or len(payload) != size: break # 途中で落ちた書き込みは捨てる
+                values = decode_varints(zlib.decompress(payload))
+                url_id, ts, likes, views = values.reshape(4, rows)
+                columns[0].append(np.cumsum(url_id.astype(np.int64)))
+                columns[1].append(ts.astype(np.int64) + base_ts)
+                columns[2].append(_unzigzag(likes))
+                columns[3].append(_unzigzag(views))
+                offset += HEADER.size + size
+            self._valid_size = offset
+
+        url_id, ts, d_likes, d_views = (np.concatenate(c) if c else np.empty(0, dtype=np.int64) for c in columns)
+        # ファイル順（= 時刻順）を保ったまま URL ごとにまとめ、差分を戻す
+        order = np.argsort(url_id, kind='stable')
+        self.url_id, self.ts = url_id[order], ts[order]
+        self.likes = _group_cumsum(self.url_id, d_likes[order]) if len(order) else d_likes
+        self.views = _group_cumsum(self.url_id, d_views[order]) if len(order) else d_views
+        self._index()
+
+    def _index(self):
+        """url_id → その URL の行の範囲 [start, end)"""
+        ids, starts = np.unique(self.url_id, return_index=True)
+        ends = np.concatenate((starts[1:], [len(self.url_id)]))
+        self._ranges = {int(i): (int(s), int(e)) for i, s, e in zip(ids, starts, ends)}
+
+    def __len__(self):
+        return len(self.url_id)
+
+    # --- 書き込み ---
+
+    def add(self, url, likes, views, ts=None):
+        if url not in self.url_ids:
+            self.url_ids[url] = len(self.urls)
+            self.urls.append(url)
+        self._pending.append((self.url_ids[url], int(ts if ts is not None else time.time()), int(likes), int(views)))
+
+    def _last(self, url_id):
+        r = self._ranges.get(url_id)
+        if r is None: return 0, 0
+        return int(self.likes[r[1] - 1]), int(self.views[r[1] - 1])
+
+    def flush(self):
+        """溜まった行を1ブロックとして追記する。追記した行数を返す"""
+        if not self._pending: return 0
+        rows = sorted(self._pending)
+        url_id, ts, likes, views = (np.array(c, dtype=np.int64) for c in zip(*rows))
+
+        # 同じURLの前回の値との差（ブロック内に同じURLが複数あればその前の行との差）
+        same = np.concatenate(([False], url_id[1:] == url_id[:-1]))
+        prev = np.array([self._last(int(i)) for i in url_id], dtype=np.int64).reshape(-1, 2)
+        prev_likes = np.where(same, np.concatenate(([0], likes[:-1])), prev[:, 0])
+        prev_views = np.where(same, np.concatenate(([0], views[:-1])), prev[:, 1])
+
+        base_ts = int(ts.min())
+        payload = zlib.compress(encode_varints(np.concatenate([
+            np.diff(url_id, prepend=0).astype(np.uint64),
+            (ts - base_ts).astype(np.uint64),
+            _zigzag(likes - prev_likes),
+            _zigzag(views - prev_views),
+        ])), 9)
+
+        if len(self.urls) > self._saved_urls:
+            with open(self.urls_path, 'a', encoding='utf-8') as f:
+                f.writelines(url + '\n' for url in self.urls[self._saved_urls:])
+            self._saved_urls = len(self.urls)
+        mode = 'r+b' if os.path.exists(self.path) else 'wb'
+        with open(self.path, mode) as f:
+            f.seek(self._valid_size)
+            f.truncate()
+            f.write(HEADER.pack(MAGIC, len(rows), base_ts, len(payload)) + payload)
+            self._valid_size = f.tell()
+
+        merged = np.concatenate([
+            np.stack([self.url_id, self.ts, self.likes, self.views]),
+            np.stack([url_id, ts, likes, views])
+        ], axis=1)
+        merged = merged[:, np.argsort(merged[0], kind='stable')]
+        self.url_id, self.ts, self.likes, self.views = merged
+        self._index()
+        self._pending = []
+        return len(rows)
+
+    # --- 読み込み ---
+
+    def series(self, url):
+        """(時刻, いいね数, インプ) の配列"""
+        r = self._ranges.get(self.url_ids.get(url, -1))
+        if r is None: return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+        s, e = r
+        return self.ts[s:e], self.likes[s:e], self.views[s:e]
+
+    def growth_rate(self, url, window=DAY):
+        """直近 window 秒のいいねの伸び（件/時）。スナップショットが2回未満なら None"""
+        ts, likes, _ = self.series(url)
+        if len(ts) < 2: return None
+        base = max(np.searchsorted(ts, ts[-1] - window, side='right') - 1, 0)
+        if base == len(ts) - 1: base -= 1
+        return float(likes[-1] - likes[base]) / max((ts[-1] - ts[base]) / 3600, 1e-9)
+
+    def time_to_likes(self, url, n, start=None):
+        """
+        いいねが n 件に届くまでの秒数（start = 投稿時刻など、省略時は最初のスナップショット）。
+        スナップショットの間は直線で補間する。まだ届いていなければ None
+        """
+        ts, likes, _ = self.series(url)
+        hit = np.flatnonzero(likes >= n)
+        if not len(hit): return None
+        i = hit[0]
+        start = ts[0] if start is None else start
+        if i == 0 or likes[i] == likes[i - 1]: return float(ts[i] - start)
+        reached = ts[i - 1] + (ts[i] - ts[i - 1]) * (n - likes[i - 1]) / (likes[i] - likes[i - 1])
+        return float(reached - start)
+
+    def velocity_ranking(self, top=20, window=DAY, now=None):
+        """
+        直近 window 秒のいいねの伸び（件/時）が大きい順。
+        最後のスナップショットが 2×window 以内の URL だけを見る
+        """
+        if not len(self.url_id): return []
+        now = now or time.time()
+        ends = np.concatenate((np.flatnonzero(self.url_id[1:] != self.url_id[:-1]), [len(self.url_id) - 1]))
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        keep = (ends > starts) & (self.ts[ends] >= now - 2 * window)
+        ends, starts = ends[keep], starts[keep]
+        if not len(ends): return []
+
+        # url_id と時刻を1本のキーにして、各URLの「window 前の時点」の行を二分探索で探す
+        key = (self.url_id << 34) + self.ts
+        target = (self.url_id[ends] << 34) + self.ts[ends] - window
+        base = np.clip(np.searchsorted(key, target, side='right') - 1, starts, ends - 1)
+        gain = self.likes[ends] - self.likes[base]
+        rate = gain / np.maximum((self.ts[ends] - self.ts[base]) / 3600, 1e-9)
+
+        best = np.argsort(-rate, kind='stable')[:top]
+        return [{
+            'url': self.urls[self.url_id[ends[i]]],
+            'likes_per_hour': round(float(rate[i]), 2),
+            'gain': int(gain[i]),
+            'likes': int(self.likes[ends[i]]),
+            'views': int(self.views[ends[i]]),
+        } for i in best if gain[i] > 0]
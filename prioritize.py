@@ -1,32 +1,39 @@
-import json
 import os
-
-def prioritize_members():
+import sys
+from author_index import build_author_index, load_authors
+from record_store import RecordStore
+from refresh_scheduler import authors_queue, dimensions_queue, load_member_weights, metrics_queue
+
+# 次回の fetch_metrics / fetch_authors / fetch_dimensions が取る順番を表示する（ファイルは書き換えない）
+# 優先したいメンバーは members.json の "priority" を大きくする（例: "priority": 3）
+# 使い方: python prioritize.py [表示件数]
+def prioritize_members(top=20):
     file_path = 'collect.json'
     if not os.path.exists(file_path): return
 
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    # ここに優先したいメンバー名を入れる
-    targets = ["花芽すみれ", "花芽なずな"]
+    store = RecordStore(json_path=file_path)
+    data = store.load()
+    store.close()
 
-    # 1. 優先メンバー (未取得)
-    priority_todo = [d for d in data if d.get('member_name') in targets and d.get('like_count', 0) == 0]
-    
-    # 2. その他 (未取得)
-    other_todo = [d for d in data if d.get('member_name') not in targets and d.get('like_count', 0) == 0]
-    
-    # 3. 完了済み
-    done = [d for d in data if d.get('like_count', 0) > 0]
+    weights = load_member_weights()
+    boosted = {name: w for name, w in weights.items() if w != 1}
+    print(f"⭐ 優先メンバー: {boosted or 'なし'}")
 
-    # 並び替え: [優先] -> [その他] -> [完了]
-    new_order = priority_todo + other_todo + done
+    queue = metrics_queue(data, weights)
+    print(f"\n📈 fetch_metrics: {len(queue)} 件")
+    for score, item in queue.peek(top):
+        print(f"  {score:8.2f}  {item.get('member_name')}  {item['url']}  (last: {item.get('last_fetched', '-')})")
 
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(new_order, f, ensure_ascii=False, indent=2)
+    index, _ = build_author_index(data)
+    queue = authors_queue(data, index, load_authors(), weights)
+    print(f"\n👤 fetch_authors: {len(queue)} 人")
+    for score, user_id in queue.peek(top):
+        print(f"  {score:8.2f}  {user_id}  ({len(index[user_id])} posts)")
 
-    print(f"✨ 並び替え完了！ 次回は {len(priority_todo)} 件の推しデータを最優先で取得します。")
+    queue = dimensions_queue(data, weights)
+    print(f"\n📸 fetch_dimensions: {len(queue)} 件")
+    for score, item in queue.peek(top):
+        print(f"  {score:8.2f}  {item.get('member_name')}  {item['url']}")
 
 if __name__ == "__main__":
-    prioritize_members()
\ No newline at end of file
+    prioritize_members(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,54 @@
+import asyncio
+import random
+import time
+
+class RateGovernor:
+    """
+    全ワーカー共通のトークンバケット。
+    1分あたりのリクエスト数の上限を守り、タイムアウトやログイン画面に当たったら
+    レートを下げて全体を一時停止する（成功が続けば少しずつ元のレートに戻す）。
+    """
+
+    def __init__(self, requests_per_minute=30, burst=3, min_per_minute=4, backoff_seconds=30):
+        self.max_rate = requests_per_minute / 60.0
+        self.min_rate = min_per_minute / 60.0
+        self.rate = self.max_rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.backoff_seconds = backoff_seconds
+        self.paused_until = 0.0
+        self.updated_at = time.monotonic()
+        self.penalties = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """トークンが1つ取れるまで待つ"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, reason=""):
+        """タイムアウト・ログイン壁などで呼ぶ。レート半減 + 一時停止"""
+        self.penalties += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0.0
+        pause = self.backoff_seconds * random.uniform(1.0, 1.5)
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        print(f"   🐢 Back off {pause:.0f}s ({reason}) -> {self.rate * 60:.1f} req/min")
+
+    def reward(self):
+        """成功時に呼ぶ。レートを少しずつ上限まで戻す"""
+        self.rate = min(self.max_rate, self.rate * 1.1)
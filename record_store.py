@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+DB_FILE = 'collect.sqlite'   # 作業用ストア（URLが主キー）
+JSON_FILE = 'collect.json'   # admin.html / GitHub Actions のコミット用エクスポート
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False)
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+class RecordStore:
+    """
+    collect.json の代わりに使うSQLiteストア。
+    更新は変わった行だけを1トランザクションで書くので、チェックポイントが O(1) でクラッシュにも強い。
+    collect.json は export_json() で書き出す（admin.htmlなどで手編集された時は開く時に取り込み直す）。
+    """
+
+    def __init__(self, path=DB_FILE, json_path=JSON_FILE):
+        self.path = path
+        self.json_path = json_path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS records (
+                url TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_records_seq ON records (seq);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS deleted (url TEXT PRIMARY KEY, deleted_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS import_rows (
+                source TEXT NOT NULL,
+                row_key TEXT NOT NULL,
+                row_hash TEXT NOT NULL,
+                PRIMARY KEY (source, row_key)
+            );
+        """)
+        self.conn.commit()
+        self._sync_from_json()
+
+    # --- collect.json との同期 ---
+
+    def _meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def _sync_from_json(self):
+        """
+        collect.json が最後に書き出した時から変わっていれば取り込み直す。
+        並び順が保たれている（削除と末尾への追加だけ）なら差分だけ反映し、
+        そうでなければ丸ごと入れ替えて generation を進める
+        """
+        if not os.path.exists(self.json_path): return
+        json_hash = file_hash(self.json_path)
+        if json_hash == self._meta('json_hash'): return
+
+        with open(self.json_path, 'r', encoding='utf-8') as f:
+            try: data = json.load(f)
+            except: return
+
+        records = {}
+        for d in data:
+            if d.get('url') and d['url'] not in records: records[d['url']] = d
+        json_urls = list(records)
+        current_order = [row[0] for row in self.conn.execute("SELECT url FROM records ORDER BY seq")]
+        kept = [u for u in current_order if u in records]
+
+        if current_order and json_urls[:len(kept)] == kept:
+            removed = self.delete([u for u in current_order if u not in records])
+            changed = self.upsert_many(records.values())
+            with self.conn:
+                self._set_meta('json_hash', json_hash)
+            print(f"📥 Synced {self.json_path}: {changed} changed, {removed} removed")
+            return
+
+        now = time.time()
+        with self.conn:
+            self.conn.execute("DELETE FROM records")
+            self.conn.execute("DELETE FROM deleted")
+            self.conn.executemany(
+                "INSERT INTO records (url, seq, data, updated_at) VALUES (?, ?, ?, ?)",
+                ((url, i, _dumps(d), now) for i, (url, d) in enumerate(records.items()))
+            )
+            self._set_meta('json_hash', json_hash)
+            self._bump_generation()
+        print(f"📥 Imported {len(records)} records from {self.json_path}")
+
+    def _bump_generation(self):
+        self._set_meta('generation', str(self.generation() + 1))
+
+    def generation(self):
+        """並び順が入れ替わるたびに増える番号（差分集計の作り直し判定用）"""
+        return int(self._meta('generation') or 0)
+
+    def export_json(self):
+        """
+        collect.json をアトミックに書き出す（一時ファイル → rename）。
+        1行ずつ書くので全件をメモリに載せない（出力は json.dump(indent=2) と同じ）
+        """
+        count = 0
+        tmp_path = self.json_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for _, _, record in self.rows():
+                f.write(",\n  " if count else "[\n  ")
+                f.write(json.dumps(record, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+                count += 1
+            f.write("\n]" if count else "[]")
+        os.replace(tmp_path, self.json_path)
+        with self.conn:
+            self._set_meta('json_hash', file_hash(self.json_path))
+        return count
+
+    # --- 読み込み ---
+
+    def load(self):
+        """全レコードを保存順のリストで返す"""
+        return [json.loads(row[0]) for row in self.conn.execute("SELECT data FROM records ORDER BY seq")]
+
+    def rows(self):
+        """(URL, seq, レコード) を保存順に返す"""
+        for url, seq, data in self.conn.execute("SELECT url, seq, data FROM records ORDER BY seq"):
+            yield url, seq, json.loads(data)
+
+    def changed_since(self, timestamp):
+        """timestamp 以降に追加・更新された (URL, seq, レコード)"""
+        for url, seq, data in self.conn.execute(
+            "SELECT url, seq, data FROM records WHERE updated_at >= ? ORDER BY seq", (timestamp,)
+        ):
+            yield url, seq, json.loads(data)
+
+    def deleted_since(self, timestamp):
+        """timestamp 以降に削除されたURL"""
+        return [row[0] for row in self.conn.execute("SELECT url FROM deleted WHERE deleted_at >= ?", (timestamp,))]
+
+    def get(self, url):
+        row = self.conn.execute("SELECT data FROM records WHERE url = ?", (url,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, urls):
+        """URLのリストをまとめて引いて {URL: レコード} を返す"""
+        urls = list(dict.fromkeys(urls))
+        found = {}
+        for start in range(0, len(urls), 500):
+            chunk = urls[start:start + 500]
+            for url, data in self.conn.execute(
+                f"SELECT url, data FROM records WHERE url IN ({','.join('?' * len(chunk))})", chunk
+            ):
+                found[url] = json.loads(data)
+        return found
+
+    def urls(self):
+        return {row[0] for row in self.conn.execute("SELECT url FROM records")}
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    # --- 書き込み ---
+
+    def upsert_many(self, records, front=False):
+        """
+        URLをキーに追加・更新する。新規は末尾（front=True なら先頭に1件ずつ、つまり最後の1件が一番前）に追加し、
+        中身が同じ行は書き換えない。変更された行数を返す
+        """
+        now = time.time()
+        seq = "(SELECT COALESCE(MIN(seq), 0) - 1 FROM records)" if front else "(SELECT COALESCE(MAX(seq), -1) + 1 FROM records)"
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(f"""
+                INSERT INTO records (url, seq, data, updated_at)
+                VALUES (?, {seq}, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                WHERE records.data != excluded.data
+            """, ((r['url'], _dumps(r), now) for r in records if r.get('url')))
+            return self.conn.total_changes - before
+
+    def upsert(self, record):
+        return self.upsert_many([record])
+
+    def delete(self, urls):
+        urls = list(urls)
+        now = time.time()
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany("DELETE FROM records WHERE url = ?", ((u,) for u in urls))
+            removed = self.conn.total_changes - before
+            self.conn.executemany("INSERT OR REPLACE INTO deleted VALUES (?, ?)", ((u, now) for u in urls))
+            return removed
+
+    def reorder(self, urls):
+        """保存順を urls の順に並べ替える（載っていないURLはその後ろ、元の順番のまま）"""
+        with self.conn:
+            # 先頭追加で seq が負になっていても、並べ替える分と重ならない位置までずらす
+            self.conn.execute("UPDATE records SET seq = seq - (SELECT MIN(seq) FROM records) + ?", (len(urls) + 1,))
+            self.conn.executemany("UPDATE records SET seq = ? WHERE url = ?", ((i, u) for i, u in enumerate(urls)))
+            self._bump_generation()
+
+    # --- 取り込み元の変更検知（import_csv 用） ---
+
+    def import_file_hash(self, source):
+        return self._meta(f'import_file:{source}')
+
+    def set_import_file_hash(self, source, value):
+        with self.conn:
+            self._set_meta(f'import_file:{source}', value)
+
+    def import_row_hashes(self, source, keys):
+        """前回取り込んだ時の {行のキー: 行のハッシュ}"""
+        keys = list(keys)
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            found.update(self.conn.execute(
+                f"SELECT row_key, row_hash FROM import_rows WHERE source = ? AND row_key IN ({','.join('?' * len(chunk))})",
+                [source, *chunk]
+            ))
+        return found
+
+    def set_import_row_hashes(self, source, pairs):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO import_rows VALUES (?, ?, ?)", ((source, k, h) for k, h in pairs)
+            )
+
+    def close(self):
+        self.conn.close()
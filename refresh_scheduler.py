@@ -0,0 +1,123 @@
+import heapq
+import itertools
+import json
+import math
+import os
+import time
+from datetime import datetime
+
+# fetch_metrics / fetch_authors / fetch_dimensions が「次にどれを取るか」を決める優先度付きキュー。
+# collect.json の並び順は使わないので、優先度を変えるのにファイルを書き直す必要はない。
+# メンバーの優先度は members.json の "priority"（省略時 1）で指定する
+MEMBERS_FILE = 'members.json'
+MIN_INTERVAL = float(os.environ.get("REFRESH_MIN_HOURS", 1)) * 3600     # 投稿直後でもこれより短い間隔では取り直さない
+MAX_INTERVAL = float(os.environ.get("REFRESH_MAX_DAYS", 30)) * 86400    # 古い投稿でもこの間隔では取り直す
+REFRESH_RATIO = float(os.environ.get("REFRESH_RATIO", 0.25))            # 取り直す間隔 = 投稿の経過時間 × この値
+FAILED_RETRY = 86400    # 取得に失敗したレコードは1日おいてから再挑戦する
+NEW_BOOST = 100         # 未取得のレコードは（同じメンバー優先度なら）取り直しより先にする
+OVERDUE_CAP = 4         # 期限切れの度合いはここで頭打ち（長く放置した投稿だけが先頭に居座らないように）
+
+def load_member_weights(path=MEMBERS_FILE):
+    """{メンバー名: 優先度}（members.json に "priority" がないメンバーは 1）"""
+    if not os.path.exists(path): return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        try: members = json.load(f)
+        except: return {}
+    return {m['name']: float(m.get('priority', 1)) for m in members}
+
+def parse_time(text):
+    """ISO形式の日時 → UNIX時刻（タイムゾーンなしはローカル時刻として扱う）"""
+    if not text: return None
+    try: return datetime.fromisoformat(text.replace('Z', '+00:00')).timestamp()
+    except ValueError: return None
+
+def posted_at(item):
+    """投稿日時（GraphQL で取れた created_at、なければ収集した時刻）"""
+    return parse_time(item.get('created_at')) or parse_time(item.get('collected_at'))
+
+def refresh_interval(age):
+    """経過時間 age 秒の投稿を取り直す間隔（新しい投稿ほど短い）"""
+    return min(max(age * REFRESH_RATIO, MIN_INTERVAL), MAX_INTERVAL)
+
+def metrics_priority(item, weights, now):
+    """
+    いいね数・インプを取り直す優先度（大きいほど先、まだ取り直さなくてよければ None）。
+    未取得 > 期限切れの度合い × 前回からの伸びの見込み の順
+    """
+    weight = weights.get(item.get('member_name'), 1.0)
+    posted = posted_at(item) or now
+    age_days = max(now - posted, 0) / 86400
+    fetched = parse_time(item.get('last_fetched'))
+    if fetched is None:
+        return weight * (NEW_BOOST + 1 / (1 + age_days))
+
+    since = now - fetched
+    interval = refresh_interval(max(fetched - posted, 0))
+    # 前回の取得に失敗した（last_failed が last_fetched と同じ）か、まだ一度も数値が取れていない
+    failed = item.get('last_failed') == item['last_fetched'] or (item.get('like_count', 0) == 0 and not item.get('text'))
+    if failed: interval = max(interval, FAILED_RETRY)
+    if since < interval: return None
+
+    # 前回の時点までと同じペースで伸びると見た、前回から増えたいいね数の見込み
+    expected = item.get('like_count', 0) * since / max(fetched - posted, MIN_INTERVAL)
+    return weight * min(since / interval, OVERDUE_CAP) * (1 + math.log1p(expected))
+
+def dimensions_priority(item, weights, now):
+    """画像サイズ未取得のレコードの優先度（新しい投稿ほど先）"""
+    if not item.get('images') or item.get('width'): return None
+    age_days = max(now - (posted_at(item) or now), 0) / 86400
+    return weights.get(item.get('member_name'), 1.0) * (1 + 1 / (1 + age_days))
+
+def author_priority(user_id, posts, weights):
+    """フォロワー数未取得のユーザーの優先度（優先メンバーの投稿があり、投稿数が多いほど先）"""
+    weight = max((weights.get(p.get('member_name'), 1.0) for p in posts), default=1.0)
+    return weight * (1 + math.log1p(len(posts)))
+
+class RefreshQueue:
+    """優先度の高い順に取り出すヒープ（同じ優先度なら入れた順）"""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+
+    def push(self, priority, task):
+        heapq.heappush(self._heap, (-priority, next(self._counter), task))
+
+    def pop(self):
+        """一番優先度の高いタスク（空なら None）"""
+        if not self._heap: return None
+        return heapq.heappop(self._heap)[2]
+
+    def __len__(self):
+        return len(self._heap)
+
+    @classmethod
+    def build(cls, tasks, priority):
+        """priority(task) が None でないタスクだけを入れる"""
+        queue = cls()
+        for task in tasks:
+            p = priority(task)
+            if p is not None: queue.push(p, task)
+        return queue
+
+    def peek(self, n):
+        """上位 n 件を (優先度, タスク) で返す（取り出さない）"""
+        return [(-p, task) for p, _, task in heapq.nsmallest(n, self._heap)]
+
+def metrics_queue(data, weights=None, now=None):
+    weights = load_member_weights() if weights is None else weights
+    now = now or time.time()
+    return RefreshQueue.build(data, lambda item: metrics_priority(item, weights, now) if item.get('url') else None)
+
+def dimensions_queue(data, weights=None, now=None):
+    weights = load_member_weights() if weights is None else weights
+    now = now or time.time()
+    return RefreshQueue.build(data, lambda item: dimensions_priority(item, weights, now))
+
+def authors_queue(data, index, authors, weights=None):
+    """index: build_author_index の {ユーザーID: レコード位置}。フォロワー数が未取得のユーザーだけを入れる"""
+    weights = load_member_weights() if weights is None else weights
+    return RefreshQueue.build(
+        [u for u in index if authors.get(u, 0) == 0],
+        lambda u: author_priority(u, [data[i] for i in index[u]], weights)
+    )
@@ -0,0 +1,44 @@
+import json
+import os
+import asyncio
+from playwright.async_api import async_playwright
+from record_store import RecordStore
+from image_hash import DuplicateIndex
+from sweep_scheduler import MAX_PAGES, merge_accepted
+import scraper_x
+import scraper_instagram
+
+# X と Instagram を1つのプロセスで同時に巡回する（CLIPモデルも1回だけ読み込む）
+# 使い方: python scrape_all.py   (SCRAPER_CONTEXTS / SCRAPER_MAX_PAGES で並列度を調整)
+
+async def main():
+    if not os.path.exists('members.json'): return
+    with open('members.json', 'r', encoding='utf-8') as f:
+        members = json.load(f)
+
+    data_file = 'collect.json'
+    store = RecordStore(json_path=data_file)
+    existing_urls = store.urls()
+    dedup = DuplicateIndex.from_records(store.load()) # 保存済みの画像の転載は巡回中に、今回の候補どうしは merge_accepted で拾う
+    new_records = []
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        limiter = asyncio.Semaphore(MAX_PAGES) # 同時に開くページ数は2サイト合計で制限
+        x_results, insta_results = await asyncio.gather(
+            scraper_x.collect(browser, members, limiter, known_urls=existing_urls, dedup=dedup),
+            scraper_instagram.collect(browser, members, limiter, known_urls=existing_urls, dedup=dedup)
+        )
+        await browser.close()
+
+    # 重複チェックと保存はここで1回だけ。X → Instagram の順に見るので、サイトをまたぐ転載は常に X の方が残る
+    merge_accepted(x_results, existing_urls, new_records, dedup)
+    merge_accepted(insta_results, existing_urls, new_records, dedup)
+
+    store.upsert_many(new_records)
+    store.export_json()
+    store.close()
+    print(f"🎉 Scraping Finished! {len(new_records)} new records")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,47 +1,27 @@
 import json
 import os
 import asyncio
-import random
-import requests
-from io import BytesIO
+import functools
+import time
 from datetime import datetime
 from playwright.async_api import async_playwright
-import torch
-from PIL import Image
-from transformers import CLIPProcessor, CLIPModel
+from judge_pipeline import JudgePipeline
+from sweep_scheduler import merge_accepted, ordered, sweep
+from scroll_harvest import harvest, wait_for_posts
+from dom_extract import INSTAGRAM_SELECTORS, extract_posts
+from record_store import RecordStore
+from image_hash import DuplicateIndex
+from clip_classifier import ClipJudge, LABELS_INSTAGRAM
 
 # ■■■ 設定：CLIPモデル ■■■
-MODEL_ID = "openai/clip-vit-base-patch32"
-print("🚀 Loading Local AI (CLIP)...")
-try:
-    model = CLIPModel.from_pretrained(MODEL_ID)
-    processor = CLIPProcessor.from_pretrained(MODEL_ID)
-except:
-    model = None
+judge = ClipJudge(LABELS_INSTAGRAM)
 
-def check_image_locally(image_url, member_name):
-    if model is None: return True
-    try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(image_url, headers=headers, timeout=10)
-        if response.status_code != 200: return False
-        
-        image = Image.open(BytesIO(response.content)).convert("RGB")
-        labels = [
-            f"a cosplay photo of {member_name}",
-            "game screenshot or text",
-            "random object"
-        ]
-        inputs = processor(text=labels, images=image, return_tensors="pt", padding=True)
-        with torch.no_grad():
-            outputs = model(**inputs)
-        
-        return outputs.logits_per_image.softmax(dim=1).argmax().item() == 0
-    except:
-        return True
+POST_SELECTOR = INSTAGRAM_SELECTORS["post"]
+SCROLL_BUDGET = 5 # タグページは人気投稿が先頭に来るので深追いしない
 
-async def scrape_instagram_tag(context, member):
-    results = []
+async def scrape_instagram_tag(context, member, pipeline, known_urls=frozenset()):
+    """候補を pipeline に流す（判定は待たない）。投入した件数を返す"""
+    submitted = 0
     page = await context.new_page()
     tag = f"{member['name']}コスプレ"
     url = f"https://www.instagram.com/explore/tags/{tag}/"
@@ -49,45 +29,54 @@ async def scrape_instagram_tag(context, member):
     print(f"--- [Insta] Searching: #{tag} ---")
     try:
         await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-        await asyncio.sleep(random.uniform(6, 10))
+        found = await wait_for_posts(page, POST_SELECTOR)
 
         if "login" in page.url:
             print(f"⚠️ Login required/Cookie expired")
-            return []
-
-        posts = await page.query_selector_all('a[href*="/p/"]')
-        print(f"   Found {len(posts)} posts")
+            await page.close()
+            return 0
+        if not found:
+            print("   Found 0 posts")
+            await page.close()
+            return 0
 
-        for post in posts[:10]:
-            try:
-                post_url = f"https://www.instagram.com{await post.get_attribute('href')}"
-                img_elem = await post.query_selector('img')
-                if not img_elem: continue
-                
-                img_src = await img_elem.get_attribute('src')
-                alt_text = await img_elem.get_attribute('alt')
-                caption = alt_text if alt_text else ""
+        walk_started = time.perf_counter()
+        posts, stop_reason, scrolls = await harvest(page, POST_SELECTOR, extract_posts, known_urls, budget=SCROLL_BUDGET)
+        print(f"   Found {len(posts)} new posts ({scrolls} scrolls, stop: {stop_reason})")
 
-                if img_src and post_url:
-                    if check_image_locally(img_src, member['name']):
-                        results.append({
-                            "member_name": member['name'],
-                            "author_name": "InstagramUser",
-                            "content": caption,
-                            "images": [img_src],
-                            "url": post_url,
-                            "source": "Instagram",
-                            "collected_at": datetime.now().isoformat()
-                        })
-                        print(f"   ✅ Saved: {post_url}")
-                    else:
-                        print(f"   🗑️ Rejected by AI")
-            except: continue
+        for post in posts:
+            if post['image'] and post['url']:
+                await pipeline.submit({
+                    "member_name": member['name'],
+                    "author_name": "InstagramUser",
+                    "content": post['caption'],
+                    "images": [post['image']],
+                    "url": post['url'],
+                    "source": "Instagram",
+                    "collected_at": datetime.now().isoformat()
+                }, browse_seconds=time.perf_counter() - walk_started)
+                submitted += 1
+                walk_started = time.perf_counter()
 
     except Exception as e:
         print(f"❌ Error: {e}")
     
     await page.close()
+    return submitted
+
+async def collect(browser, members, limiter=None, known_urls=frozenset(), dedup=None):
+    """全メンバーを複数のコンテキストで巡回し、(候補, Verdict) をメンバー順に返す"""
+    if not os.path.exists('auth_instagram.json'):
+        print("Error: auth_instagram.json not found.")
+        return []
+
+    # ダウンロードとCLIP判定は裏で進め、ブラウザは次のメンバーへ進む
+    async with JudgePipeline(judge, dedup=dedup) as pipeline:
+        scrape = functools.partial(scrape_instagram_tag, known_urls=known_urls)
+        await sweep(browser, members, scrape, pipeline, "auth_instagram.json", pause=(5, 10), limiter=limiter)
+        results = ordered(await pipeline.drain(), members)
+        pipeline.report()
+    print(f"🧠 [Insta] CLIP {judge.stats()}")
     return results
 
 async def main():
@@ -96,43 +85,22 @@ async def main():
         members = json.load(f)
 
     data_file = 'collect.json'
-    all_data = []
-    if os.path.exists(data_file):
-        with open(data_file, 'r', encoding='utf-8') as f:
-            try: all_data = json.load(f)
-            except: all_data = []
-    
-    existing_urls = {item['url'] for item in all_data}
+    store = RecordStore(json_path=data_file)
+    existing_urls = store.urls()
+    dedup = DuplicateIndex.from_records(store.load()) # 転載チェック用の知覚ハッシュ索引
+    new_records = []
 
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
-        
-        if not os.path.exists('auth_instagram.json'):
-            print("Error: auth_instagram.json not found.")
-            await browser.close()
-            return
-
-        context = await browser.new_context(
-            storage_state="auth_instagram.json",
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36"
-        )
-        
-        for member in members:
-            new_posts = await scrape_instagram_tag(context, member)
-            count = 0
-            for post in new_posts:
-                if post['url'] not in existing_urls:
-                    all_data.append(post)
-                    existing_urls.add(post['url'])
-                    count += 1
-            
-            await asyncio.sleep(random.uniform(5, 10))
-        
-        with open(data_file, 'w', encoding='utf-8') as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=2)
-        
+        results = await collect(browser, members, known_urls=existing_urls, dedup=dedup)
         await browser.close()
-        print("🎉 Instagram Scraping Finished!")
+
+    merge_accepted(results, existing_urls, new_records, dedup)
+
+    store.upsert_many(new_records)
+    store.export_json()
+    store.close()
+    print("🎉 Instagram Scraping Finished!")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
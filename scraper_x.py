@@ -1,66 +1,26 @@
 import json
 import os
 import asyncio
-import random
-import requests
-from io import BytesIO
+import functools
+import time
 from datetime import datetime
 from playwright.async_api import async_playwright
-import torch
-from PIL import Image
-from transformers import CLIPProcessor, CLIPModel
+from judge_pipeline import JudgePipeline
+from sweep_scheduler import merge_accepted, ordered, sweep
+from scroll_harvest import harvest, wait_for_posts
+from dom_extract import X_SELECTORS, extract_tweets
+from record_store import RecordStore
+from image_hash import DuplicateIndex
+from clip_classifier import ClipJudge, LABELS_X
 
 # ■■■ 設定：CLIPモデル（CPUでも動く軽量版） ■■■
-MODEL_ID = "openai/clip-vit-base-patch32"
-print("🚀 Loading Local AI (CLIP)... This takes a moment.")
-try:
-    model = CLIPModel.from_pretrained(MODEL_ID)
-    processor = CLIPProcessor.from_pretrained(MODEL_ID)
-    print("✅ CLIP Model Loaded!")
-except Exception as e:
-    print(f"⚠️ Failed to load CLIP: {e}")
-    model = None
+judge = ClipJudge(LABELS_X)
 
-def check_image_locally(image_url, member_name):
-    """
-    画像URLをダウンロードし、CLIPで「そのキャラのコスプレか？」を判定する
-    """
-    if model is None: return True # モデル読み込み失敗時はスルーして保存
-    
-    try:
-        # 画像ダウンロード（タイムアウト設定付き）
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(image_url, headers=headers, timeout=10)
-        if response.status_code != 200: return False
-        
-        image = Image.open(BytesIO(response.content)).convert("RGB")
-        
-        # 判定ラベル（英語のほうが精度が良い）
-        # 0番目が「正解」の基準
-        labels = [
-            f"a cosplay photo of {member_name}",
-            "a screenshot of a video game or anime",
-            "text or merchandise or random object"
-        ]
-
-        inputs = processor(text=labels, images=image, return_tensors="pt", padding=True)
-        with torch.no_grad():
-            outputs = model(**inputs)
-        
-        probs = outputs.logits_per_image.softmax(dim=1)
-        top_index = probs.argmax().item()
-        
-        # 0番目の確率が一番高ければ合格
-        if top_index == 0:
-            return True
-        else:
-            return False
+TWEET_SELECTOR = X_SELECTORS["tweet"]
 
-    except Exception:
-        return True # エラー時は安全のため残す
-
-async def scrape_vspo_cosplay(context, member):
-    results = []
+async def scrape_vspo_cosplay(context, member, pipeline, known_urls=frozenset()):
+    """候補を pipeline に流す（判定は待たない）。投入した件数を返す"""
+    submitted = 0
     page = await context.new_page()
     
     # 検索クエリ（画像フィルタ付き）
@@ -70,53 +30,52 @@ async def scrape_vspo_cosplay(context, member):
     print(f"--- [X] Searching: {member['name']} ---")
     try:
         await page.goto(url, wait_until="domcontentloaded", timeout=30000)
-        await asyncio.sleep(5) # 読み込み待ち
-
-        # ツイート取得
-        tweets = await page.query_selector_all('article[data-testid="tweet"]')
-        print(f"   Found {len(tweets)} tweets")
+        if not await wait_for_posts(page, TWEET_SELECTOR): # 読み込み待ち
+            print("   Found 0 tweets")
+            await page.close()
+            return 0
 
-        for tweet in tweets[:15]: # 1人あたり最大15件チェック
-            try:
-                # 本文取得
-                content_elem = await tweet.query_selector('[data-testid="tweetText"]')
-                content = await content_elem.inner_text() if content_elem else ""
-                
-                # ノイズキーワード除外
-                if any(x in content for x in ["譲渡", "買取", "交換", "グッズ"]): continue
+        # 前回までに取ったツイートが続くところまでスクロールして新着を集める
+        walk_started = time.perf_counter()
+        tweets, stop_reason, scrolls = await harvest(page, TWEET_SELECTOR, extract_tweets, known_urls)
+        print(f"   Found {len(tweets)} new tweets ({scrolls} scrolls, stop: {stop_reason})")
 
-                # 画像URL取得
-                images = []
-                photo_divs = await tweet.query_selector_all('div[data-testid="tweetPhoto"] img')
-                for img in photo_divs:
-                    src = await img.get_attribute('src')
-                    if src: images.append(src)
-                
-                # リンク取得
-                link_elem = await tweet.query_selector('a[href*="/status/"]')
-                tweet_url = f"https://x.com{await link_elem.get_attribute('href')}" if link_elem else ""
+        for tweet in tweets:
+            # ノイズキーワード除外
+            if any(x in tweet['text'] for x in ["譲渡", "買取", "交換", "グッズ"]): continue
 
-                if images and tweet_url:
-                    # ★AI判定（1枚目だけチェック）
-                    if check_image_locally(images[0], member['name']):
-                        results.append({
-                            "member_name": member['name'],
-                            "content": content,
-                            "images": images,
-                            "url": tweet_url,
-                            "source": "X",
-                            "collected_at": datetime.now().isoformat()
-                        })
-                        print(f"   ✅ Saved: {member['name']}")
-                    else:
-                        print(f"   🗑️ Rejected by AI")
-            except Exception:
-                continue
+            if tweet['images'] and tweet['url']:
+                await pipeline.submit({
+                    "member_name": member['name'],
+                    "content": tweet['text'],
+                    "images": tweet['images'],
+                    "url": tweet['url'],
+                    "source": "X",
+                    "collected_at": datetime.now().isoformat()
+                }, browse_seconds=time.perf_counter() - walk_started)
+                submitted += 1
+                walk_started = time.perf_counter()
 
     except Exception as e:
         print(f"❌ Error: {e}")
     
     await page.close()
+    return submitted
+
+async def collect(browser, members, limiter=None, known_urls=frozenset(), dedup=None):
+    """全メンバーを複数のコンテキストで巡回し、(候補, Verdict) をメンバー順に返す"""
+    # auth.json がない場合は終了
+    if not os.path.exists('auth.json'):
+        print("Error: auth.json not found.")
+        return []
+
+    # ダウンロードとCLIP判定は裏で進め、ブラウザは次のメンバーへ進む
+    async with JudgePipeline(judge, dedup=dedup) as pipeline:
+        scrape = functools.partial(scrape_vspo_cosplay, known_urls=known_urls)
+        await sweep(browser, members, scrape, pipeline, "auth.json", pause=(3, 6), limiter=limiter)
+        results = ordered(await pipeline.drain(), members)
+        pipeline.report()
+    print(f"🧠 [X] CLIP {judge.stats()}")
     return results
 
 async def main():
@@ -127,46 +86,25 @@ async def main():
 
     # 既存データ読み込み
     data_file = 'collect.json'
-    all_data = []
-    if os.path.exists(data_file):
-        with open(data_file, 'r', encoding='utf-8') as f:
-            try: all_data = json.load(f)
-            except: all_data = []
-    
-    existing_urls = {item['url'] for item in all_data}
+    store = RecordStore(json_path=data_file)
+    existing_urls = store.urls()
+    dedup = DuplicateIndex.from_records(store.load()) # 転載チェック用の知覚ハッシュ索引
+    new_records = []
 
     # ブラウザ起動
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
-        
-        # auth.json がない場合は終了
-        if not os.path.exists('auth.json'):
-            print("Error: auth.json not found.")
-            await browser.close()
-            return
-
-        context = await browser.new_context(
-            storage_state="auth.json",
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36"
-        )
-        
-        for member in members:
-            new_tweets = await scrape_vspo_cosplay(context, member)
-            count = 0
-            for t in new_tweets:
-                if t['url'] not in existing_urls:
-                    all_data.append(t)
-                    existing_urls.add(t['url'])
-                    count += 1
-            
-            await asyncio.sleep(random.uniform(3, 6)) # BAN対策の休憩
-        
-        # 保存
-        with open(data_file, 'w', encoding='utf-8') as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=2)
-        
+        results = await collect(browser, members, known_urls=existing_urls, dedup=dedup)
         await browser.close()
-        print("🎉 X Scraping Finished!")
+
+    # ★AI判定の結果を反映（1枚目だけチェック）
+    merge_accepted(results, existing_urls, new_records, dedup)
+
+    # 保存
+    store.upsert_many(new_records)
+    store.export_json()
+    store.close()
+    print("🎉 X Scraping Finished!")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+import os
+
+# --- 設定 ---
+SCROLL_BUDGET = int(os.environ.get("SCRAPER_SCROLL_BUDGET", "10")) # 1検索あたりの最大スクロール回数
+KNOWN_STOP = int(os.environ.get("SCRAPER_KNOWN_STOP", "5"))        # 既知URLがこの件数続いたら打ち切る
+FIRST_TIMEOUT = 15000 # 最初の投稿が出るまでの待ち時間 (ms)
+MORE_TIMEOUT = 6000   # スクロール後に新しい投稿が出るまでの待ち時間 (ms)
+
+# 最後の投稿ノードを覚えておき、それ以外のノードが末尾に来たら「新しく読み込まれた」とみなす
+# （Xは画面外のノードを消すので件数では判定できない）
+_MARK_LAST = """sel => {
+    const nodes = document.querySelectorAll(sel);
+    window.__harvestLast = nodes.length ? nodes[nodes.length - 1] : null;
+    window.scrollTo(0, document.body.scrollHeight);
+}"""
+_HAS_MORE = """sel => {
+    const nodes = document.querySelectorAll(sel);
+    return nodes.length > 0 && nodes[nodes.length - 1] !== window.__harvestLast;
+}"""
+
+async def wait_for_posts(page, selector, timeout=FIRST_TIMEOUT):
+    """固定のsleepの代わりに、最初の投稿ノードが出るまで待つ。出なければ False"""
+    try:
+        await page.wait_for_selector(selector, timeout=timeout)
+        return True
+    except Exception:
+        return False
+
+async def harvest(page, selector, read_items, known_urls, budget=SCROLL_BUDGET, stop_after=KNOWN_STOP):
+    """
+    表示中の投稿を読む → 末尾までスクロール → 新しいノードを待つ を繰り返し、前回までに無いURLの投稿を集める。
+    read_items(page) は表示中の投稿を上から順に {'url': ..., ...} のリストで返す関数。
+    新しい順に並ぶページでは、既知のURLが stop_after 件続いたらそれより古い投稿は取得済みとみなして止める。
+    (新しい投稿のリスト, 止まった理由, スクロール回数) を返す
+    """
+    seen = set()
+    items = []
+    known_run = 0
+    for scrolls in range(budget + 1):
+        for item in await read_items(page):
+            url = item.get('url')
+            if not url or url in seen: continue
+            seen.add(url)
+            if url in known_urls:
+                known_run += 1
+                if known_run >= stop_after: return items, "known", scrolls
+                continue
+            known_run = 0
+            items.append(item)
+
+        if scrolls == budget: break
+        await page.evaluate(_MARK_LAST, selector)
+        try:
+            await page.wait_for_function(_HAS_MORE, arg=selector, timeout=MORE_TIMEOUT)
+        except Exception:
+            return items, "end", scrolls # これ以上読み込まれない
+    return items, "budget", budget
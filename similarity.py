@@ -0,0 +1,163 @@
+import colorsys
+import os
+
+import numpy as np
+from PIL import Image
+
+# --- 設定 ---
+QUERY_BLOCK = 1024    # 1回の行列積で扱う検索側の行数
+CORPUS_BLOCK = 16384  # 1回の行列積で扱うコーパス側の行数（QUERY_BLOCK×CORPUS_BLOCK の float32 がメモリに乗る大きさ）
+# これより多くなったら全件の行列積ではなく IVF（k-meansで分けたリストのうち近い nprobe 個だけを見る）で探す
+IVF_THRESHOLD = int(os.environ.get("SIMILAR_IVF_THRESHOLD", "500000"))
+NPROBE = int(os.environ.get("SIMILAR_NPROBE", "32"))
+COLOR_SIZE = 64 # 代表色はこの大きさに縮めた画素で k-means する
+COLOR_CLUSTERS = 4
+
+def normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+def kmeans(x, k, iters=20, seed=0, spherical=False):
+    """
+    ベクトル化した Lloyd 法。(中心 [k, d], 各行のラベル [n]) を返す。
+    spherical=True なら内積（コサイン類似度）で割り当てて中心を正規化する（埋め込み用）
+    """
+    x = np.asarray(x, dtype=np.float32)
+    n = len(x)
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    centers = x[rng.choice(n, k, replace=False)].copy()
+    labels = None
+    for _ in range(iters):
+        if spherical:
+            new_labels = np.argmax(x @ centers.T, axis=1)
+        else:
+            dist = (x * x).sum(1)[:, None] - 2 * x @ centers.T + (centers * centers).sum(1)[None, :]
+            new_labels = np.argmin(dist, axis=1)
+        if labels is not None and np.array_equal(new_labels, labels): break
+        labels = new_labels
+
+        # ラベル順に並べて reduceat でクラスタごとの和を1回で取る
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=k)
+        present = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[present]
+        sums = np.add.reduceat(x[order], starts, axis=0)
+        centers[present] = sums / counts[present][:, None] # 空のクラスタは前の中心のまま
+        if spherical: centers = normalize(centers)
+    return centers, labels
+
+def _merge_top(best_scores, best_index, scores, index, k):
+    scores = np.concatenate([best_scores, scores], axis=1)
+    index = np.concatenate([best_index, index], axis=1)
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, part, axis=1)
+        index = np.take_along_axis(index, part, axis=1)
+    return scores, index
+
+def top_k(queries, corpus, k, exclude=None):
+    """
+    ブロックごとの行列積で全件を見て、各クエリの上位 k 件 (インデックス [q, k], スコア [q, k]) を返す。
+    exclude[i] はクエリ i で除くコーパス側の行（自分自身など、-1 なら除かない）
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    q, n = len(queries), len(corpus)
+    k = min(k, n)
+    all_index = np.empty((q, k), dtype=np.int64)
+    all_scores = np.empty((q, k), dtype=np.float32)
+    for qs in range(0, q, QUERY_BLOCK):
+        block_q = queries[qs:qs + QUERY_BLOCK]
+        best_scores = np.full((len(block_q), 0), -np.inf, dtype=np.float32)
+        best_index = np.full((len(block_q), 0), -1, dtype=np.int64)
+        for cs in range(0, n, CORPUS_BLOCK):
+            scores = block_q @ corpus[cs:cs + CORPUS_BLOCK].T
+            if exclude is not None:
+                skip = np.asarray(exclude[qs:qs + QUERY_BLOCK]) - cs
+                rows = np.flatnonzero((skip >= 0) & (skip < scores.shape[1]))
+                scores[rows, skip[rows]] = -np.inf
+            index = np.broadcast_to(np.arange(cs, cs + scores.shape[1]), scores.shape)
+            best_scores, best_index = _merge_top(best_scores, best_index, scores, index, k)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        all_scores[qs:qs + QUERY_BLOCK] = np.take_along_axis(best_scores, order, axis=1)
+        all_index[qs:qs + QUERY_BLOCK] = np.take_along_axis(best_index, order, axis=1)
+    return all_index, all_scores
+
+class IVFIndex:
+    """
+    転置ファイル索引。コーパスを球面 k-means で nlist 個に分け、
+    クエリに近い nprobe 個のリストの中だけを正確に比べる（全件の行列積より速いが近似）
+    """
+
+    def __init__(self, corpus, nlist=None, seed=0, train_size=100000):
+        self.corpus = corpus
+        n = len(corpus)
+        nlist = nlist or max(1, int(4 * np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        sample = corpus[rng.choice(n, min(n, train_size), replace=False)]
+        self.centroids, _ = kmeans(sample, nlist, iters=10, seed=seed, spherical=True)
+        labels = np.concatenate([
+            np.argmax(corpus[s:s + CORPUS_BLOCK] @ self.centroids.T, axis=1) for s in range(0, n, CORPUS_BLOCK)
+        ])
+        self.order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=len(self.centroids))
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def search(self, queries, k, nprobe=NPROBE, exclude=None):
+        queries = np.asarray(queries, dtype=np.float32)
+        k = min(k, len(self.corpus))
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        all_index = np.full((len(queries), k), -1, dtype=np.int64)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+            if exclude is not None and exclude[i] >= 0:
+                candidates = candidates[candidates != exclude[i]]
+            scores = self.corpus[candidates] @ query
+            top = np.argsort(-scores, kind="stable")[:k]
+            all_index[i, :len(top)] = candidates[top]
+            all_scores[i, :len(top)] = scores[top]
+        return all_index, all_scores
+
+class SimilarityIndex:
+    """正規化した埋め込み行列 [n, d] への近傍検索（件数が増えたら自動で IVF に切り替える）"""
+
+    def __init__(self, vectors, ivf_threshold=IVF_THRESHOLD):
+        self.matrix = normalize(vectors)
+        self.ivf = IVFIndex(self.matrix) if len(self.matrix) >= ivf_threshold else None
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def query(self, rows, k):
+        """行番号 rows の画像それぞれについて、自分以外の上位 k 件を返す"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.ivf is not None:
+            return self.ivf.search(self.matrix[rows], k, exclude=rows)
+        return top_k(self.matrix[rows], self.matrix, k, exclude=rows)
+
+# --- 代表色 ---
+
+def dominant_color(image, k=COLOR_CLUSTERS):
+    """縮小した画素を k-means でまとめ、一番大きいクラスタの色を '#rrggbb' で返す"""
+    pixels = np.asarray(image.convert("RGB").resize((COLOR_SIZE, COLOR_SIZE), Image.BILINEAR), dtype=np.float32)
+    centers, labels = kmeans(pixels.reshape(-1, 3), k, iters=15)
+    r, g, b = np.clip(np.rint(centers[np.bincount(labels, minlength=len(centers)).argmax()]), 0, 255).astype(int)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+def color_name(hex_color):
+    """'#rrggbb' をざっくりした色名にする（ColorName 列用）"""
+    r, g, b = (int(hex_color[i:i + 2], 16) / 255 for i in (1, 3, 5))
+    h, s, v = colorsys.rgb_to_hsv(r, g, b)
+    if v < 0.2: return "Black"
+    if s < 0.15: return "White" if v > 0.85 else "Gray"
+    hue = h * 360
+    if hue < 15 or hue >= 345: return "Pink" if v > 0.7 and s < 0.5 else "Red"
+    if hue < 45: return "Brown" if v < 0.6 else ("Pink" if s < 0.35 else "Orange")
+    if hue < 70: return "Yellow"
+    if hue < 170: return "Green"
+    if hue < 255: return "Blue"
+    if hue < 290: return "Purple"
+    return "Pink"
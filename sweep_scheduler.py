@@ -0,0 +1,68 @@
+import asyncio
+import os
+import random
+
+from image_hash import from_hex
+
+# --- 設定 ---
+CONTEXTS = int(os.environ.get("SCRAPER_CONTEXTS", "2"))   # 1サイトあたりのブラウザコンテキスト数
+MAX_PAGES = int(os.environ.get("SCRAPER_MAX_PAGES", "3")) # 全サイト合計で同時に開くページ数の上限
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36"
+
+def shard(members, k):
+    """メンバーを k 個のグループに順番に振り分ける（0, k, 2k... が1つ目のグループ）"""
+    return [members[i::k] for i in range(k) if members[i::k]]
+
+def ordered(results, members):
+    """
+    drain() の結果をメンバーの並び順に揃える。
+    1人のメンバーは1つのコンテキストで順に巡回するので、メンバー内の順番はそのまま保たれる
+    """
+    rank = {m['name']: i for i, m in enumerate(members)}
+    return sorted(results, key=lambda r: rank.get(r[0]['member_name'], len(rank)))
+
+def merge_accepted(results, existing_urls, new_records, dedup=None):
+    """
+    合格した候補のうち未登録のURLだけを new_records に足す（existing_urls も更新）。
+    dedup (image_hash.DuplicateIndex) を渡すと、今回の候補どうしの転載もここで results の順に見て、
+    先に合格したものだけを索引に足し、その転載を弾く（パイプラインの完了のタイミングに左右されない）
+    """
+    for candidate, verdict in results:
+        duplicate_of = verdict.duplicate_of
+        if dedup is not None and verdict.accepted and candidate.get('phash'):
+            p, d = from_hex(candidate['phash']), from_hex(candidate['dhash'])
+            original = dedup.find(p, d)
+            if original is None: dedup.add(p, d, candidate['url'])
+            elif original != candidate['url']: duplicate_of = original
+        if duplicate_of:
+            print(f"   🔁 Duplicate of {duplicate_of}: {candidate['url']}")
+            continue
+        if not verdict.accepted:
+            print(f"   🗑️ Rejected by AI: {candidate['url']}")
+            continue
+        if candidate['url'] not in existing_urls:
+            new_records.append(candidate)
+            existing_urls.add(candidate['url'])
+            print(f"   ✅ Saved: {candidate['member_name']} ({candidate['url']})")
+
+async def sweep(browser, members, scrape, pipeline, storage_state, pause, contexts=CONTEXTS, limiter=None):
+    """
+    members を contexts 個のブラウザコンテキストに分けて並行に巡回する。
+    コンテキストごとに storage_state を読み込み、メンバーの間は pause 秒（min, max）のランダムな休憩を入れる。
+    limiter (asyncio.Semaphore) を複数サイトで共有すると、同時に開くページ数を全体で抑えられる
+    """
+    limiter = limiter or asyncio.Semaphore(MAX_PAGES)
+
+    async def run_shard(shard_members):
+        context = await browser.new_context(storage_state=storage_state, user_agent=USER_AGENT)
+        try:
+            # 開始をずらして同じタイミングでアクセスしないようにする
+            await asyncio.sleep(random.uniform(0, pause[1]))
+            for member in shard_members:
+                async with limiter:
+                    await scrape(context, member, pipeline)
+                await asyncio.sleep(random.uniform(*pause)) # BAN対策の休憩
+        finally:
+            await context.close()
+
+    await asyncio.gather(*(run_shard(s) for s in shard(members, max(1, contexts))))
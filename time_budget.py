@@ -0,0 +1,83 @@
+import os
+import time
+from collections import deque
+
+# 件数の上限ではなく実行時間で区切るための予算。fetch_metrics / fetch_authors / fetch_dimensions / clean_data で使う。
+# 直近の1件あたりの所要時間の移動平均から「次の1件（または1バッチ）が 予算 − 余裕 までに終わるか」を見積もり、
+# 終わらなさそうなら新しい仕事を取らずに止める（余裕の秒数は journal の反映・collect.json の書き出しに残す）
+SAFETY_MARGIN = float(os.environ.get("JOB_SAFETY_MARGIN", 120))
+WINDOW = 50 # 移動平均に使う直近の件数
+
+class TimeBudget:
+    """
+    while budget.can_start(): ... で仕事を取り出し、1件終わるごとに add(秒) か with budget.time(): で所要時間を記録する。
+    複数のワーカーで共有する時は、ワーカーごとに「自分の次の1件」が間に合うかを見る。
+    summary() で処理速度を表示する（予算・並列数の調整用）
+    """
+
+    def __init__(self, name, seconds, margin=SAFETY_MARGIN):
+        self.name = name
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.deadline = self.started + seconds - margin
+        self.recent = deque(maxlen=WINDOW)
+        self.count = 0
+        self.busy = 0.0
+        self.stopped_at = None
+
+    def average(self):
+        """直近 WINDOW 件の1件あたりの秒数（まだ1件も終わっていなければ 0）"""
+        return sum(self.recent) / len(self.recent) if self.recent else 0.0
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def can_start(self, items=1):
+        """次の items 件が締め切りまでに終わると見込めれば True（一度 False になったらその後もずっと False）"""
+        if self.stopped_at is None and self.average() * items <= self.remaining():
+            return True
+        if self.stopped_at is None:
+            self.stopped_at = time.monotonic()
+            print(f"⏳ {self.name}: time budget reached ({self.elapsed():.0f}s / {self.seconds:.0f}s, "
+                  f"~{self.average():.1f}s per item), finishing up")
+        return False
+
+    @property
+    def exhausted(self):
+        """時間切れで止めたか（残りは次の実行に回した）"""
+        return self.stopped_at is not None
+
+    def add(self, seconds):
+        self.recent.append(seconds)
+        self.count += 1
+        self.busy += seconds
+
+    def time(self):
+        """with budget.time(): ... で1件分の時間を記録する"""
+        return Timer(self)
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def summary(self, left=0):
+        """処理件数・速度・止まった理由を表示する（left = 手を付けずに残った件数）"""
+        elapsed = self.elapsed()
+        rate = self.count / elapsed * 60 if elapsed > 0 else 0.0
+        mean = self.busy / self.count if self.count else 0.0
+        reason = f"budget ({left} left for the next run)" if self.exhausted else "queue empty"
+        print(f"📊 {self.name}: {self.count} items in {elapsed:.0f}s of {self.seconds:.0f}s budget, "
+              f"{rate:.1f} items/min, {mean:.2f}s/item (recent {self.average():.2f}s), stopped by {reason}")
+
+class Timer:
+    """with で囲んだ区間の秒数を target.add(秒) に記録する（TimeBudget と lean_browser.TimingHistogram で共用）"""
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.target.add(time.perf_counter() - self.started)
+        return False
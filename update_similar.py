@@ -0,0 +1,144 @@
+import csv
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from clip_classifier import ClipJudge, LABELS_X
+from image_fetcher import shared_fetcher
+from similarity import SimilarityIndex, color_name, dominant_color
+
+# vspo_data.csv の SimilarImages（似ている画像の行番号, 0始まり）と MainColor / ColorName を作り直す。
+# 使い方: python update_similar.py         … 空欄の行（新しく足された行）だけ計算する
+#         python update_similar.py --full  … 全行の SimilarImages を計算し直す
+# 画像の埋め込みは clip_embeddings.sqlite にキャッシュされるので、2回目以降は新しい画像しかダウンロードしない
+CSV_FILE = 'vspo_data.csv'
+TOP_K = 6
+CHUNK = 64 # ダウンロード → 埋め込み → 代表色 をこの件数ずつ進める（画像をメモリに溜めない）
+DOWNLOAD_WORKERS = 8
+
+def read_csv(path=CSV_FILE):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        raw = f.read()
+    rows = list(csv.reader(io.StringIO(raw)))
+    return rows[0], rows[1:], raw.endswith('\n')
+
+def write_csv(header, rows, trailing_newline, path=CSV_FILE):
+    """元の書式（CRLF, 最終行の改行の有無）のまま一時ファイル経由で書き出す"""
+    out = io.StringIO()
+    csv.writer(out, lineterminator='\r\n').writerows([header] + rows)
+    text = out.getvalue()
+    if not trailing_newline: text = text[:-2]
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def embed_and_color(judge, urls, color_urls):
+    """
+    URLごとの埋め込み（キャッシュ優先）と、color_urls の代表色を返す。
+    キャッシュに無いか代表色が要る画像だけをダウンロードする
+    """
+    cache = judge.cache
+    vectors = cache.get_many(urls) if cache is not None else {}
+    targets = [u for u in dict.fromkeys(urls) if u not in vectors or u in color_urls]
+    print(f"🧠 埋め込みキャッシュ: {len(vectors)} 件 / ダウンロード: {len(targets)} 件")
+
+    colors = {}
+    with ThreadPoolExecutor(DOWNLOAD_WORKERS) as pool:
+        for start in range(0, len(targets), CHUNK):
+            chunk = targets[start:start + CHUNK]
+            images = {}
+            # 前処理は ClipJudge.prepare と同じ load_image で揃える（埋め込みキャッシュを共有するので）
+            for url, future in zip(chunk, [pool.submit(judge.load_image, u) for u in chunk]):
+                try:
+                    image, pixels, content_hash = future.result()
+                except Exception as e:
+                    print(f"  ❌ Skip {url}: {e}")
+                    continue
+                if image is not None: images[url] = (image, pixels, content_hash)
+
+            to_embed = [u for u in images if u not in vectors]
+            if to_embed:
+                feats = judge.embed_images([images[u][1] for u in to_embed])
+                for url, feat in zip(to_embed, feats):
+                    vectors[url] = feat
+                    if cache is not None: cache.put(url, images[url][2], feat)
+            for url in images:
+                if url in color_urls: colors[url] = dominant_color(images[url][0])
+            print(f"  [{min(start + CHUNK, len(targets))}/{len(targets)}] processed")
+    return vectors, colors
+
+def parse_ids(text):
+    return [int(x) for x in text.split(',') if x.strip().isdigit()]
+
+def refresh_existing(index, pos, rows, col, existing, added):
+    """
+    既存の行のうち、新しい行のほうが今のリストの一番遠い画像より近いものだけ SimilarImages を入れ替える。
+    入れ替えた行数を返す
+    """
+    if not existing or not added: return 0
+    added = np.asarray(added)
+    added_matrix = index.matrix[[pos[i] for i in added]]
+    updated = 0
+    for start in range(0, len(existing), 4096):
+        block = existing[start:start + 4096]
+        block_matrix = index.matrix[[pos[i] for i in block]]
+        new_scores = block_matrix @ added_matrix.T # [block, added]
+        for r, row_id in enumerate(block):
+            current = [i for i in parse_ids(rows[row_id][col['SimilarImages']]) if i in pos and i != row_id]
+            current_scores = (index.matrix[[pos[i] for i in current]] @ block_matrix[r]) if current else np.empty(0)
+            weakest = current_scores.min() if len(current) >= TOP_K else -np.inf
+            better = np.flatnonzero(new_scores[r] > weakest)
+            if not len(better): continue
+            merged = sorted(zip(np.concatenate([current_scores, new_scores[r][better]]).tolist(), current + added[better].tolist()),
+                            key=lambda x: -x[0])[:TOP_K]
+            rows[row_id][col['SimilarImages']] = ",".join(str(i) for _, i in merged)
+            updated += 1
+    return updated
+
+def update_similar(full=False):
+    if not os.path.exists(CSV_FILE):
+        print(f"❌ {CSV_FILE} が見つかりません。")
+        return
+    header, rows, trailing_newline = read_csv(CSV_FILE)
+    col = {name: header.index(name) for name in ('image', 'MainColor', 'ColorName', 'SimilarImages')}
+    for row in rows:
+        row.extend([''] * (len(header) - len(row)))
+
+    judge = ClipJudge(LABELS_X)
+    if not judge.available:
+        print("❌ CLIP model is not available. Abort.")
+        return
+
+    urls = [row[col['image']].strip() for row in rows]
+    color_urls = {urls[i] for i, row in enumerate(rows) if urls[i] and not row[col['MainColor']]}
+    vectors, colors = embed_and_color(judge, [u for u in urls if u], color_urls)
+
+    for i, row in enumerate(rows):
+        if not row[col['MainColor']] and urls[i] in colors:
+            row[col['MainColor']] = colors[urls[i]]
+            row[col['ColorName']] = color_name(colors[urls[i]])
+
+    have = [i for i in range(len(rows)) if urls[i] in vectors]
+    if len(have) < 2:
+        print("⚠️ 埋め込みが2件未満なので SimilarImages は計算しません")
+    else:
+        pos = {row_id: p for p, row_id in enumerate(have)}
+        index = SimilarityIndex(np.stack([vectors[urls[i]] for i in have]))
+        targets = [i for i in have if full or not rows[i][col['SimilarImages']].strip()]
+        if targets:
+            found, _ = index.query([pos[i] for i in targets], TOP_K)
+            for row_id, neighbours in zip(targets, found):
+                rows[row_id][col['SimilarImages']] = ",".join(str(have[p]) for p in neighbours if p >= 0)
+        target_set = set(targets)
+        refreshed = 0 if full else refresh_existing(index, pos, rows, col, [i for i in have if i not in target_set], targets)
+        print(f"🔎 SimilarImages: 新規 {len(targets)} 行 / 既存の更新 {refreshed} 行 ({len(have)} 枚, {'IVF' if index.ivf else '全件'})")
+
+    write_csv(header, rows, trailing_newline, CSV_FILE)
+    print(f"✨ 完了！ 代表色 {len(colors)} 件 / {judge.stats()}")
+    print(shared_fetcher().report())
+
+if __name__ == "__main__":
+    update_similar(full='--full' in sys.argv)